@@ -7,10 +7,12 @@ and fetching products within a specific aisle.
 
 Dependencies:
 - Database: Handles database interactions.
+- ProductCatalog: Cached product lookups for listing aisle contents.
 - Utils (generate_id): Generates unique identifiers for new aisles.
 """
 
 from database import Database
+from catalog import ProductCatalog
 from utils import generate_id, safe_input
 
 
@@ -20,11 +22,13 @@ class Aisle:
 
     Attributes:
         db (Database): Instance of the Database class to interact with the database.
+        catalog (ProductCatalog): Shared in-memory product catalog.
     """
 
     def __init__(self):
         """Initialize the Aisle class with a database connection."""
         self.db = Database()
+        self.catalog = ProductCatalog.for_database(self.db)
 
     def aisle_exists(self, name):
         """
@@ -136,10 +140,9 @@ class Aisle:
             print("❌ Aisle name must be a non-empty string.")
             return []
 
-        # Query to get products in the aisle
-        query = "SELECT name, price FROM inventory WHERE aisle_name = ?"
+        # Products in the aisle, served from the catalog cache
         try:
-            result = self.db.fetch_query(query, (aisle_name,))
+            result = self.catalog.products_in_aisle(aisle_name)
         except Exception as e:
             print(f"❌ Error fetching products for aisle '{aisle_name}': {e}")
             return []
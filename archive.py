@@ -0,0 +1,263 @@
+"""
+Sales Archive Module
+
+This module keeps the sales table small. Checkout, refunds and the daily
+reports only ever need recent sales (refunds are accepted for 7 days), so
+sales older than a configurable window are moved, with their sale_lines and
+the refund_lines recorded against those lines, into a separate archive database (sales_archive.db next to the main database).
+The hot tables then stay proportional to the window instead of growing with
+all history.
+
+The daily rollup tables (migration 6) are not touched by archiving, so report
+insights still cover all history. Code that needs the raw rows of all history
+uses SalesArchive.history(), which ATTACHes the archive and exposes the union
+of hot and archived rows as temporary views.
+
+Rows are copied into the archive before they are deleted from the hot
+tables, and ids are never reused (AUTOINCREMENT), so an interrupted run leaves
+at worst a row in both databases; the history views and the next run both
+handle that.
+
+Usage:
+    python archive.py --days 30                 # move sales older than 30 days
+    python archive.py --days 30 --dry-run       # only count them
+
+Dependencies:
+- Database: Handles database interactions.
+"""
+
+import argparse
+import os
+from contextlib import contextmanager
+
+DEFAULT_HOT_DAYS = 30
+# Checkout.refund only accepts sales from the last 7 days; the hot window must cover it.
+REFUND_WINDOW_DAYS = 7
+ARCHIVE_FILE = "sales_archive.db"
+# Sales moved per transaction, so an archive run never holds the write lock for long.
+ARCHIVE_CHUNK_SIZE = 5000
+
+SALES_COLUMNS = ("id, employee_id, customer_id, items, quantity, tax, discount, total, date, "
+                 "membership, reference_number, payment_method, remarks")
+SALE_LINES_COLUMNS = "id, sale_id, product_id, product_name, quantity, unit_price"
+REFUND_LINES_COLUMNS = "id, sale_line_id, refund_sale_id, quantity, unit_price, created_at"
+
+ARCHIVE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS archive.sales (
+        id INTEGER PRIMARY KEY,
+        employee_id INTEGER,
+        customer_id INTEGER,
+        items TEXT,
+        quantity INTEGER,
+        tax REAL NOT NULL,
+        discount REAL NOT NULL,
+        total REAL NOT NULL,
+        date TIMESTAMP,
+        membership TEXT,
+        reference_number TEXT,
+        payment_method TEXT,
+        remarks TEXT DEFAULT ''
+    )""",
+    """CREATE TABLE IF NOT EXISTS archive.sale_lines (
+        id INTEGER PRIMARY KEY,
+        sale_id INTEGER NOT NULL,
+        product_id TEXT,
+        product_name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        unit_price REAL NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS archive.refund_lines (
+        id INTEGER PRIMARY KEY,
+        sale_line_id INTEGER NOT NULL,
+        refund_sale_id INTEGER,
+        quantity INTEGER NOT NULL,
+        unit_price REAL NOT NULL,
+        created_at TIMESTAMP
+    )""",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_sales_date ON sales (date)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_sales_reference_number ON sales (reference_number)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_sale_lines_sale_id ON sale_lines (sale_id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_archive_refund_lines_sale_line_id ON refund_lines (sale_line_id)",
+]
+
+
+class SalesArchive:
+    """
+    Moves old sales to the archive database and reads full history across both.
+
+    Attributes:
+        db (Database): The main (hot) database.
+        archive_name (str): Path of the archive database file.
+        hot_days (int): Sales newer than this many days stay in the hot tables.
+    """
+
+    def __init__(self, db, archive_name=None, hot_days=DEFAULT_HOT_DAYS):
+        if hot_days < REFUND_WINDOW_DAYS:
+            raise ValueError(f"hot_days must be at least the {REFUND_WINDOW_DAYS}-day refund window")
+        self.db = db
+        self.archive_name = archive_name or os.path.join(os.path.dirname(os.path.abspath(db.db_name)), ARCHIVE_FILE)
+        self.hot_days = hot_days
+
+    @contextmanager
+    def attached(self):
+        """ATTACH the archive database as schema "archive" on this thread's connection."""
+        if self.db.in_transaction():
+            raise RuntimeError("The archive cannot be attached inside a transaction")
+        conn = self.db.conn
+        conn.execute("ATTACH DATABASE ? AS archive", (self.archive_name,))
+        try:
+            yield conn
+        finally:
+            conn.execute("DETACH DATABASE archive")
+
+    def _cutoff_ids(self):
+        """Ids of hot sales older than the window, oldest first."""
+        return [row[0] for row in self.db.fetch_query(
+            "SELECT id FROM sales WHERE date < datetime('now', ?) ORDER BY id",
+            (f"-{self.hot_days} days",)
+        )]
+
+    def archive(self, dry_run=False):
+        """
+        Move sales older than hot_days, their sale_lines and the refund_lines
+        against those lines, to the archive.
+
+        Returns:
+            dict: Number of sales, sale_lines and refund_lines moved (only sales
+                  are counted with dry_run).
+        """
+        sale_ids = self._cutoff_ids()
+        moved = {"sales": 0, "sale_lines": 0, "refund_lines": 0}
+        if dry_run or not sale_ids:
+            moved["sales"] = len(sale_ids)
+            return moved
+
+        with self.attached() as conn:
+            conn.execute("PRAGMA archive.journal_mode = WAL")
+            for statement in ARCHIVE_SCHEMA:
+                conn.execute(statement)
+            for start in range(0, len(sale_ids), ARCHIVE_CHUNK_SIZE):
+                chunk = sale_ids[start:start + ARCHIVE_CHUNK_SIZE]
+                placeholders = ", ".join("?" * len(chunk))
+                # Refund ledger rows belong to the original sale's lines and move with them.
+                refunds_of_chunk = (f"sale_line_id IN (SELECT id FROM main.sale_lines "
+                                    f"WHERE sale_id IN ({placeholders}))")
+                with self.db.transaction() as cursor:
+                    cursor.execute(
+                        f"INSERT OR IGNORE INTO archive.sales ({SALES_COLUMNS}) "
+                        f"SELECT {SALES_COLUMNS} FROM main.sales WHERE id IN ({placeholders})", chunk
+                    )
+                    cursor.execute(
+                        f"INSERT OR IGNORE INTO archive.sale_lines ({SALE_LINES_COLUMNS}) "
+                        f"SELECT {SALE_LINES_COLUMNS} FROM main.sale_lines WHERE sale_id IN ({placeholders})", chunk
+                    )
+                    cursor.execute(
+                        f"INSERT OR IGNORE INTO archive.refund_lines ({REFUND_LINES_COLUMNS}) "
+                        f"SELECT {REFUND_LINES_COLUMNS} FROM main.refund_lines WHERE {refunds_of_chunk}", chunk
+                    )
+                    moved["refund_lines"] += cursor.execute(
+                        f"DELETE FROM main.refund_lines WHERE {refunds_of_chunk}", chunk
+                    ).rowcount
+                    moved["sale_lines"] += cursor.execute(
+                        f"DELETE FROM main.sale_lines WHERE sale_id IN ({placeholders})", chunk
+                    ).rowcount
+                    moved["sales"] += cursor.execute(
+                        f"DELETE FROM main.sales WHERE id IN ({placeholders})", chunk
+                    ).rowcount
+        return moved
+
+    @contextmanager
+    def history(self):
+        """
+        Expose all sales, hot and archived, for the duration of the block.
+
+        Yields:
+            tuple: (sales_table, sale_lines_table, refund_lines_table) names to
+                   query. These are the temporary views history_sales,
+                   history_sale_lines and history_refund_lines when an archive
+                   exists, else the plain hot tables.
+        """
+        if not os.path.exists(self.archive_name):
+            yield "sales", "sale_lines", "refund_lines"
+            return
+        with self.attached() as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM archive.sqlite_master WHERE type = 'table'")}
+            if not {"sales", "sale_lines"} <= tables:
+                yield "sales", "sale_lines", "refund_lines"
+                return
+            # Archives written before the refund ledger existed have no refund_lines table.
+            archived_refunds = (f"UNION ALL SELECT {REFUND_LINES_COLUMNS} FROM archive.refund_lines "
+                                "WHERE id NOT IN (SELECT id FROM main.refund_lines)"
+                                if "refund_lines" in tables else "")
+            try:
+                conn.execute(
+                    f"CREATE TEMP VIEW history_sales AS SELECT {SALES_COLUMNS} FROM main.sales "
+                    f"UNION ALL SELECT {SALES_COLUMNS} FROM archive.sales "
+                    "WHERE id NOT IN (SELECT id FROM main.sales)"
+                )
+                conn.execute(
+                    f"CREATE TEMP VIEW history_sale_lines AS SELECT {SALE_LINES_COLUMNS} FROM main.sale_lines "
+                    f"UNION ALL SELECT {SALE_LINES_COLUMNS} FROM archive.sale_lines "
+                    "WHERE id NOT IN (SELECT id FROM main.sale_lines)"
+                )
+                conn.execute(
+                    f"CREATE TEMP VIEW history_refund_lines AS SELECT {REFUND_LINES_COLUMNS} FROM main.refund_lines "
+                    + archived_refunds
+                )
+                yield "history_sales", "history_sale_lines", "history_refund_lines"
+            finally:
+                # A failed CREATE must not leave views behind on the pooled connection.
+                conn.execute("DROP VIEW IF EXISTS temp.history_sales")
+                conn.execute("DROP VIEW IF EXISTS temp.history_sale_lines")
+                conn.execute("DROP VIEW IF EXISTS temp.history_refund_lines")
+
+    def stats(self):
+        """Row counts in the hot tables and, if it exists, the archive."""
+        counts = {
+            "hot_sales": self.db.fetch_query("SELECT COUNT(*) FROM sales")[0][0],
+            "hot_sale_lines": self.db.fetch_query("SELECT COUNT(*) FROM sale_lines")[0][0],
+            "hot_refund_lines": self.db.fetch_query("SELECT COUNT(*) FROM refund_lines")[0][0],
+            "archived_sales": 0,
+            "archived_sale_lines": 0,
+            "archived_refund_lines": 0,
+        }
+        with self.history() as (sales_table, _, refund_lines_table):
+            if sales_table != "sales":
+                counts["archived_sales"] = self.db.fetch_query("SELECT COUNT(*) FROM archive.sales")[0][0]
+                counts["archived_sale_lines"] = self.db.fetch_query("SELECT COUNT(*) FROM archive.sale_lines")[0][0]
+                counts["archived_refund_lines"] = self.db.fetch_query(
+                    f"SELECT COUNT(*) FROM {refund_lines_table}")[0][0] - counts["hot_refund_lines"]
+        return counts
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Move old sales to the archive database.")
+    parser.add_argument("--db", default="supermarket.db", help="Database file (default: supermarket.db)")
+    parser.add_argument("--archive", help=f"Archive database file (default: {ARCHIVE_FILE} next to --db)")
+    parser.add_argument("--days", type=int, default=DEFAULT_HOT_DAYS,
+                        help=f"Keep sales from the last N days in the hot tables (default: {DEFAULT_HOT_DAYS})")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the sales that would be moved")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    try:
+        archive = SalesArchive(db, args.archive, args.days)
+    except ValueError as e:
+        print(f" Error: {e}")
+        db.shutdown()
+        return
+    moved = archive.archive(dry_run=args.dry_run)
+    if args.dry_run:
+        print(f" {moved['sales']} sales are older than {args.days} days.")
+    else:
+        print(f" Archived {moved['sales']} sales, {moved['sale_lines']} sale lines and "
+              f"{moved['refund_lines']} refund lines to {archive.archive_name}.")
+    stats = archive.stats()
+    print(f" Hot: {stats['hot_sales']} sales. Archive: {stats['archived_sales']} sales.")
+    db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
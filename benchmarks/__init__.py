@@ -0,0 +1,6 @@
+"""
+Benchmarks and stress checks for the supermarket system.
+
+Each module runs against its own temporary database and can be run from the
+repository root, e.g. `python -m benchmarks.stress_lanes`.
+"""
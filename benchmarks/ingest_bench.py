@@ -0,0 +1,80 @@
+"""
+Parallel workbook ingestion benchmark.
+
+Generates a set of supplier-style workbooks (inventory, aisles, customers and
+employees sheets) in a temporary directory and times
+XLSDatabaseLoader.load_files on a fresh database for each worker count.
+Wall-clock time should fall as workers are added, up to the number of cores
+or sheets, whichever is smaller.
+
+Usage:
+    python -m benchmarks.ingest_bench --files 12 --rows 20000 --workers 1,2,4,8
+"""
+
+import argparse
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+from database import Database
+from xlsreader import XLSDatabaseLoader
+
+
+def write_workbook(path, file_index, rows):
+    """Write one workbook whose ids are unique to file_index."""
+    workbook = Workbook(write_only=True)
+    aisles = workbook.create_sheet("aisles")
+    aisles.append(["id", "name", "product_name"])
+    aisles.append([f"A{file_index:03d}", f"Aisle {file_index}", ""])
+    inventory = workbook.create_sheet("inventory")
+    inventory.append(["id", "name", "category", "quantity", "price", "aisle_name"])
+    customers = workbook.create_sheet("customers")
+    customers.append(["id", "name", "phone", "membership"])
+    employees = workbook.create_sheet("employees")
+    employees.append(["id", "name", "role", "password"])
+    for i in range(rows):
+        key = f"{file_index:03d}{i:07d}"
+        inventory.append([f"P{key}", f"Product {key}", "Bulk", i % 500, round(0.5 + i % 100 * 0.1, 2),
+                          f"Aisle {file_index}"])
+        customers.append([f"C{key}", f"Customer {key}", f"555{i:07d}", "Gold" if i % 3 else None])
+        if i % 10 == 0:
+            employees.append([f"E{key}", f"Employee {key}", "Employee", "secret"])
+    workbook.save(path)
+
+
+def run_bench(files, rows, worker_counts):
+    """Return (workers, seconds, rows loaded) for each worker count."""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "incoming")
+        os.makedirs(data_dir)
+        for file_index in range(files):
+            write_workbook(os.path.join(data_dir, f"supplier_{file_index:03d}.xlsx"), file_index, rows)
+        for workers in worker_counts:
+            db = Database(os.path.join(tmp, f"ingest_{workers}.db"))
+            loader = XLSDatabaseLoader(db.db_name)
+            summary = loader.load_files(data_dir, workers=workers)
+            results.append((workers, summary["elapsed_seconds"], summary["rows"]))
+            db.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time parallel workbook ingestion.")
+    parser.add_argument("--files", type=int, default=12)
+    parser.add_argument("--rows", type=int, default=20000, help="Inventory and customer rows per workbook")
+    parser.add_argument("--workers", default=f"1,2,4,{os.cpu_count() or 1}",
+                        help="Comma-separated worker counts (default: 1,2,4,<cores>)")
+    args = parser.parse_args()
+
+    worker_counts = sorted({int(count) for count in args.workers.split(",")})
+    results = run_bench(args.files, args.rows, worker_counts)
+    baseline = results[0][1]
+    print(f" {'workers':>7} {'seconds':>8} {'rows/sec':>10} {'speedup':>8}")
+    for workers, seconds, rows in results:
+        print(f" {workers:>7} {seconds:>8.2f} {rows / seconds:>10.0f} {baseline / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+Regression checks.
+
+Small end-to-end scenarios for bugs that were fixed. Each check runs in its
+own process against a fresh supermarket.db in its own temporary directory,
+so classes that open the default database file see it too and process-wide
+caches and metrics start empty. A check returns a list of failure
+messages; an empty list means it passed.
+
+Usage:
+    python -m benchmarks.regression_checks [--only report_product_names,...]
+
+Exits with status 1 if any check fails.
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from queue import Empty
+
+from database import Database
+
+# Product names that the legacy "name:qty:price, ..." items format cannot represent.
+AWKWARD_PRODUCTS = [("P000001", "Cheese, Cheddar", 4.50), ("P000002", "Milk: 2%", 1.25), ("P000003", "Bread", 2.00)]
+
+
+def seed_products(db, products=AWKWARD_PRODUCTS, stock=100):
+    """Create one aisle holding the given (id, name, price) products."""
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO aisles (id, name, product_name) VALUES ('A000001', 'Deli', '')")
+        cursor.executemany(
+            "INSERT INTO inventory (id, name, category, quantity, price, aisle_name) "
+            "VALUES (?, ?, 'Deli', ?, ?, 'Deli')",
+            [(product_id, name, stock, price) for product_id, name, price in products]
+        )
+
+
+def check_report_product_names(db):
+    """Top Products agrees between the rollup and single-pass reports for names with ',' and ':'."""
+    from checkout import Checkout
+    from generate_report import SalesReportGenerator
+
+    seed_products(db)
+    checkout = Checkout(db.db_name)
+    for quantities in ((2, 3, 1), (1, 1, 0)):
+        items = [{"name": name, "quantity": quantity}
+                 for (_, name, _), quantity in zip(AWKWARD_PRODUCTS, quantities) if quantity]
+        checkout.checkout_order({"items": items})
+    expected = {"Cheese, Cheddar": 3, "Milk: 2%": 4, "Bread": 1}
+
+    failures = []
+    for use_rollups in (True, False):
+        report = SalesReportGenerator(db, use_rollups=use_rollups).build_report()
+        products = dict(report["Top Products"].itertuples(index=False, name=None))
+        if products != expected:
+            failures.append(f"Top Products with use_rollups={use_rollups}: {products}, expected {expected}")
+    return failures
+
+
+def check_replay_with_group_commit(db):
+    """Order replay batches still commit when the checkout has a group-commit writer."""
+    from checkout import Checkout
+    from order_replay import OrderReplayer
+    from writer import GroupCommitWriter
+
+    seed_products(db)
+    orders = [{"order_id": i, "items": [{"name": "Bread", "quantity": 1}]} for i in range(10)]
+    writer = GroupCommitWriter(db.db_name)
+    try:
+        started = time.perf_counter()
+        summary = OrderReplayer(checkout=Checkout(db.db_name, writer=writer), batch_size=5).replay(orders)
+        elapsed = time.perf_counter() - started
+    finally:
+        writer.close()
+
+    failures = []
+    if summary["succeeded"] != len(orders):
+        errors = {result.get("error") for result in summary["results"] if result["status"] != "ok"}
+        failures.append(f"{summary['succeeded']} of {len(orders)} orders succeeded: {errors}")
+    sales = db.fetch_query("SELECT COUNT(*) FROM sales")[0][0]
+    if sales != summary["succeeded"]:
+        failures.append(f"{sales} sales recorded for {summary['succeeded']} successful orders")
+    if elapsed > 2:
+        failures.append(f"replay took {elapsed:.1f}s; batches are waiting on the writer")
+    return failures
+
+
+def check_duplicate_product_name(db):
+    """Adding a product under an existing name fails cleanly and changes nothing."""
+    import builtins
+
+    from inventory import Inventory, PRODUCTS_ADDED
+
+    seed_products(db)
+    answers = iter(["Bread", "Bakery", "5", "1.50", "Deli"])
+    original_input = builtins.input
+    builtins.input = lambda prompt="": next(answers)
+    added_before = PRODUCTS_ADDED.value()
+    try:
+        added = Inventory().add_product("Manager")
+    finally:
+        builtins.input = original_input
+
+    failures = []
+    if added is not False:
+        failures.append(f"add_product returned {added!r} for a duplicate name")
+    rows = db.fetch_query("SELECT COUNT(*) FROM inventory WHERE name = 'Bread'")[0][0]
+    if rows != 1:
+        failures.append(f"{rows} products named 'Bread'")
+    aisle_products = db.fetch_query("SELECT product_name FROM aisles WHERE name = 'Deli'")[0][0]
+    if "Bread" in (aisle_products or ""):
+        failures.append(f"aisle product list changed to {aisle_products!r}")
+    if PRODUCTS_ADDED.value() != added_before:
+        failures.append("supermarket_products_added_total was incremented")
+    return failures
+
+
+def check_archive_refund_lines(db):
+    """Archiving moves the refund ledger with its sale lines and history still sees all of it."""
+    from archive import SalesArchive
+
+    seed_products(db)
+    with db.transaction() as cursor:
+        for sale_id, age in ((1, "-60 days"), (2, "-1 days")):
+            cursor.execute(
+                "INSERT INTO sales (id, quantity, tax, discount, total, date, reference_number, payment_method) "
+                "VALUES (?, 2, 0, 0, 4.0, datetime('now', ?), ?, 'cash')", (sale_id, age, f"REF{sale_id}")
+            )
+            cursor.execute(
+                "INSERT INTO sale_lines (id, sale_id, product_id, product_name, quantity, unit_price) "
+                "VALUES (?, ?, 'P000003', 'Bread', 2, 2.0)", (sale_id, sale_id)
+            )
+            cursor.execute(
+                "INSERT INTO refund_lines (sale_line_id, quantity, unit_price) VALUES (?, 1, 2.0)", (sale_id,)
+            )
+
+    archive = SalesArchive(db)
+    moved = archive.archive()
+    failures = []
+    if moved != {"sales": 1, "sale_lines": 1, "refund_lines": 1}:
+        failures.append(f"archive() moved {moved}")
+    hot = db.fetch_query("SELECT sale_line_id FROM refund_lines")
+    if hot != [(2,)]:
+        failures.append(f"hot refund_lines left for sale lines {hot}, expected [(2,)]")
+    with archive.history() as (_, _, refund_lines_table):
+        history = db.fetch_query(f"SELECT sale_line_id FROM {refund_lines_table} ORDER BY sale_line_id")
+    if history != [(1,), (2,)]:
+        failures.append(f"{refund_lines_table} holds sale lines {history}, expected [(1,), (2,)]")
+    stats = archive.stats()
+    if (stats["hot_refund_lines"], stats["archived_refund_lines"]) != (1, 1):
+        failures.append(f"stats() reports {stats}")
+    return failures
+
+
+def check_history_recovers_from_failed_view(db):
+    """A history() call that fails while creating its views does not break later calls."""
+    from archive import SalesArchive
+
+    seed_products(db)
+    db.execute_query(
+        "INSERT INTO sales (id, quantity, tax, discount, total, date, reference_number, payment_method) "
+        "VALUES (1, 1, 0, 0, 2.0, datetime('now', '-60 days'), 'REF1', 'cash')"
+    )
+    archive = SalesArchive(db)
+    archive.archive()
+
+    # A clashing temp table makes the last CREATE TEMP VIEW fail after the first two succeeded.
+    db.conn.execute("CREATE TEMP TABLE history_refund_lines (id INTEGER)")
+    try:
+        with archive.history():
+            pass
+    except Exception:
+        pass
+    db.conn.execute("DROP TABLE temp.history_refund_lines")
+
+    failures = []
+    try:
+        with archive.history() as (sales_table, _, _):
+            sales = db.fetch_query(f"SELECT COUNT(*) FROM {sales_table}")[0][0]
+        if sales != 1:
+            failures.append(f"{sales_table} holds {sales} sales, expected 1")
+    except Exception as e:
+        failures.append(f"history() after a failed call raised {type(e).__name__}: {e}")
+    return failures
+
+
+def check_process_payment_prices_once(db):
+    """An interactive checkout prices (catalog lookup and stock query) its cart only once."""
+    from checkout import Checkout
+
+    seed_products(db)
+    checkout = Checkout(db.db_name)
+    priced = []
+    price_carts = checkout.price_carts
+    checkout.price_carts = lambda carts: priced.append(len(carts)) or price_carts(carts)
+    ok = checkout.process_payment(None, "ANON0001", [{"name": "Bread", "quantity": 2}], "cash", "Anonymous")
+
+    failures = []
+    if not ok:
+        failures.append("process_payment failed")
+    if len(priced) != 1:
+        failures.append(f"the cart was priced {len(priced)} times")
+    return failures
+
+
+def check_metrics_count_committed_work(db):
+    """Sales in a rolled-back replay batch and restocks of unknown products are not counted."""
+    import builtins
+
+    from checkout import Checkout, SALES
+    from inventory import Inventory, RESTOCKED_UNITS
+    from order_replay import OrderReplayer
+
+    seed_products(db)
+    orders = [{"order_id": i, "items": [{"name": "Bread", "quantity": 1}]} for i in range(10)]
+    checkout = Checkout(db.db_name)
+    checkout_order = checkout.checkout_order
+
+    def failing_checkout_order(order, *args):
+        if order["order_id"] == 7:
+            raise RuntimeError("lane went offline")
+        return checkout_order(order, *args)
+
+    checkout.checkout_order = failing_checkout_order
+    summary = OrderReplayer(checkout=checkout, batch_size=5).replay(orders)
+
+    failures = []
+    sales = db.fetch_query("SELECT COUNT(*) FROM sales")[0][0]
+    if (summary["succeeded"], sales) != (5, 5):
+        failures.append(f"{summary['succeeded']} orders succeeded and {sales} sales recorded, expected 5 and 5")
+    if SALES.value() != sales:
+        failures.append(f"supermarket_sales_total is {SALES.value()} for {sales} recorded sales")
+
+    answers = iter(["P999999", "7", "P000003", "10"])
+    original_input = builtins.input
+    builtins.input = lambda prompt="": next(answers)
+    try:
+        Inventory().update_stock()
+    finally:
+        builtins.input = original_input
+    if RESTOCKED_UNITS.value() != 10:
+        failures.append(f"supermarket_restocked_units_total is {RESTOCKED_UNITS.value()}, expected 10")
+    return failures
+
+
+def check_order_quantities_validated(db):
+    """Headless orders with a negative, zero or non-integer quantity are rejected and change nothing."""
+    from checkout import Checkout
+
+    seed_products(db, stock=10)
+    checkout = Checkout(db.db_name)
+    failures = []
+    for quantity in (-5, 0, "2", 1.5, True):
+        result = checkout.checkout_order({"items": [{"name": "Bread", "quantity": quantity}]})
+        reasons = [problem["reason"] for problem in result["problems"]]
+        if result["status"] != "rejected" or reasons != ["invalid_quantity"]:
+            failures.append(f"quantity {quantity!r}: status {result['status']}, problems {reasons}")
+    result = checkout.checkout_order({"items": [{"quantity": 1}]})
+    if result["status"] != "rejected" or [problem["reason"] for problem in result["problems"]] != ["invalid_item"]:
+        failures.append(f"line without a name: status {result['status']}, problems {result['problems']}")
+
+    stock = db.fetch_query("SELECT quantity FROM inventory WHERE name = 'Bread'")[0][0]
+    if stock != 10:
+        failures.append(f"Bread stock is {stock}, expected 10")
+    sales = db.fetch_query("SELECT COUNT(*) FROM sales")[0][0]
+    if sales:
+        failures.append(f"{sales} sales recorded for invalid orders")
+    return failures
+
+
+def check_replay_rejects_bad_orders(db):
+    """A malformed order is rejected on its own; the rest of its batch is still recorded."""
+    from checkout import Checkout
+    from order_replay import OrderReplayer
+
+    seed_products(db)
+    orders = [{"order_id": i, "items": [{"name": "Bread", "quantity": 1}]} for i in range(4)]
+    orders.insert(2, {"order_id": "bad", "items": [{"name": "Bread", "quantity": "2"}]})
+    summary = OrderReplayer(checkout=Checkout(db.db_name), batch_size=10).replay(orders)
+
+    failures = []
+    statuses = {result["order_id"]: result["status"] for result in summary["results"]}
+    expected = {0: "ok", 1: "ok", "bad": "rejected", 2: "ok", 3: "ok"}
+    if statuses != expected:
+        failures.append(f"order statuses {statuses}, expected {expected}")
+    sales = db.fetch_query("SELECT COUNT(*) FROM sales")[0][0]
+    if sales != 4:
+        failures.append(f"{sales} sales recorded, expected 4")
+    return failures
+
+
+def check_order_files_skip_bad_records(db):
+    """Order files with an unreadable record skip that record and replay the rest."""
+    from order_replay import read_orders
+
+    with open("orders.jsonl", "w", encoding="utf-8") as f:
+        f.write('{"order_id": 1, "items": []}\n{"order_id": 2, "items": [\n[3]\n{"order_id": 4, "items": []}\n')
+    with open("orders.csv", "w", encoding="utf-8") as f:
+        f.write("order_id,product,quantity\n1,Bread,1\n2,Bread,1\n2,Milk,two\n3,Bread,1\n")
+
+    failures = []
+    for path, expected_orders, expected_lines in (("orders.jsonl", [1, 4], [2, 3]),
+                                                  ("orders.csv", ["1", "3"], [4])):
+        skipped = []
+        orders = [order["order_id"] for order in read_orders(path, skipped)]
+        if orders != expected_orders:
+            failures.append(f"{path}: read orders {orders}, expected {expected_orders}")
+        lines = [line_number for line_number, _ in skipped]
+        if lines != expected_lines:
+            failures.append(f"{path}: skipped lines {lines}, expected {expected_lines}")
+    return failures
+
+
+CHECKS = {
+    "report_product_names": check_report_product_names,
+    "replay_with_group_commit": check_replay_with_group_commit,
+    "duplicate_product_name": check_duplicate_product_name,
+    "archive_refund_lines": check_archive_refund_lines,
+    "history_recovers_from_failed_view": check_history_recovers_from_failed_view,
+    "process_payment_prices_once": check_process_payment_prices_once,
+    "metrics_count_committed_work": check_metrics_count_committed_work,
+    "order_quantities_validated": check_order_quantities_validated,
+    "replay_rejects_bad_orders": check_replay_rejects_bad_orders,
+    "order_files_skip_bad_records": check_order_files_skip_bad_records,
+}
+
+
+def _run_check(name, directory, results):
+    """Run one check in directory (in a child process) and put (name, failures) on results."""
+    os.chdir(directory)
+    db = Database("supermarket.db")
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            failures = CHECKS[name](db)
+    except Exception as e:
+        failures = [f"raised {type(e).__name__}: {e}"]
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.shutdown()
+    results.put((name, failures))
+
+
+def run_checks(names=None):
+    """
+    Run the named checks (default: all), each in its own process and directory.
+
+    Returns:
+        dict: Maps each check name to its list of failures.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names or CHECKS:
+            check_directory = os.path.join(directory, name)
+            os.makedirs(check_directory)
+            check_results = context.Queue()
+            process = context.Process(target=_run_check, args=(name, check_directory, check_results))
+            process.start()
+            process.join()
+            try:
+                results[name] = check_results.get(timeout=1)[1]
+            except Empty:
+                results[name] = [f"exited with status {process.exitcode}"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the regression checks.")
+    parser.add_argument("--only", help="Comma-separated checks to run (default: all)")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else None
+    unknown = [name for name in names or [] if name not in CHECKS]
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)} (choose from {', '.join(CHECKS)})")
+
+    results = run_checks(names)
+    failed = False
+    for name, failures in results.items():
+        print(f" {'FAIL' if failures else 'ok  '} {name}")
+        for failure in failures:
+            print(f"      {failure}")
+        failed = failed or bool(failures)
+    if failed:
+        sys.exit(1)
+    print(" OK: all regression checks passed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Report computation benchmark.
+
+Fills a temporary database with N synthetic sales (1-4 lines each, spread
+over the last 90 days) and times SalesReportGenerator.build_report in both
+modes:
+- single-pass: sales fetched once, sheets derived with date masks and
+  vectorised item parsing;
+- rollups: insights read from the daily rollup tables, raw rows only for the
+  Today/Weekly sheets.
+
+Excel writing is not timed; it is measured by the streaming writer benchmark.
+
+Usage:
+    python -m benchmarks.report_bench --sizes 10000,100000,1000000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from database import Database
+from generate_report import SalesReportGenerator
+
+PRODUCTS = [(f"P{i:03d}", f"Product {i}", round(0.5 + i * 0.25, 2)) for i in range(200)]
+EMPLOYEES = [f"E{i:03d}" for i in range(25)]
+DAYS = 90
+CHUNK = 10000
+
+
+def fill_sales(db, count, seed=11, days=DAYS):
+    """Insert count synthetic sales with their sale_lines over the last days days, in chunks."""
+    rng = random.Random(seed)
+    next_sale_id = 1
+    with db.transaction() as cursor:
+        while next_sale_id <= count:
+            sales, lines = [], []
+            for sale_id in range(next_sale_id, min(next_sale_id + CHUNK, count + 1)):
+                cart = [(rng.choice(PRODUCTS), rng.randint(1, 5)) for _ in range(rng.randint(1, 4))]
+                subtotal = sum(price * quantity for (_, _, price), quantity in cart)
+                age = rng.random() * days
+                sales.append((sale_id, rng.choice(EMPLOYEES), sum(quantity for _, quantity in cart),
+                              round(subtotal * 0.13, 2), round(subtotal * 1.13, 2),
+                              f"-{age:.6f} days", f"R{sale_id:09d}"))
+                lines.extend((sale_id, product_id, name, quantity, price)
+                             for (product_id, name, price), quantity in cart)
+            cursor.executemany(
+                "INSERT INTO sales (id, employee_id, quantity, tax, discount, total, date, reference_number, "
+                "payment_method) VALUES (?, ?, ?, ?, 0, ?, datetime('now', ?), ?, 'cash')",
+                sales
+            )
+            cursor.executemany(
+                "INSERT INTO sale_lines (sale_id, product_id, product_name, quantity, unit_price) "
+                "VALUES (?, ?, ?, ?, ?)",
+                lines
+            )
+            next_sale_id += CHUNK
+
+
+def time_build(db, use_rollups):
+    started = time.perf_counter()
+    sheets = SalesReportGenerator(db, use_rollups=use_rollups).build_report()
+    return time.perf_counter() - started, sheets
+
+
+def run_bench(sizes):
+    """Return one result dict per size with fill and build timings in seconds."""
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Database(os.path.join(tmp, "report.db"))
+            started = time.perf_counter()
+            fill_sales(db, size)
+            fill_seconds = time.perf_counter() - started
+            single_seconds, single = time_build(db, use_rollups=False)
+            rollup_seconds, rollup = time_build(db, use_rollups=True)
+            results.append({
+                "sales": size,
+                "fill_seconds": fill_seconds,
+                "single_pass_seconds": single_seconds,
+                "rollup_seconds": rollup_seconds,
+                "weekly_rows": len(single["Weekly Sales"]),
+                "totals_match": abs(single["Overall Insights"]["Overall Total Sales"][0]
+                                    - rollup["Overall Insights"]["Overall Total Sales"][0]) < 0.01,
+            })
+            db.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time report computation at several sales volumes.")
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="Comma-separated sales counts (default: 10000,100000,1000000)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    print(f" {'sales':>9} {'fill':>8} {'single-pass':>12} {'rollups':>9} {'weekly rows':>12}")
+    for result in run_bench(sizes):
+        print(f" {result['sales']:>9} {result['fill_seconds']:>7.2f}s {result['single_pass_seconds']:>11.2f}s "
+              f"{result['rollup_seconds']:>8.2f}s {result['weekly_rows']:>12}"
+              + ("" if result["totals_match"] else "  TOTALS DIFFER"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Streaming report memory check.
+
+Writes the report with SalesReportGenerator.stream_reports for a small and a
+large store, all sales within the last week so every one lands on the Weekly
+Sales sheet, and measures peak Python heap usage with tracemalloc. The check
+asserts that:
+- the peak stays under --limit-mb for both sizes,
+- the large store's peak is not meaningfully higher than the small one's
+  (memory does not grow with sales volume).
+
+Usage:
+    python -m benchmarks.report_memory --small 10000 --large 50000 --limit-mb 32 [--compare]
+
+--compare also measures the in-memory pandas writer for reference (slow under
+tracemalloc; its peak grows with the number of sales).
+Exits with status 1 if any check fails.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from benchmarks.report_bench import fill_sales
+from database import Database
+from generate_report import SalesReportGenerator
+
+# Allowed growth of the large store's peak over the small one's.
+GROWTH_SLACK = 1.5
+
+
+def peak_report_memory(sales, streaming=True):
+    """Fill a temporary store with sales and return the peak traced bytes while writing its report."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "memory.db"))
+        fill_sales(db, sales, days=7)
+        generator = SalesReportGenerator(db)
+        output_file = os.path.join(tmp, "report.xlsx")
+        tracemalloc.start()
+        try:
+            generator.generate_reports(output_file, streaming=streaming)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        db.shutdown()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the streaming report runs in bounded memory.")
+    parser.add_argument("--small", type=int, default=10000, help="Sales in the small store")
+    parser.add_argument("--large", type=int, default=50000, help="Sales in the large store")
+    parser.add_argument("--limit-mb", type=float, default=32.0, help="Peak traced memory allowed (MB)")
+    parser.add_argument("--compare", action="store_true", help="Also measure the in-memory writer")
+    args = parser.parse_args()
+
+    mb = 1024 * 1024
+    small_peak = peak_report_memory(args.small)
+    large_peak = peak_report_memory(args.large)
+    print(f" Streaming peak: {small_peak / mb:.1f} MB at {args.small} sales, "
+          f"{large_peak / mb:.1f} MB at {args.large} sales.")
+    if args.compare:
+        in_memory_peak = peak_report_memory(args.large, streaming=False)
+        print(f" In-memory writer peak: {in_memory_peak / mb:.1f} MB at {args.large} sales.")
+
+    failures = []
+    if max(small_peak, large_peak) > args.limit_mb * mb:
+        failures.append(f"peak {max(small_peak, large_peak) / mb:.1f} MB exceeds {args.limit_mb} MB")
+    if large_peak > small_peak * GROWTH_SLACK:
+        failures.append(f"peak grew from {small_peak / mb:.1f} MB to {large_peak / mb:.1f} MB with sales volume")
+    for failure in failures:
+        print(f" FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print(" OK: streaming report memory is bounded.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Startup time check.
+
+Imports main in a fresh interpreter under `python -X importtime`, from an
+empty temporary directory, and asserts that:
+- the total import time stays under --budget-ms (best of --runs),
+- no heavy dependency (pandas, numpy, openpyxl) is imported at startup; they
+  are loaded only when a manager loads a file or generates a report,
+- importing creates no files, i.e. no database is opened at import time.
+
+Usage:
+    python -m benchmarks.startup_time --budget-ms 300 --runs 5 [--top 10]
+
+Exits with status 1 if any check fails.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(module="main"):
+    """
+    Import a module in a new interpreter from an empty directory.
+
+    Returns:
+        tuple: (total import microseconds, {module: cumulative microseconds},
+                files created in the working directory).
+    """
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    with tempfile.TemporaryDirectory() as tmp:
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=tmp, env=env, capture_output=True, text=True, check=True
+        )
+        created = sorted(os.listdir(tmp))
+    modules = {}
+    for line in completed.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules.get(module, 0), modules, created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that main.py starts within a time budget.")
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="Import time allowed for main (ms)")
+    parser.add_argument("--runs", type=int, default=5, help="Imports to time; the best one is checked")
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list")
+    args = parser.parse_args()
+
+    runs = [measure_import() for _ in range(args.runs)]
+    total, modules, created = min(runs, key=lambda run: run[0])
+    print(f" Import of main: best {total / 1000:.1f} ms, worst {max(run[0] for run in runs) / 1000:.1f} ms "
+          f"over {args.runs} runs.")
+    top_level = {name: us for name, us in modules.items() if "." not in name and name != "main"}
+    for name, us in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"   {name:<24} {us / 1000:>8.1f} ms")
+
+    failures = []
+    if total > args.budget_ms * 1000:
+        failures.append(f"import took {total / 1000:.1f} ms, over the {args.budget_ms} ms budget")
+    heavy = [name for name in HEAVY_MODULES if name in modules]
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    if created:
+        failures.append(f"importing main created files: {', '.join(created)}")
+    for failure in failures:
+        print(f" FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print(" OK: main starts within budget with no heavy imports or I/O.")
+
+
+if __name__ == "__main__":
+    main()
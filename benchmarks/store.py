@@ -0,0 +1,134 @@
+"""
+Synthetic store generator.
+
+Builds a complete store (aisles, products, customers, employees and months
+of sales with their sale_lines) directly into a database with executemany,
+so benchmarks run against realistic volumes without going through the
+interactive menus. Everything is derived from a seed, so two stores built
+with the same parameters are identical apart from sale timestamps, which are
+relative to now.
+
+Ids follow the app's style: P000001 for products, C000001 for customers,
+E000001 for employees (E000001 is the manager) and A000001 for aisles.
+Every employee's password is EMPLOYEE_PASSWORD.
+
+Usage:
+    from benchmarks.store import SCALES, build_store
+    store = build_store(Database(path), **SCALES["small"])
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from employee import Employee
+
+SCALES = {
+    "small": {"products": 500, "aisles": 10, "customers": 1000, "employees": 20, "months": 1,
+              "sales_per_day": 100},
+    "medium": {"products": 5000, "aisles": 40, "customers": 20000, "employees": 100, "months": 6,
+               "sales_per_day": 500},
+    "large": {"products": 20000, "aisles": 100, "customers": 100000, "employees": 400, "months": 12,
+              "sales_per_day": 2000},
+}
+EMPLOYEE_PASSWORD = "secret"
+# Stock per product; high enough that benchmarks never run a product out.
+INITIAL_STOCK = 1_000_000
+CATEGORIES = ["Produce", "Dairy", "Bakery", "Frozen", "Pantry", "Household", "Drinks", "Snacks"]
+MEMBERSHIPS = ["Regular", "Regular", "Regular", "Premium"]
+DAYS_PER_MONTH = 30
+# Sales inserted per executemany() call.
+SALES_CHUNK = 10000
+
+
+def build_store(db, products, aisles, customers, employees, months, sales_per_day, seed=7):
+    """
+    Populate an empty database with a synthetic store.
+
+    Args:
+        db (Database): Target database (schema already created).
+        products, aisles, customers, employees (int): Row counts.
+        months (int): Months of sales history, ending now.
+        sales_per_day (int): Sales per day of history.
+        seed (int): Random seed.
+
+    Returns:
+        dict: products [(id, name, price, aisle)], aisles [name],
+              customers [(id, name, membership)], employees [(id, role)],
+              sales (count) and sale_lines (count).
+    """
+    rng = random.Random(seed)
+    aisle_rows = [(f"A{i:06d}", f"Aisle {i}", "") for i in range(1, aisles + 1)]
+    product_rows = [
+        (f"P{i:06d}", f"Product {i}", CATEGORIES[i % len(CATEGORIES)], INITIAL_STOCK,
+         round(rng.uniform(0.5, 25.0), 2), aisle_rows[i % aisles][1])
+        for i in range(1, products + 1)
+    ]
+    customer_rows = [
+        (f"C{i:06d}", f"Customer {i}", f"555{i:07d}", rng.choice(MEMBERSHIPS))
+        for i in range(1, customers + 1)
+    ]
+    password = Employee.hash_password(EMPLOYEE_PASSWORD)
+    employee_rows = [
+        (f"E{i:06d}", f"Employee {i}", "Manager" if i == 1 else "Employee", password)
+        for i in range(1, employees + 1)
+    ]
+
+    with db.transaction() as cursor:
+        cursor.executemany("INSERT INTO aisles (id, name, product_name) VALUES (?, ?, ?)", aisle_rows)
+        cursor.executemany(
+            "INSERT INTO inventory (id, name, category, quantity, price, aisle_name) VALUES (?, ?, ?, ?, ?, ?)",
+            product_rows
+        )
+        cursor.executemany("INSERT INTO customers (id, name, phone, membership) VALUES (?, ?, ?, ?)", customer_rows)
+        cursor.executemany("INSERT INTO employees (id, name, role, password) VALUES (?, ?, ?, ?)", employee_rows)
+
+    sales, lines = fill_store_sales(db, rng, product_rows, customer_rows, employee_rows, months, sales_per_day)
+    return {
+        "products": [(row[0], row[1], row[4], row[5]) for row in product_rows],
+        "aisles": [row[1] for row in aisle_rows],
+        "customers": [(row[0], row[1], row[3]) for row in customer_rows],
+        "employees": [(row[0], row[2]) for row in employee_rows],
+        "sales": sales,
+        "sale_lines": lines,
+    }
+
+
+def fill_store_sales(db, rng, product_rows, customer_rows, employee_rows, months, sales_per_day):
+    """Insert months of sales (1-5 lines each, a third anonymous) spread evenly up to now."""
+    days = months * DAYS_PER_MONTH
+    count = days * sales_per_day
+    now = datetime.now()
+    sale_count = line_count = 0
+    sale_id = 1
+    with db.transaction() as cursor:
+        while sale_id <= count:
+            sales, lines = [], []
+            for sale_id in range(sale_id, min(sale_id + SALES_CHUNK, count + 1)):
+                cart = [(rng.choice(product_rows), rng.randint(1, 4)) for _ in range(rng.randint(1, 5))]
+                subtotal = sum(product[4] * quantity for product, quantity in cart)
+                customer = rng.choice(customer_rows) if rng.random() > 0.33 else None
+                discount = round(subtotal * 0.03, 2) if customer and customer[3] == "Premium" else 0.0
+                tax = round((subtotal - discount) * 0.08, 2)
+                # Oldest first, so ids and dates increase together as in a live store.
+                age = timedelta(days=days * (1 - sale_id / count), seconds=rng.randint(0, 59))
+                sales.append((
+                    sale_id, rng.choice(employee_rows)[0], customer[0] if customer else None,
+                    sum(quantity for _, quantity in cart), tax, discount, round(subtotal - discount + tax, 2),
+                    (now - age).strftime("%Y-%m-%d %H:%M:%S"), customer[3] if customer else "None",
+                    f"S{sale_id:09d}", rng.choice(["cash", "card"])
+                ))
+                lines.extend((sale_id, product[0], product[1], quantity, product[4]) for product, quantity in cart)
+            cursor.executemany(
+                "INSERT INTO sales (id, employee_id, customer_id, quantity, tax, discount, total, date, membership, "
+                "reference_number, payment_method) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                sales
+            )
+            cursor.executemany(
+                "INSERT INTO sale_lines (sale_id, product_id, product_name, quantity, unit_price) "
+                "VALUES (?, ?, ?, ?, ?)",
+                lines
+            )
+            sale_count += len(sales)
+            line_count += len(lines)
+            sale_id += 1
+    return sale_count, line_count
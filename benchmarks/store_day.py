@@ -0,0 +1,340 @@
+"""
+Store day traffic simulator.
+
+Models a trading day against a synthetic store (benchmarks.store). Customers
+arrive as a Poisson process whose rate is set per hour of the day; each picks
+a basket size from a weighted distribution, is a member or anonymous, and
+pays by card or cash. A share of arrivals are refunds of an earlier sale
+instead. Customers wait in one queue for the next free lane; each lane is a
+thread with its own employee driving the real code paths:
+- members are looked up with Customer.check_customer_details,
+- baskets go through Checkout.checkout_order,
+- refunds go through the interactive Checkout.refund, with its prompts
+  answered per lane.
+
+The day is compressed by --speed (simulated seconds per real second). The
+report gives p50/p95/p99 of checkout service time (lane start to committed
+sale), of checkout latency including the time queued for a lane, and of
+refunds, plus sustained transactions per second.
+
+--find-knee runs the same traffic unpaced (every customer already queued)
+for each lane count and reports where adding lanes stops adding throughput:
+the point where SQLite write contention, not the number of tills, is the
+limit.
+
+The traffic profile can be given as JSON with any of the DEFAULT_PROFILE keys.
+
+Usage:
+    python -m benchmarks.store_day --lanes 6 --speed 600 [--hours 16-19] [--profile profile.json]
+    python -m benchmarks.store_day --find-knee 1,2,4,8,16 --orders 2000 [--group-commit]
+"""
+
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+
+from benchmarks.store import SCALES, build_store
+from benchmarks.suite import summarize
+
+DEFAULT_PROFILE = {
+    # Customers per hour, one entry per hour of the day (store open 08:00-22:00).
+    "hourly_arrivals": [0] * 8 + [120, 180, 240, 300, 420, 360, 260, 240, 300, 420, 400, 280, 160, 80] + [0] * 2,
+    # [lines in the basket, weight] pairs.
+    "basket_sizes": [[1, 15], [2, 15], [3, 12], [5, 20], [8, 18], [12, 12], [20, 8]],
+    "member_share": 0.6,
+    "card_share": 0.7,
+    "refund_rate": 0.02,
+}
+DEFAULT_SPEED = 600.0
+# Recent sales from the store's history that refund customers can bring back.
+REFUND_SEED_SALES = 500
+# Adding lanes must raise throughput by at least this much to count as scaling.
+KNEE_GAIN = 0.10
+
+_lane_script = threading.local()
+
+
+def _lane_input(prompt=""):
+    """input() replacement answering the calling lane's scripted prompts."""
+    return next(_lane_script.answers)
+
+
+def make_schedule(profile, store, rng, hours=None, rate_scale=1.0):
+    """
+    Generate a day's arrivals.
+
+    Returns:
+        list: (seconds since midnight, customer) in arrival order, where customer
+              is a dict with kind ("checkout" or "refund") and, for checkouts,
+              items, payment_method and the member's name (None if anonymous).
+    """
+    sizes, weights = zip(*profile["basket_sizes"])
+    first, last = hours or (0, 23)
+    arrivals = []
+    for hour in range(first, last + 1):
+        rate = profile["hourly_arrivals"][hour] * rate_scale
+        if rate <= 0:
+            continue
+        moment = hour * 3600.0
+        while True:
+            moment += rng.expovariate(rate / 3600.0)
+            if moment >= (hour + 1) * 3600:
+                break
+            if rng.random() < profile["refund_rate"]:
+                arrivals.append((moment, {"kind": "refund"}))
+                continue
+            size = min(rng.choices(sizes, weights)[0], len(store["products"]))
+            arrivals.append((moment, {
+                "kind": "checkout",
+                "member": rng.choice(store["customers"])[1] if rng.random() < profile["member_share"] else None,
+                "payment_method": "card" if rng.random() < profile["card_share"] else "cash",
+                "items": [{"name": product[1], "quantity": rng.randint(1, 3)}
+                          for product in rng.sample(store["products"], size)],
+            }))
+    return arrivals
+
+
+class StoreDay:
+    """
+    Lanes serving a schedule of customers against the default database.
+
+    Attributes:
+        lanes (int): Number of lanes (threads).
+        writer (GroupCommitWriter): Shared writer when group_commit is set, else None.
+    """
+
+    def __init__(self, store, lanes, group_commit=False):
+        from checkout import Checkout
+        from customer import Customer
+        from writer import GroupCommitWriter
+
+        self.store = store
+        self.lanes = lanes
+        self.writer = GroupCommitWriter() if group_commit else None
+        self.checkout = Checkout(writer=self.writer)
+        self.customer = Customer()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        # Sales a later customer may bring back: (reference number, product name, employee id).
+        self._refundable = deque(
+            (reference_number, product_name, employee_id)
+            for reference_number, product_name, employee_id in self.checkout.db.fetch_query(
+                "SELECT s.reference_number, MIN(l.product_name), s.employee_id FROM sales s "
+                "JOIN sale_lines l ON l.sale_id = s.id WHERE s.date >= datetime('now', 'localtime', '-3 days') "
+                "GROUP BY s.id ORDER BY s.id DESC LIMIT ?", (REFUND_SEED_SALES,)
+            )
+        )
+        self._timings = {"checkout_service": [], "checkout_latency": [], "refund_service": []}
+        self._outcomes = {"ok": 0, "rejected": 0, "error": 0, "refunded": 0, "refund_skipped": 0}
+        self._max_queued = 0
+
+    def _serve(self, employee_id, customer):
+        if customer["kind"] == "refund":
+            sale = None
+            with self._lock:
+                # Employees may not refund their own sales.
+                for i, candidate in enumerate(self._refundable):
+                    if candidate[2] != employee_id:
+                        sale = candidate
+                        del self._refundable[i]
+                        break
+            if sale is None:
+                return "refund_skipped"
+            _lane_script.answers = iter([sale[0], employee_id, f"{sale[1]},1", "exit"])
+            self.checkout.refund()
+            return "refunded"
+
+        customer_id, membership = None, "None"
+        if customer["member"] is not None:
+            customer_id, membership = self.customer.check_customer_details(customer["member"])
+        result = self.checkout.checkout_order({
+            "items": customer["items"], "employee_id": employee_id, "customer_id": customer_id,
+            "membership": membership or "None", "payment_method": customer["payment_method"],
+        })
+        if result["status"] == "ok":
+            with self._lock:
+                self._refundable.append((result["reference_number"], customer["items"][0]["name"], employee_id))
+        return result["status"]
+
+    def _lane(self, employee_id):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            arrived, customer = item
+            started = time.perf_counter()
+            try:
+                outcome = self._serve(employee_id, customer)
+            except Exception:
+                outcome = "error"
+            finally:
+                # Hand the connection back so lanes beyond the pool size can take a turn.
+                self.checkout.db.manager.release()
+            finished = time.perf_counter()
+            with self._lock:
+                self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+                if customer["kind"] == "refund":
+                    if outcome == "refunded":
+                        self._timings["refund_service"].append(finished - started)
+                elif outcome == "ok":
+                    self._timings["checkout_service"].append(finished - started)
+                    self._timings["checkout_latency"].append(finished - arrived)
+
+    def run(self, schedule, speed=DEFAULT_SPEED, paced=True):
+        """
+        Serve every customer in the schedule, released at their (compressed)
+        arrival times, or all at once when paced is False.
+
+        Returns:
+            dict: lanes, customers, outcome counts, elapsed_seconds,
+                  transactions_per_second, max_queued and a summarize() dict per
+                  timing (checkout_service, checkout_latency, refund_service).
+        """
+        employees = [employee_id for employee_id, _ in self.store["employees"]]
+        threads = [threading.Thread(target=self._lane, args=(employees[i % len(employees)],), name=f"lane-{i}")
+                   for i in range(self.lanes)]
+        original_input = builtins.input
+        builtins.input = _lane_input
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                for thread in threads:
+                    thread.start()
+                started = time.perf_counter()
+                opening = schedule[0][0] if schedule else 0.0
+                for moment, customer in schedule:
+                    if paced:
+                        delay = started + (moment - opening) / speed - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    self._queue.put((time.perf_counter(), customer))
+                    self._max_queued = max(self._max_queued, self._queue.qsize())
+                for _ in threads:
+                    self._queue.put(None)
+                for thread in threads:
+                    thread.join()
+                elapsed = time.perf_counter() - started
+        finally:
+            builtins.input = original_input
+            if self.writer is not None:
+                self.writer.close()
+
+        transactions = self._outcomes["ok"] + self._outcomes["refunded"]
+        report = {
+            "lanes": self.lanes,
+            "customers": len(schedule),
+            "outcomes": dict(self._outcomes),
+            "elapsed_seconds": elapsed,
+            "transactions_per_second": transactions / elapsed if elapsed > 0 else 0.0,
+            "max_queued": self._max_queued,
+        }
+        for name, durations in self._timings.items():
+            report[name] = summarize(durations) if durations else None
+        return report
+
+
+def find_knee(store, schedule, lane_counts, group_commit=False):
+    """
+    Run the schedule unpaced for each lane count.
+
+    Returns:
+        tuple: (list of run reports, the last lane count that still raised
+               throughput by KNEE_GAIN, or None if every step did).
+    """
+    runs = []
+    knee = None
+    for lanes in lane_counts:
+        runs.append(StoreDay(store, lanes, group_commit).run(schedule, paced=False))
+        if knee is None and len(runs) > 1:
+            previous, current = runs[-2], runs[-1]
+            if current["transactions_per_second"] < previous["transactions_per_second"] * (1 + KNEE_GAIN):
+                knee = previous["lanes"]
+    return runs, knee
+
+
+def print_run(report):
+    outcomes = report["outcomes"]
+    print(f" {report['lanes']} lanes, {report['customers']} customers in {report['elapsed_seconds']:.1f}s: "
+          f"{outcomes['ok']} sales, {outcomes['refunded']} refunds, {outcomes['rejected']} rejected, "
+          f"{outcomes['error']} errors; {report['transactions_per_second']:.1f} tx/sec, "
+          f"queue peaked at {report['max_queued']}.")
+    for name in ("checkout_service", "checkout_latency", "refund_service"):
+        timing = report[name]
+        if timing:
+            print(f"   {name:<18} p50 {timing['p50_ms']:>8.2f} ms  p95 {timing['p95_ms']:>8.2f} ms  "
+                  f"p99 {timing['p99_ms']:>8.2f} ms")
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Simulate a store day across checkout lanes.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Store size preset (default: small)")
+    parser.add_argument("--profile", help="JSON traffic profile overriding DEFAULT_PROFILE keys")
+    parser.add_argument("--hours", help="Simulate only these hours, e.g. 16-19 (default: the whole day)")
+    parser.add_argument("--rate-scale", type=float, default=1.0, help="Multiply every hourly arrival rate")
+    parser.add_argument("--lanes", type=int, default=4, help="Lanes for the paced day (default: 4)")
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED,
+                        help=f"Simulated seconds per real second (default: {DEFAULT_SPEED:g})")
+    parser.add_argument("--find-knee", help="Comma-separated lane counts to run unpaced instead")
+    parser.add_argument("--orders", type=int, default=2000, help="Customers per --find-knee run (default: 2000)")
+    parser.add_argument("--group-commit", action="store_true", help="Commit lane writes in groups")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    profile = dict(DEFAULT_PROFILE)
+    if args.profile:
+        with open(args.profile) as f:
+            profile.update(json.load(f))
+    if len(profile["hourly_arrivals"]) != 24:
+        parser.error("hourly_arrivals must have 24 entries")
+    hours = tuple(int(hour) for hour in args.hours.split("-")) if args.hours else None
+    output = os.path.abspath(args.output) if args.output else None
+
+    rng = random.Random(args.seed)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # Customer and the menus open the default database, so the store lives in the working directory.
+        os.chdir(workdir)
+        try:
+            db = Database()
+            store = build_store(db, seed=args.seed, **SCALES[args.scale])
+            schedule = make_schedule(profile, store, rng, hours, args.rate_scale)
+            if args.find_knee:
+                schedule = (schedule * (args.orders // max(1, len(schedule)) + 1))[:args.orders]
+                runs, knee = find_knee(store, schedule, [int(n) for n in args.find_knee.split(",")],
+                                       args.group_commit)
+                for run in runs:
+                    print_run(run)
+                if knee is None:
+                    print(" Throughput still scaled at the largest lane count.")
+                else:
+                    print(f" Write contention limits throughput beyond {knee} lanes "
+                          f"(more lanes add less than {KNEE_GAIN:.0%}).")
+                report = {"profile": profile, "runs": runs, "knee_lanes": knee}
+            else:
+                span = (schedule[-1][0] - schedule[0][0]) / 3600 if schedule else 0
+                print(f" Simulating {len(schedule)} customers over {span:.1f} store hours "
+                      f"at {args.speed:g}x on {args.lanes} lanes...")
+                run = StoreDay(store, args.lanes, args.group_commit).run(schedule, args.speed)
+                print_run(run)
+                report = {"profile": profile, "runs": [run]}
+            db.shutdown()
+        finally:
+            os.chdir(cwd)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f" Report written to {output}.")
+
+
+if __name__ == "__main__":
+    main()
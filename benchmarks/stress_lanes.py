@@ -0,0 +1,107 @@
+"""
+Multi-lane oversell stress check.
+
+N lanes hammer a handful of hot SKUs with more demand than there is stock.
+Afterwards the check verifies that:
+- no product's stock went negative,
+- for every product, starting stock = sold quantity + remaining stock,
+- the number of recorded sales equals the number of successful checkouts.
+
+Usage:
+    python -m benchmarks.stress_lanes --lanes 8 --orders 2000 --stock 300 [--partial] [--group-commit]
+
+Exits with status 1 if any check fails.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from database import Database
+from lanes import CheckoutLanes
+
+HOT_SKUS = [("H001", "Hot Apple", 1.99), ("H002", "Hot Milk", 3.49), ("H003", "Hot Bread", 2.75)]
+
+
+def seed_store(db, stock):
+    """Create one aisle holding the hot SKUs, each with the given stock."""
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO aisles (id, name, product_name) VALUES ('A001', 'Hot', '')")
+        cursor.executemany(
+            "INSERT INTO inventory (id, name, category, quantity, price, aisle_name) VALUES (?, ?, 'Hot', ?, ?, 'Hot')",
+            [(product_id, name, stock, price) for product_id, name, price in HOT_SKUS]
+        )
+
+
+def make_orders(count, seed=7):
+    """Random carts of 1-3 hot SKU lines with 1-5 units each."""
+    rng = random.Random(seed)
+    return [
+        {
+            "order_id": f"S{i}",
+            "payment_method": rng.choice(["cash", "card"]),
+            "items": [{"name": rng.choice(HOT_SKUS)[1], "quantity": rng.randint(1, 5)}
+                      for _ in range(rng.randint(1, 3))],
+        }
+        for i in range(count)
+    ]
+
+
+def run_stress(lanes, orders, stock, allow_partial=False, group_commit=False):
+    """Run the stress scenario on a temporary database; returns (summary, failures)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "stress.db"))
+        seed_store(db, stock)
+        with CheckoutLanes(lanes=lanes, db_name=db.db_name, allow_partial=allow_partial,
+                           group_commit=group_commit) as pool:
+            summary = pool.run(make_orders(orders))
+            if pool.writer is not None:
+                summary["writer"] = pool.writer.stats()
+
+        failures = []
+        remaining = dict(db.fetch_query("SELECT id, quantity FROM inventory"))
+        sold = dict(db.fetch_query("SELECT product_id, SUM(quantity) FROM sale_lines GROUP BY product_id"))
+        for product_id, _, _ in HOT_SKUS:
+            if remaining[product_id] < 0:
+                failures.append(f"{product_id} stock went negative: {remaining[product_id]}")
+            if stock != sold.get(product_id, 0) + remaining[product_id]:
+                failures.append(f"{product_id} stock not conserved: start {stock}, "
+                                f"sold {sold.get(product_id, 0)}, left {remaining[product_id]}")
+        sales = db.fetch_query("SELECT COUNT(*) FROM sales")[0][0]
+        if sales != summary["succeeded"]:
+            failures.append(f"{sales} sales recorded for {summary['succeeded']} successful checkouts")
+        summary["remaining_stock"] = remaining
+        db.shutdown()
+    return summary, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress concurrent checkout lanes on hot SKUs.")
+    parser.add_argument("--lanes", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--stock", type=int, default=300, help="Starting stock per hot SKU")
+    parser.add_argument("--partial", action="store_true", help="Partially fulfil short carts")
+    parser.add_argument("--group-commit", action="store_true", help="Commit lane writes in groups")
+    args = parser.parse_args()
+
+    summary, failures = run_stress(args.lanes, args.orders, args.stock, args.partial, args.group_commit)
+    print(f" {summary['lanes']} lanes, {summary['orders']} orders: {summary['succeeded']} succeeded, "
+          f"{summary['rejected']} rejected, {summary['failed']} failed "
+          f"({summary['orders_per_second']:.1f} orders/sec).")
+    print(f" Remaining stock: {summary['remaining_stock']}")
+    if "writer" in summary:
+        writer = summary["writer"]
+        print(f" Group commits: {writer['groups']}, batch size p50 {writer['batch_size']['p50']} "
+              f"p99 {writer['batch_size']['p99']}, commit latency p50 {writer['commit_latency']['p50'] * 1000:.1f}ms "
+              f"p99 {writer['commit_latency']['p99'] * 1000:.1f}ms")
+    for failure in failures:
+        print(f" FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print(" OK: no oversell, stock conserved.")
+
+
+if __name__ == "__main__":
+    main()
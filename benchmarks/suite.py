@@ -0,0 +1,326 @@
+"""
+Hot path benchmark suite.
+
+Builds a synthetic store (benchmarks.store) in a temporary directory and
+times the paths tills and managers hit every day:
+- Checkout.calculate_cart_total and Checkout.process_payment on random carts,
+- Checkout.refund of one item from a recent sale (prompts answered by script),
+- Customer.check_customer_details by name,
+- Aisle.display_aisles_with_products,
+- SalesReportGenerator.generate_reports,
+- XLSDatabaseLoader.load_xls_to_db of a supplier price update.
+
+Console output of the timed calls is discarded. Results are written as JSON
+(per benchmark: runs, mean, p50, p95, min and max in milliseconds, plus the
+store parameters and environment). Given a baseline file from an earlier run,
+each benchmark's p50 is compared with the baseline's, and the run fails if any
+is slower by more than --tolerance (and by at least --min-delta-ms, so
+jitter on sub-millisecond paths does not fail the run).
+
+Usage:
+    python -m benchmarks.suite --scale small --output bench.json
+    python -m benchmarks.suite --scale small --baseline bench.json [--tolerance 0.25]
+
+Exits with status 1 if a benchmark regressed against the baseline.
+"""
+
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.store import SCALES, build_store
+
+DEFAULT_ITERATIONS = 200
+DEFAULT_TOLERANCE = 0.25
+DEFAULT_MIN_DELTA_MS = 0.1
+# Untimed calls at the start of each benchmark, to warm caches and connections.
+WARMUP_CALLS = 1
+# Slow benchmarks run this many times fewer iterations (at least one).
+SLOW_DIVISOR = 50
+CART_LINES = 5
+UPDATE_ROWS = 5000
+
+
+@contextlib.contextmanager
+def scripted_input(answers):
+    """Answer input() prompts from a list instead of the terminal."""
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt="": next(answers)
+    try:
+        yield
+    finally:
+        builtins.input = original
+
+
+def timed(calls):
+    """
+    Run each zero-argument call with stdout discarded; return the durations in
+    seconds of all but the first WARMUP_CALLS.
+    """
+    durations = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for call in calls:
+            started = time.perf_counter()
+            call()
+            durations.append(time.perf_counter() - started)
+    return durations[WARMUP_CALLS:] or durations
+
+
+def summarize(durations):
+    """Return runs, mean, p50, p95, p99, min and max in milliseconds."""
+    ordered = sorted(durations)
+    ms = [d * 1000 for d in ordered]
+    return {
+        "runs": len(ms),
+        "mean_ms": sum(ms) / len(ms),
+        "p50_ms": ms[len(ms) // 2],
+        "p95_ms": ms[min(len(ms) - 1, int(len(ms) * 0.95))],
+        "p99_ms": ms[min(len(ms) - 1, int(len(ms) * 0.99))],
+        "min_ms": ms[0],
+        "max_ms": ms[-1],
+    }
+
+
+def random_cart(rng, store):
+    """A cart of CART_LINES distinct random products."""
+    return [{"name": product[1], "quantity": rng.randint(1, 3)}
+            for product in rng.sample(store["products"], CART_LINES)]
+
+
+def bench_calculate_cart_total(rng, store, iterations, workdir):
+    from checkout import Checkout
+
+    checkout = Checkout()
+    return timed(lambda cart=random_cart(rng, store): checkout.calculate_cart_total(cart)
+                 for _ in range(iterations + WARMUP_CALLS))
+
+
+def bench_process_payment(rng, store, iterations, workdir):
+    from checkout import Checkout
+
+    checkout = Checkout()
+    calls = []
+    for _ in range(iterations + WARMUP_CALLS):
+        employee_id = rng.choice(store["employees"])[0]
+        customer_id, _, membership = rng.choice(store["customers"])
+        cart = random_cart(rng, store)
+        payment_method = rng.choice(["cash", "card"])
+        calls.append(lambda e=employee_id, c=customer_id, cart=cart, p=payment_method, m=membership:
+                     checkout.process_payment(e, c, cart, p, m))
+    return timed(calls)
+
+
+def bench_refund(rng, store, iterations, workdir):
+    from checkout import Checkout
+
+    checkout = Checkout()
+    manager_id = store["employees"][0][0]
+    # Recent sales by someone other than the manager, well inside the refund window.
+    sales = checkout.db.fetch_query(
+        "SELECT s.reference_number, MIN(l.product_name) FROM sales s JOIN sale_lines l ON l.sale_id = s.id "
+        "WHERE s.date >= datetime('now', 'localtime', '-3 days') AND s.employee_id != ? "
+        "GROUP BY s.id ORDER BY s.id DESC LIMIT ?",
+        (manager_id, iterations + WARMUP_CALLS)
+    )
+
+    def refund(reference_number, product_name):
+        with scripted_input([reference_number, manager_id, f"{product_name},1", "exit"]):
+            checkout.refund()
+
+    return timed(lambda sale=sale: refund(*sale) for sale in sales)
+
+
+def bench_check_customer_details(rng, store, iterations, workdir):
+    from customer import Customer
+
+    customer = Customer()
+    return timed(lambda name=rng.choice(store["customers"])[1]: customer.check_customer_details(name)
+                 for _ in range(iterations + WARMUP_CALLS))
+
+
+def bench_display_aisles_with_products(rng, store, iterations, workdir):
+    from aisle import Aisle
+
+    aisle = Aisle()
+    return timed(aisle.display_aisles_with_products for _ in range(max(1, iterations // 10) + WARMUP_CALLS))
+
+
+def bench_generate_reports(rng, store, iterations, workdir):
+    from database import Database
+    from generate_report import SalesReportGenerator
+
+    generator = SalesReportGenerator(Database())
+    path = os.path.join(workdir, "sales_report.xlsx")
+    runs = max(1, iterations // SLOW_DIVISOR) + WARMUP_CALLS
+    return timed(lambda: generator.generate_reports(path) for _ in range(runs))
+
+
+def bench_load_xls_to_db(rng, store, iterations, workdir):
+    from openpyxl import Workbook
+    from xlsreader import XLSDatabaseLoader
+
+    path = os.path.join(workdir, "price_update.xlsx")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("inventory")
+    sheet.append(["id", "name", "price"])
+    for product_id, name, price, _ in store["products"][:UPDATE_ROWS]:
+        sheet.append([product_id, name, round(price * 1.05, 2)])
+    workbook.save(path)
+    loader = XLSDatabaseLoader()
+    runs = max(1, iterations // SLOW_DIVISOR) + WARMUP_CALLS
+    return timed(lambda: loader.load_xls_to_db(path) for _ in range(runs))
+
+
+BENCHMARKS = {
+    "calculate_cart_total": bench_calculate_cart_total,
+    "process_payment": bench_process_payment,
+    "refund": bench_refund,
+    "check_customer_details": bench_check_customer_details,
+    "display_aisles_with_products": bench_display_aisles_with_products,
+    "generate_reports": bench_generate_reports,
+    "load_xls_to_db": bench_load_xls_to_db,
+}
+
+
+def run_suite(params, iterations=DEFAULT_ITERATIONS, names=None, seed=7):
+    """
+    Build a store with params and run the named benchmarks (default: all).
+
+    The store is built as supermarket.db in a temporary working directory,
+    because the menu classes open the default database.
+
+    Returns:
+        dict: meta (store parameters, build time, environment) and results
+              (benchmark name -> summarize() dict).
+    """
+    from database import Database
+
+    names = names or list(BENCHMARKS)
+    rng = random.Random(seed)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            db = Database()
+            started = time.perf_counter()
+            store = build_store(db, seed=seed, **params)
+            build_seconds = time.perf_counter() - started
+            results = {}
+            for name in names:
+                print(f" Running {name}...")
+                results[name] = summarize(BENCHMARKS[name](rng, store, iterations, workdir))
+            db.shutdown()
+        finally:
+            os.chdir(cwd)
+    return {
+        "meta": {
+            "store": params,
+            "sales": store["sales"],
+            "sale_lines": store["sale_lines"],
+            "iterations": iterations,
+            "build_seconds": build_seconds,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "results": results,
+    }
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE, min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """
+    Compare p50 timings with a baseline report. A change counts only if it is
+    beyond tolerance and at least min_delta_ms.
+
+    Returns:
+        dict: benchmark name -> baseline_p50_ms, p50_ms, ratio and status
+              ("regressed", "improved" or "ok").
+    """
+    comparison = {}
+    for name, result in report["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before["p50_ms"]:
+            continue
+        ratio = result["p50_ms"] / before["p50_ms"]
+        if abs(result["p50_ms"] - before["p50_ms"]) < min_delta_ms:
+            status = "ok"
+        elif ratio > 1 + tolerance:
+            status = "regressed"
+        elif ratio < 1 / (1 + tolerance):
+            status = "improved"
+        else:
+            status = "ok"
+        comparison[name] = {"baseline_p50_ms": before["p50_ms"], "p50_ms": result["p50_ms"],
+                            "ratio": ratio, "status": status}
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the hot paths against a synthetic store.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Store size preset (default: small)")
+    for field in SCALES["small"]:
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, help=f"Override the preset's {field}")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS,
+                        help=f"Calls per fast benchmark (default: {DEFAULT_ITERATIONS})")
+    parser.add_argument("--only", help="Comma-separated benchmarks to run (default: all)")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--baseline", help="Compare with the JSON results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed p50 slowdown against the baseline (default: {DEFAULT_TOLERANCE})")
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help=f"Ignore p50 changes smaller than this (default: {DEFAULT_MIN_DELTA_MS} ms)")
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    for field in params:
+        if getattr(args, field) is not None:
+            params[field] = getattr(args, field)
+    names = args.only.split(",") if args.only else None
+    unknown = [name for name in names or [] if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)} (choose from {', '.join(BENCHMARKS)})")
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    report = run_suite(params, args.iterations, names)
+    print(f" Store: {report['meta']['sales']} sales built in {report['meta']['build_seconds']:.1f}s.")
+    print(f" {'benchmark':<30} {'runs':>5} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    for name, result in report["results"].items():
+        print(f" {name:<30} {result['runs']:>5} {result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+              f"{result['mean_ms']:>9.2f}")
+
+    regressed = []
+    if baseline is not None:
+        if baseline.get("meta", {}).get("store") != params:
+            print(" Warning: the baseline was measured on a different store size.")
+        report["comparison"] = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        for name, row in report["comparison"].items():
+            print(f" {name:<30} {row['baseline_p50_ms']:>9.2f} -> {row['p50_ms']:>9.2f} ms "
+                  f"({row['ratio']:.2f}x) {row['status']}")
+            if row["status"] == "regressed":
+                regressed.append(name)
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f" Results written to {output}.")
+    if regressed:
+        print(f" FAIL: slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
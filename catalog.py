@@ -0,0 +1,163 @@
+"""
+Product Catalog Module
+
+This module keeps an in-memory copy of the inventory table so pricing a cart
+or listing an aisle does not query SQLite for every product.
+
+The catalog changes a few times a day but is read on every checkout, so the
+copy is reused until the catalog actually changes:
+- Triggers on inventory (migration 5) bump catalog_version.version whenever a
+  product is added, removed, renamed, re-priced, re-categorised or moved to
+  another aisle. Stock movements from sales do not bump it.
+- Before serving a lookup the cache reads PRAGMA data_version on the calling
+  thread's connection. It only re-reads catalog_version when another connection
+  has committed since the last check.
+- Writes made on the calling thread's own connection do not change its
+  data_version, so code that edits products also calls invalidate().
+
+Cached stock levels are only a snapshot; checkout still checks stock in SQL.
+
+Dependencies:
+- Database: Handles database interactions.
+"""
+
+import threading
+
+
+class ProductCatalog:
+    """
+    Process-wide cache of the inventory table for one database.
+
+    Attributes:
+        db (Database): Instance of the Database class to interact with the database.
+    """
+    _catalogs = {}
+    _catalogs_lock = threading.Lock()
+
+    def __init__(self, db):
+        """Initialize an empty catalog; it loads on first use."""
+        self.db = db
+        self._lock = threading.Lock()
+        self._by_name = {}
+        self._by_id = {}
+        self._by_aisle = {}
+        self._version = None
+        self._data_versions = {}
+        self._invalidated = True
+        self._hits = 0
+        self._misses = 0
+        self._reloads = 0
+
+    @classmethod
+    def for_database(cls, db):
+        """Return the shared catalog for db's database file, creating it on first use."""
+        with cls._catalogs_lock:
+            catalog = cls._catalogs.get(db.db_name)
+            if catalog is None:
+                catalog = cls(db)
+                cls._catalogs[db.db_name] = catalog
+            return catalog
+
+    def invalidate(self):
+        """Force a reload before the next lookup."""
+        self._invalidated = True
+
+    def _is_stale(self):
+        """Check whether the cached copy may be out of date, as cheaply as possible."""
+        if self._invalidated:
+            return True
+        conn = self.db.conn
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if self._data_versions.get(conn) == data_version:
+            return False
+        # Something was committed by another connection; only reload if it touched the catalog.
+        self._data_versions[conn] = data_version
+        return self._read_version() != self._version
+
+    def _read_version(self):
+        row = self.db.conn.execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    def _reload(self):
+        conn = self.db.conn
+        version = self._read_version()
+        rows = conn.execute(
+            "SELECT id, name, category, price, quantity, aisle_name FROM inventory"
+        ).fetchall()
+        by_name, by_id, by_aisle = {}, {}, {}
+        for product_id, name, category, price, quantity, aisle_name in rows:
+            product = {
+                "id": product_id,
+                "name": name,
+                "category": category,
+                "price": price,
+                "quantity": quantity,
+                "aisle_name": aisle_name,
+            }
+            by_name[name] = product
+            by_id[product_id] = product
+            by_aisle.setdefault(aisle_name, []).append(product)
+        self._by_name, self._by_id, self._by_aisle = by_name, by_id, by_aisle
+        self._version = version
+        self._data_versions[conn] = conn.execute("PRAGMA data_version").fetchone()[0]
+        self._invalidated = False
+        self._reloads += 1
+
+    def _fresh(self, lookups=1):
+        """Reload if stale and count the lookups as hits or misses."""
+        # Lease the connection before taking the lock: a thread waiting on a full
+        # pool while holding the lock would block every lane that holds a connection.
+        self.db.conn
+        with self._lock:
+            if self._is_stale():
+                self._reload()
+                self._misses += lookups
+            else:
+                self._hits += lookups
+
+    def get_by_name(self, name):
+        """
+        Look up a product by name.
+
+        Returns:
+            dict: The product's id, name, category, price, quantity and aisle_name, or None.
+        """
+        self._fresh()
+        return self._by_name.get(name)
+
+    def get_by_id(self, product_id):
+        """Look up a product by id; returns the same dict as get_by_name, or None."""
+        self._fresh()
+        return self._by_id.get(product_id)
+
+    def get_many(self, names):
+        """
+        Look up several products by name with a single freshness check.
+
+        Returns:
+            dict: Maps each name to its product dict, or None if it is not in the catalog.
+        """
+        names = list(names)
+        self._fresh(len(names))
+        by_name = self._by_name
+        return {name: by_name.get(name) for name in names}
+
+    def products_in_aisle(self, aisle_name):
+        """
+        Return the products in an aisle.
+
+        Returns:
+            list: A list of (name, price) tuples.
+        """
+        self._fresh()
+        return [(product["name"], product["price"]) for product in self._by_aisle.get(aisle_name, [])]
+
+    def stats(self):
+        """Return cache hit/miss counters."""
+        return {
+            "products": len(self._by_id),
+            "hits": self._hits,
+            "misses": self._misses,
+            "reloads": self._reloads,
+            "version": self._version,
+        }
@@ -1,45 +1,190 @@
 import random
 import string
+import time
 from datetime import datetime, timedelta
 from database import Database
+from catalog import ProductCatalog
 from utils import safe_input
 from customer import Customer
 from employee import Employee
-emp  = Employee()
+from metrics import REGISTRY
+from tracing import TRACER, span, spanned, traced
+
+SALES = REGISTRY.counter("supermarket_sales_total", "Sales recorded.")
+REVENUE = REGISTRY.counter("supermarket_revenue_dollars_total", "Final totals of recorded sales.")
+CHECKOUT_LATENCY = REGISTRY.histogram("supermarket_checkout_seconds",
+                                      "Time to price, reserve stock for and record a cart.")
+CHECKOUTS_REJECTED = REGISTRY.counter("supermarket_checkouts_rejected_total",
+                                      "Checkouts rejected for unknown products or missing stock.")
+CHECKOUT_ERRORS = REGISTRY.counter("supermarket_checkout_errors_total", "Checkouts that failed to write.")
+STOCK_OUTS = REGISTRY.counter("supermarket_stock_outs_total", "Cart lines short of stock.")
+REFUNDS = REGISTRY.counter("supermarket_refunds_total", "Refunds recorded.")
+REFUNDED = REGISTRY.counter("supermarket_refunded_dollars_total", "Amounts refunded.")
+
+# Each sold line of a sale with the quantity not yet refunded, from the refund_lines ledger.
+REFUNDABLE_LINES_QUERY = (
+    "SELECT sale_lines.id, sale_lines.product_name, sale_lines.product_id, "
+    "sale_lines.quantity - COALESCE(SUM(refund_lines.quantity), 0), sale_lines.unit_price "
+    "FROM sale_lines LEFT JOIN refund_lines ON refund_lines.sale_line_id = sale_lines.id "
+    "WHERE sale_lines.sale_id = ? AND sale_lines.quantity > 0 "
+    "GROUP BY sale_lines.id ORDER BY sale_lines.id"
+)
+
+
+class OutOfStockError(Exception):
+    """Raised inside a checkout transaction when stock ran out before it could be reserved."""
+
+    def __init__(self, shortfalls):
+        self.shortfalls = shortfalls
+        names = ", ".join(shortfall["name"] for shortfall in shortfalls)
+        super().__init__(f"Not enough stock for: {names}")
+
+
+class AlreadyRefundedError(Exception):
+    """Raised inside a refund transaction when another refund took the same items first."""
+
+    def __init__(self, names):
+        self.names = names
+        super().__init__(f"Already refunded: {', '.join(names)}")
 
 
 class Checkout:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db_name="supermarket.db", writer=None):
+        """
+        Args:
+            db_name (str): Database file.
+            writer (GroupCommitWriter, optional): Route sale and refund writes through
+                a group-commit writer instead of committing each one separately.
+        """
+        self.db = Database(db_name)
+        self.catalog = ProductCatalog.for_database(self.db)
+        self.writer = writer
 
-    def calculate_cart_total(self, cart):
-        """Calculates total cost before discounts and tax.
-           For the special 'membership' item, we use a fixed fee of $50.
+    @spanned("write")
+    def _write(self, job):
         """
-        cart_total = 0
-        for item in cart:
-            name, quantity = item["name"], item["quantity"]
+        Run job(cursor) in a transaction: via the group-commit writer if set, else
+        directly. Inside a caller's Database.transaction() (e.g. an order replay
+        batch) the job always runs inline as a savepoint of it; the writer thread
+        could not take the write lock the caller already holds.
+        """
+        if self.writer is not None and not self.db.in_transaction():
+            # The job runs on the writer thread; carry the trace over so its spans are kept.
+            future = self.writer.submit(TRACER.wrap(job))
+            # Free this thread's connection while waiting so the pool cannot starve the writer.
+            self.db.manager.release()
+            return future.result()
+        with self.db.transaction() as cursor:
+            return job(cursor)
+
+    @spanned("cart_pricing")
+    def price_carts(self, carts):
+        """
+        Price a batch of carts with one catalog lookup and one stock query.
+
+        Duplicate lines for the same product are merged, and every problem in a
+        cart is reported at once instead of stopping at the first. Each cart is
+        checked against current stock on its own; carts in the same batch do not
+        reserve stock from each other.
+
+        Args:
+            carts (list): Carts, each a list of {"name": str, "quantity": int} dicts.
+
+        Returns:
+            list: One quote per cart, in order, as a dict with:
+                - "lines": merged cart lines with product_id, sold_price and the
+                  available stock at pricing time filled in
+                - "subtotal": total before discounts and tax
+                - "problems": dicts with name, reason ("not_found" or
+                  "insufficient_stock"), requested and available quantities
+                - "merged": names of products whose duplicate lines were merged
+        """
+        merged_carts = []
+        names = set()
+        for cart in carts:
+            lines = {}
+            merged = []
+            for item in cart:
+                name = item["name"]
+                if name in lines:
+                    lines[name]["quantity"] += item["quantity"]
+                    if name not in merged:
+                        merged.append(name)
+                else:
+                    lines[name] = dict(item)
+                    if name.lower() != "membership":
+                        names.add(name)
+            merged_carts.append((list(lines.values()), merged))
+
+        products = self.catalog.get_many(names)
+        product_ids = {product["id"] for product in products.values() if product}
+        stock = {}
+        if product_ids:
+            placeholders = ", ".join("?" * len(product_ids))
+            stock = dict(self.db.fetch_query(
+                f"SELECT id, quantity FROM inventory WHERE id IN ({placeholders})", tuple(product_ids)
+            ))
 
-            if name.lower() == "membership":
-                # fixed fee for membership; no stock check
-                sold_price = 50.0
-                item["sold_price"] = sold_price
-                cart_total += sold_price * quantity
-            else:
-                product = self.db.fetch_query("SELECT price, quantity FROM inventory WHERE name=?", (name,))
-                if product:
-                    price, stock = product[0]
-                    if quantity > stock:
-                        print(f" Not enough stock for '{name}'! Available: {stock}")
-                        return None
-                    sold_price = price  # record the current price as the sold price
-                    item["sold_price"] = sold_price
-                    cart_total += sold_price * quantity
+        quotes = []
+        for lines, merged in merged_carts:
+            subtotal = 0
+            problems = []
+            for line in lines:
+                name, quantity = line["name"], line["quantity"]
+                if name.lower() == "membership":
+                    # fixed fee for membership; no stock check
+                    line["sold_price"] = 50.0
                 else:
-                    print(f" Product '{name}' not found!")
-                    return None
-        return cart_total
+                    product = products[name]
+                    if product is None:
+                        problems.append({"name": name, "reason": "not_found", "requested": quantity, "available": 0})
+                        continue
+                    available = stock.get(product["id"], 0)
+                    line["available"] = available
+                    if quantity > available:
+                        problems.append({"name": name, "reason": "insufficient_stock",
+                                         "requested": quantity, "available": available})
+                    line["product_id"] = product["id"]
+                    line["sold_price"] = product["price"]  # record the current price as the sold price
+                subtotal += line["sold_price"] * quantity
+            quotes.append({"lines": lines, "subtotal": subtotal, "problems": problems, "merged": merged})
+        return quotes
+
+    def price_cart(self, cart):
+        """Price a single cart; see price_carts for the quote format."""
+        return self.price_carts([cart])[0]
+
+    @staticmethod
+    def print_problems(problems):
+        """Prints pricing or stock problems for the customer."""
+        for problem in problems:
+            if problem["reason"] == "not_found":
+                print(f" Product '{problem['name']}' not found!")
+            else:
+                print(f" Not enough stock for '{problem['name']}'! Available: {problem['available']}")
 
+    def calculate_cart_total(self, cart):
+        """Calculates total cost before discounts and tax.
+           For the special 'membership' item, we use a fixed fee of $50.
+           Duplicate lines are merged in place and every stock problem is printed.
+           Returns None if any line cannot be sold.
+        """
+        quote = self._quote_cart(cart)
+        return quote["subtotal"] if quote else None
+
+    def _quote_cart(self, cart):
+        """Price a cart for an interactive checkout, as calculate_cart_total; returns the quote or None."""
+        quote = self.price_cart(cart)
+        for name in quote["merged"]:
+            print(f" Merged duplicate lines for '{name}'.")
+        self.print_problems(quote["problems"])
+        if quote["problems"]:
+            STOCK_OUTS.inc(sum(1 for problem in quote["problems"] if problem["reason"] == "insufficient_stock"))
+            return None
+        cart[:] = quote["lines"]
+        return quote
+
+    @spanned("discount")
     def calculate_discount(self, customer_id, cart_total, processing_employee_id=None):
         """
         Applies discounts based on the following rules:
@@ -84,6 +229,7 @@ class Checkout:
         """Generates a unique 8-character alphanumeric reference number."""
         return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
 
+    @traced("self_checkout")
     def process_self_checkout(self):
         """
         Handles self-checkout where customers can browse and select products.
@@ -141,22 +287,23 @@ class Checkout:
         Handles cart, product selection, and payment.
         """
         cart = []
-        while True:
-            product_name = input("Enter product name to add to cart (or -1 to finish): ").strip()
-            if product_name == "-1":
-                break
-            if not product_name:
-                print("Product name cannot be empty.")
-                continue
-
-            try:
-                quantity = int(input("Enter quantity: "))
-                if quantity <= 0:
-                    print("Quantity must be greater than 0.")
+        with span("cart_entry"):
+            while True:
+                product_name = input("Enter product name to add to cart (or -1 to finish): ").strip()
+                if product_name == "-1":
+                    break
+                if not product_name:
+                    print("Product name cannot be empty.")
                     continue
-                cart.append({"name": product_name, "quantity": quantity})
-            except ValueError:
-                print("Invalid quantity. Please enter a valid number.")
+
+                try:
+                    quantity = int(input("Enter quantity: "))
+                    if quantity <= 0:
+                        print("Quantity must be greater than 0.")
+                        continue
+                    cart.append({"name": product_name, "quantity": quantity})
+                except ValueError:
+                    print("Invalid quantity. Please enter a valid number.")
 
         if new_member:
             cart.append({"name": "membership", "quantity": 1, "sold_price": 50.0})
@@ -165,7 +312,8 @@ class Checkout:
             print("No items in cart. Checkout canceled.")
             return
 
-        payment_method = input("Choose payment method (Cash/Card): ").strip()
+        with span("input"):
+            payment_method = input("Choose payment method (Cash/Card): ").strip()
         self.process_payment(
             customer_id=customer_id,
             employee_id=None,
@@ -174,6 +322,7 @@ class Checkout:
             membership=membership,
         )
 
+    @traced("employee_checkout")
     def employee_checkout_flow(self):
         """
         Handles the employee checkout flow:
@@ -183,9 +332,10 @@ class Checkout:
         - Proceeds to process the employee checkout.
         """
         cust = Customer()
+        emp = Employee()
         try:
             # Validate employee login
-            employee_info = emp.employee_login_validation()  # Assumes emp is defined/imported elsewhere
+            employee_info = emp.employee_login_validation()
             if not employee_info or employee_info[0] is None:
                 return  # Login failed; exit the flow
 
@@ -253,23 +403,24 @@ class Checkout:
         - The processing employee is not the same as the customer.
         """
         cart = []
-        while True:
-
-            product_name = input("Enter product name to add to cart (or -1 to finish): ").strip()
-            if product_name == "-1":
-                break
-            if not product_name:
-                print("Product name cannot be empty.")
-                continue
-
-            try:
-                quantity = int(input("Enter quantity: "))
-                if quantity <= 0:
-                    print("Quantity must be greater than 0.")
+        with span("cart_entry"):
+            while True:
+
+                product_name = input("Enter product name to add to cart (or -1 to finish): ").strip()
+                if product_name == "-1":
+                    break
+                if not product_name:
+                    print("Product name cannot be empty.")
                     continue
-                cart.append({"name": product_name, "quantity": quantity})
-            except ValueError:
-                print("Invalid quantity. Please enter a valid number.")
+
+                try:
+                    quantity = int(input("Enter quantity: "))
+                    if quantity <= 0:
+                        print("Quantity must be greater than 0.")
+                        continue
+                    cart.append({"name": product_name, "quantity": quantity})
+                except ValueError:
+                    print("Invalid quantity. Please enter a valid number.")
 
         if new_member:
             cart.append({"name": "membership", "quantity": 1, "sold_price": 50.0})
@@ -278,9 +429,11 @@ class Checkout:
             print("No items in cart. Checkout canceled.")
             return
 
-        payment_method = input("Choose payment method (Cash/Card): ").strip()
+        with span("input"):
+            payment_method = input("Choose payment method (Cash/Card): ").strip()
         self.process_payment(employee_id, customer_id, cart, payment_method, membership)
 
+    @traced("process_payment")
     def process_payment(self, employee_id, customer_id, cart, payment_method, membership):
         """Handles payment, updates inventory, and prints a bill."""
         # Validate payment method early
@@ -288,78 +441,293 @@ class Checkout:
             print(" Invalid payment method! Transaction canceled.")
             return False
 
-        total = self.calculate_cart_total(cart)
-        if total is None:
+        quote = self._quote_cart(cart)
+        if quote is None:
             print(" Transaction failed due to stock issues.")
             return False
 
-        # For employee checkout, pass the processing employee ID; for self checkout, this will be None.
-        discounted_total, discount_percentage, discount_amount = self.calculate_discount(
-            customer_id, total, processing_employee_id=employee_id
-        )
+        # Reuse the quote so the cart is not looked up and stock-checked a second time
+        result = self.checkout_cart(employee_id, customer_id, cart, payment_method, membership, quote=quote)
+        if result["status"] == "rejected":
+            # Another lane sold the stock between pricing and payment
+            self.print_problems(result["problems"])
+            print(" Transaction failed due to stock issues.")
+            return False
+        if result["status"] != "ok":
+            print(f"Error recording sale in database: {result['error']}. Transaction canceled.")
+            return False
 
-        # Apply tax on the discounted total
-        total_after_tax, tax_amount = self.calculate_total_after_tax(discounted_total)
+        payment = result["payment"]
+        print(f"Applying {payment['discount_percentage']}% discount (-${payment['discount_amount']:.2f}). "
+              f"Tax applied after discount: +${payment['tax_amount']:.2f}.", end=" ")
+        if payment["transaction_fee"]:
+            print(f"Card transaction fee (2%): +${payment['transaction_fee']:.2f}.", end=" ")
+        print(f"Final Amount: ${payment['final_total']:.2f}")
 
-        # Add a 2% transaction fee if payment is by card
-        transaction_fee = 0
-        if payment_method.lower() == "card":
-            transaction_fee = total_after_tax * 0.02
-        final_total = total_after_tax + transaction_fee
+        print(f" Payment successful ({payment_method.capitalize()}).")
 
-        # Build an items_detail string with sold price for each item (format: name:quantity:sold_price)
-        items_detail = ", ".join([f"{item['name']}:{item['quantity']}:{item['sold_price']:.2f}" for item in cart])
-        reference_number = self.generate_reference_number()
+        print(" Inventory updated successfully.")
+        self.print_bill(result["lines"], result["subtotal"], payment["discount_percentage"], payment["discount_amount"],
+                        payment["total_after_discount"], payment["tax_amount"], payment["transaction_fee"],
+                        payment["final_total"], result["reference_number"], payment_method, membership)
+        return True
 
-        print(f"Applying {discount_percentage}% discount (-${discount_amount:.2f}). "
-              f"Tax applied after discount: +${tax_amount:.2f}.", end=" ")
-        if transaction_fee:
-            print(f"Card transaction fee (2%): +${transaction_fee:.2f}.", end=" ")
-        print(f"Final Amount: ${final_total:.2f}")
+    def checkout_cart(self, employee_id, customer_id, cart, payment_method, membership,
+                      allow_partial=False, quote=None):
+        """
+        Checks out a cart without any prompts or printing.
 
-        print(f" Payment successful ({payment_method.capitalize()}).")
+        Stock is reserved with conditional decrements inside the checkout
+        transaction, so concurrent lanes can never drive stock negative. The
+        losing cart is rejected, or with allow_partial it is sold with whatever
+        stock is left. Inside an outer Database.transaction() this runs as a
+        savepoint of it.
 
-        # Build item detail and total quantity for sales record
-        total_quantity = sum(item['quantity'] for item in cart)
+        Args:
+            quote (dict, optional): A price_cart() quote for the cart, to avoid pricing twice.
+
+        Returns:
+            dict: status ("ok", "rejected" or "error"), reference_number, lines
+                  actually sold, subtotal, payment (see calculate_payment), problems
+                  (invalid lines, unknown products or stock shortfalls) and error.
+        """
+        started = time.perf_counter()
+        result = self._checkout_cart(employee_id, customer_id, cart, payment_method, membership, allow_partial, quote)
+        CHECKOUT_LATENCY.observe(time.perf_counter() - started)
+        if result["status"] == "ok":
+            # Inside a caller's transaction the sale only counts once that commits.
+            self.db.after_commit(lambda: self._count_sale(result["payment"]["final_total"]))
+        elif result["status"] == "rejected":
+            CHECKOUTS_REJECTED.inc()
+        else:
+            CHECKOUT_ERRORS.inc()
+        shortfalls = sum(1 for problem in result["problems"] if problem.get("reason") == "insufficient_stock")
+        if shortfalls:
+            STOCK_OUTS.inc(shortfalls)
+        return result
+
+    @staticmethod
+    def _count_sale(final_total):
+        SALES.inc()
+        REVENUE.inc(final_total)
+
+    def _checkout_cart(self, employee_id, customer_id, cart, payment_method, membership, allow_partial, quote):
+        result = {"status": "rejected", "reference_number": None, "lines": [], "subtotal": 0,
+                  "payment": None, "problems": [], "error": None}
+        if payment_method.lower() not in ["cash", "card"]:
+            result["problems"] = [{"reason": "invalid_payment_method", "payment_method": payment_method}]
+            return result
+        result["problems"] = self.validate_cart(cart)
+        if result["problems"]:
+            return result
+        if quote is None:
+            quote = self.price_cart(cart)
+        # Unknown products are final; stock is decided below under the write lock.
+        result["problems"] = [problem for problem in quote["problems"] if problem["reason"] == "not_found"]
+        if result["problems"] or not quote["lines"]:
+            return result
+
+        # Discount lookups happen before the write lock is taken.
+        full_payment = self.calculate_payment(employee_id, customer_id, quote["subtotal"], payment_method)
+        reference_number = self.generate_reference_number()
+
+        def write_sale(cursor):
+            lines, shortfalls = self.reserve_stock(cursor, quote["lines"], allow_partial)
+            subtotal = sum(line["sold_price"] * line["quantity"] for line in lines)
+            payment = full_payment
+            if shortfalls:
+                if not any("product_id" in line for line in lines):
+                    raise OutOfStockError(shortfalls)
+                payment = self.calculate_payment(employee_id, customer_id, subtotal, payment_method)
+            self.record_sale(cursor, employee_id, customer_id, lines, payment,
+                             membership, payment_method, reference_number)
+            return lines, shortfalls, subtotal, payment
 
-        # Insert the sale into the database
         try:
-            query = (
-                "INSERT INTO sales (employee_id, customer_id, items, quantity, tax, discount, total, membership, reference_number, payment_method) "
-                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-            )
-            self.db.execute_query(query, (
-                employee_id if employee_id is not None else None,
-                customer_id,
-                items_detail,
-                total_quantity,
-                f"{tax_amount:.2f}",
-                f"{discount_amount:.2f}",
-                f"{final_total:.2f}",
-                membership,
-                reference_number,
-                payment_method
-            ))
+            lines, shortfalls, subtotal, payment = self._write(write_sale)
+        except OutOfStockError as e:
+            result["problems"] = e.shortfalls
+            return result
         except Exception as e:
-            print(f"Error inserting sale into database: {e}")
-            return False
+            result.update(status="error", error=str(e))
+            return result
+
+        result.update(status="ok", reference_number=reference_number, lines=lines, subtotal=subtotal,
+                      payment=payment, problems=shortfalls)
+        return result
 
-        # Update the inventory for each purchased item (skip updating inventory for membership fee)
+    @staticmethod
+    def validate_cart(cart):
+        """
+        Checks the shape of a headless cart before it is priced or reserved; the
+        interactive flows validate their input as it is typed.
+
+        Returns:
+            list: Problems with name, reason ("invalid_item" for a line without a
+                  product name, "invalid_quantity" for a quantity that is not a
+                  positive integer), requested and available; empty if the cart is valid.
+        """
+        if not isinstance(cart, list):
+            return [{"name": None, "reason": "invalid_item", "requested": None, "available": 0}]
+        problems = []
         for item in cart:
-            if item["name"].lower() == "membership":
+            name = item.get("name") if isinstance(item, dict) else None
+            if not isinstance(name, str) or not name.strip():
+                problems.append({"name": name, "reason": "invalid_item", "requested": None, "available": 0})
                 continue
-            try:
-                self.db.execute_query("UPDATE inventory SET quantity = quantity - ? WHERE name = ?",
-                                      (item["quantity"], item["name"]))
-            except Exception as e:
-                print(f"Error updating inventory for '{item['name']}': {e}")
+            quantity = item.get("quantity")
+            if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity <= 0:
+                problems.append({"name": name, "reason": "invalid_quantity", "requested": quantity, "available": 0})
+        return problems
+
+    @traced("checkout_order")
+    def checkout_order(self, order, allow_partial=False, quote=None):
+        """
+        Checks out an order dict without prompts; the headless entry point used by
+        order replay and checkout lanes.
+
+        The order holds "items" ({"name", "quantity"} dicts) and optionally
+        "order_id", "customer_id", "employee_id", "membership" and
+        "payment_method" (default cash). A missing customer_id becomes an
+        anonymous reference number; a missing membership is looked up.
+
+        Returns:
+            dict: order_id, status, reference_number, total (rounded final total)
+                  and problems, plus error when status is "error".
+        """
+        result = {"order_id": order.get("order_id"), "status": "rejected",
+                  "reference_number": None, "total": None, "problems": []}
+        cart = order.get("items") or []
+        if not cart:
+            result["problems"].append({"reason": "empty_cart"})
+            return result
+
+        employee_id = order.get("employee_id")
+        customer_id = order.get("customer_id") or self.generate_reference_number()
+        membership = order.get("membership")
+        if membership is None:
+            with span("customer_lookup"):
+                member = self.db.fetch_query("SELECT membership FROM customers WHERE id=?", (customer_id,))
+            membership = member[0][0] if member else "Anonymous"
+        payment_method = (order.get("payment_method") or "cash").strip()
+
+        outcome = self.checkout_cart(employee_id, customer_id, cart, payment_method, membership,
+                                     allow_partial=allow_partial, quote=quote)
+        result.update(status=outcome["status"], reference_number=outcome["reference_number"],
+                      problems=outcome["problems"])
+        if outcome["status"] == "ok":
+            result["total"] = round(outcome["payment"]["final_total"], 2)
+        if outcome["error"]:
+            result["error"] = outcome["error"]
+        return result
+
+    @staticmethod
+    @spanned("inventory_update")
+    def reserve_stock(cursor, cart, allow_partial=False):
+        """
+        Decrements stock for every priced cart line with a conditional UPDATE
+        (WHERE quantity >= requested). Must be called inside Database.transaction().
+
+        Returns:
+            tuple: (lines that can be sold, shortfalls). Without allow_partial any
+                   shortfall raises OutOfStockError instead.
+        """
+        lines = []
+        shortfalls = []
+        for item in cart:
+            if "product_id" not in item:
+                # membership fee; nothing to reserve
+                lines.append(item)
                 continue
+            quantity = item["quantity"]
+            cursor.execute("UPDATE inventory SET quantity = quantity - ? WHERE id = ? AND quantity >= ?",
+                           (quantity, item["product_id"], quantity))
+            if cursor.rowcount == 1:
+                lines.append(item)
+                continue
+            row = cursor.execute("SELECT quantity FROM inventory WHERE id = ?", (item["product_id"],)).fetchone()
+            available = max(row[0], 0) if row else 0
+            shortfalls.append({"name": item["name"], "reason": "insufficient_stock",
+                               "requested": quantity, "available": available})
+            if allow_partial and available > 0:
+                cursor.execute("UPDATE inventory SET quantity = quantity - ? WHERE id = ? AND quantity >= ?",
+                               (available, item["product_id"], available))
+                lines.append(dict(item, quantity=available))
+        if shortfalls and not allow_partial:
+            raise OutOfStockError(shortfalls)
+        return lines, shortfalls
+
+    def calculate_payment(self, employee_id, customer_id, subtotal, payment_method):
+        """
+        Applies the discount, tax and card fee rules to a cart subtotal.
 
-        print(" Inventory updated successfully.")
-        self.print_bill(cart, total, discount_percentage, discount_amount, discounted_total,
-                        tax_amount, transaction_fee, final_total, reference_number, payment_method, membership)
-        return True
+        Returns:
+            dict: discount_percentage, discount_amount, total_after_discount,
+                  tax_amount, transaction_fee and final_total.
+        """
+        # For employee checkout, pass the processing employee ID; for self checkout, this will be None.
+        discounted_total, discount_percentage, discount_amount = self.calculate_discount(
+            customer_id, subtotal, processing_employee_id=employee_id
+        )
+
+        with span("tax_and_fees"):
+            # Apply tax on the discounted total
+            total_after_tax, tax_amount = self.calculate_total_after_tax(discounted_total)
+
+            # Add a 2% transaction fee if payment is by card
+            transaction_fee = 0
+            if payment_method.lower() == "card":
+                transaction_fee = total_after_tax * 0.02
+            final_total = total_after_tax + transaction_fee
+
+        return {
+            "discount_percentage": discount_percentage,
+            "discount_amount": discount_amount,
+            "total_after_discount": discounted_total,
+            "tax_amount": tax_amount,
+            "transaction_fee": transaction_fee,
+            "final_total": final_total,
+        }
+
+    @staticmethod
+    @spanned("sale_insert")
+    def record_sale(cursor, employee_id, customer_id, cart, payment, membership, payment_method, reference_number):
+        """
+        Writes a priced cart as a sale: the sales row and its sale lines. Stock must
+        already be reserved with reserve_stock() in the same Database.transaction().
+
+        Returns:
+            int: The new sale id.
+        """
+        # Total quantity for sales record
+        total_quantity = sum(item['quantity'] for item in cart)
+        query = (
+            "INSERT INTO sales (employee_id, customer_id, quantity, tax, discount, total, membership, reference_number, payment_method) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        cursor.execute(query, (
+            employee_id if employee_id is not None else None,
+            customer_id,
+            total_quantity,
+            f"{payment['tax_amount']:.2f}",
+            f"{payment['discount_amount']:.2f}",
+            f"{payment['final_total']:.2f}",
+            membership,
+            reference_number,
+            payment_method
+        ))
+        sale_id = cursor.lastrowid
+
+        # One sale line per cart item, with the price it was sold at
+        cursor.executemany(
+            "INSERT INTO sale_lines (sale_id, product_id, product_name, quantity, unit_price) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(sale_id, item.get("product_id"), item["name"], item["quantity"], item["sold_price"])
+             for item in cart]
+        )
+        return sale_id
 
+    @spanned("receipt_print")
     def print_bill(self, cart, subtotal, discount_percentage, discount_amount, total_after_discount,
                    tax_amount, transaction_fee, final_total, reference_number, payment_method, membership, is_refund=False, refund_reference=None):
         """Prints a detailed bill receipt with itemized costs, membership status,
@@ -384,9 +752,9 @@ class Checkout:
         for item in cart:
             unit_price = item.get("sold_price")
             if unit_price is None:
-                # Fallback: fetch current price from inventory (might not match the sale price)
-                product = self.db.fetch_query("SELECT price FROM inventory WHERE name=?", (item['name'],))
-                unit_price = product[0][0] if product and product[0] else 0
+                # Fallback: current catalog price (might not match the sale price)
+                product = self.catalog.get_by_name(item['name'])
+                unit_price = product["price"] if product else 0
             item_total = unit_price * item['quantity']
             refund_note = " (Refunded)" if is_refund else ""
             print(f"- {item['name']} x{item['quantity']} @ ${unit_price:.2f} each = ${item_total:.2f}{refund_note}")
@@ -407,6 +775,12 @@ class Checkout:
             print("     Thank you for shopping!   ")
         print("===============================\n")
 
+    @staticmethod
+    def _count_refund(amount):
+        REFUNDS.inc()
+        REFUNDED.inc(amount)
+
+    @traced("refund")
     def refund(self):
         """Processes a refund for a previous purchase."""
         print("Want a refund on purchase? Make sure your items were purchased within the last 7 days.")
@@ -416,10 +790,11 @@ class Checkout:
             return
 
         # Fetch the sale record by reference number
-        sale_record = self.db.fetch_query(
-            "SELECT id, employee_id, customer_id, items, quantity, total, date, remarks, payment_method FROM sales WHERE reference_number = ?",
-            (reference_no,)
-        )
+        with span("sale_lookup"):
+            sale_record = self.db.fetch_query(
+                "SELECT id, employee_id, customer_id, quantity, total, date, remarks, payment_method FROM sales WHERE reference_number = ?",
+                (reference_no,)
+            )
         if not sale_record:
             print(" Sale record not found.")
             return
@@ -427,10 +802,9 @@ class Checkout:
         sale_id = sale[0]
         sale_employee_id = sale[1]
         sale_customer_id = sale[2]
-        sale_items_str = sale[3]  # format: "name:quantity:price, name2:quantity:price, ..."
-        sale_total = float(sale[5])
-        sale_date_str = sale[6]
-        sale_payment_method = sale[8]
+        sale_total = float(sale[4])
+        sale_date_str = sale[5]
+        sale_payment_method = sale[7]
         sale_date = datetime.strptime(sale_date_str, "%Y-%m-%d %H:%M:%S")
 
         # Check refund period
@@ -449,28 +823,18 @@ class Checkout:
             print(" You cannot process a refund for your own sale.")
             return
 
-        # Parse the sale items into two dictionaries: one for refundable quantities and one for the sold prices.
-        sale_items = {}
-        sale_prices = {}
-        for part in sale_items_str.split(","):
-            if part.strip():
-                tokens = part.split(":")
-                if len(tokens) >= 2:
-                    item_name = tokens[0].strip()
-                    try:
-                        qty = int(tokens[1].strip())
-                    except ValueError:
-                        continue
-                    if len(tokens) == 3:
-                        try:
-                            sold_price = float(tokens[2].strip())
-                        except ValueError:
-                            sold_price = None
-                    else:
-                        sold_price = None
-                    sale_items[item_name] = qty
-                    sale_prices[item_name] = sold_price
+        # Remaining refundable quantity per sale line, net of earlier refunds.
+        refundable = {}
+        for line_id, name, product_id, remaining, unit_price in self.db.fetch_query(REFUNDABLE_LINES_QUERY, (sale_id,)):
+            refundable.setdefault(name, []).append(
+                {"id": line_id, "product_id": product_id, "remaining": remaining, "unit_price": unit_price})
+        sale_items = {name: sum(line["remaining"] for line in lines) for name, lines in refundable.items()}
+        if not any(sale_items.values()):
+            print(" Every item on this sale has already been refunded.")
+            return
 
+        # Refunded quantities per sale line id, and per product name for the remarks.
+        allocations = {}
         refund_items = {}
         total_refund_amount = 0
         while True:
@@ -478,12 +842,15 @@ class Checkout:
             if input_str is None or input_str.lower() == "exit":
                 break
             try:
-                item_name, qty_str = input_str.split(",")
+                item_name, qty_str = input_str.rsplit(",", 1)
                 item_name = item_name.strip()
                 refund_qty = int(qty_str.strip())
                 if item_name not in sale_items:
                     print(f" Item '{item_name}' was not part of the original sale.")
                     continue
+                if refund_qty <= 0:
+                    print(" Refund quantity must be greater than 0.")
+                    continue
                 if refund_qty > sale_items[item_name]:
                     print(f" Refund quantity for '{item_name}' exceeds refundable quantity ({sale_items[item_name]}).")
                     continue
@@ -491,19 +858,17 @@ class Checkout:
                 if item_name.lower() == "membership":
                     print(" Membership fee cannot be refunded.")
                     continue
-                # Use the sold price from the original sale
-                sold_price = sale_prices.get(item_name)
-                if sold_price is None:
-                    # Fallback (should rarely happen)
-                    product = self.db.fetch_query("SELECT price FROM inventory WHERE name=?", (item_name,))
-                    sold_price = product[0][0] if product and product[0] else 0
-                refund_amount = sold_price * refund_qty
-                total_refund_amount += refund_amount
-                # Accumulate refund items
-                if item_name in refund_items:
-                    refund_items[item_name] += refund_qty
-                else:
-                    refund_items[item_name] = refund_qty
+                # Take the quantity from the item's sale lines in order, each at its sold price
+                left = refund_qty
+                for line in refundable[item_name]:
+                    take = min(left, line["remaining"])
+                    if take <= 0:
+                        continue
+                    line["remaining"] -= take
+                    allocations[line["id"]] = allocations.get(line["id"], 0) + take
+                    total_refund_amount += line["unit_price"] * take
+                    left -= take
+                refund_items[item_name] = refund_items.get(item_name, 0) + refund_qty
                 # Adjust remaining refundable quantity for this item to avoid over-refunding
                 sale_items[item_name] -= refund_qty
             except Exception as e:
@@ -523,55 +888,79 @@ class Checkout:
 
         # Generate a refund reference number
         refund_ref = self.generate_reference_number()
-
-        # Update inventory: add refunded quantities back (skip membership)
-        for item, qty in refund_items.items():
-            try:
-                self.db.execute_query("UPDATE inventory SET quantity = quantity + ? WHERE name = ?", (qty, item))
-            except Exception as e:
-                print(f"Error updating inventory for '{item}': {e}")
-
-        # Update the original sale record with refund remarks
-        existing_remarks = sale[7] if sale[7] else ""
-        updated_remarks = (existing_remarks + " | " if existing_remarks else "") + f"Refunded: {refund_items} (Refund Ref: {refund_ref})"
-        try:
-            self.db.execute_query("UPDATE sales SET remarks = ? WHERE id = ?", (updated_remarks, sale_id))
-        except Exception as e:
-            print(f"Error updating sale record remarks: {e}")
+        refund_remark = f"Refunded: {refund_items} (Refund Ref: {refund_ref})"
 
         # Insert a new sales record for the refund with negative values.
         # Note: Tax, discount, and transaction fee are not refunded.
-        refund_items_detail = ", ".join([f"{item}:{qty}:{sale_prices.get(item, 0):.2f}" for item, qty in refund_items.items()])
         total_refund_qty = sum(refund_items.values())
         negative_total = -total_refund_amount
+        sale_lines = {line["id"]: (name, line) for name, lines in refundable.items() for line in lines}
+        refund_lines = [(line_id, qty) + sale_lines[line_id] for line_id, qty in allocations.items()]
+
+        # Re-check the ledger, restock, annotate the original sale and record the refund in a single transaction.
+        def write_refund(cursor):
+            # Another till may have refunded the same lines since they were read.
+            remaining = {row[0]: row[3] for row in cursor.execute(REFUNDABLE_LINES_QUERY, (sale_id,))}
+            taken = sorted({name for line_id, qty, name, _ in refund_lines if qty > remaining.get(line_id, 0)})
+            if taken:
+                raise AlreadyRefundedError(taken)
+            # Update inventory: add refunded quantities back (skip membership)
+            with span("inventory_update"):
+                cursor.executemany(
+                    "UPDATE inventory SET quantity = quantity + ? WHERE id = ?",
+                    [(qty, line["product_id"]) for _, qty, _, line in refund_lines if line["product_id"] is not None]
+                )
+            with span("sale_insert"):
+                cursor.execute(
+                    "UPDATE sales SET remarks = CASE WHEN remarks IS NULL OR remarks = '' THEN ? "
+                    "ELSE remarks || ' | ' || ? END WHERE id = ?",
+                    (refund_remark, refund_remark, sale_id)
+                )
+                query = (
+                    "INSERT INTO sales (employee_id, customer_id, quantity, tax, discount, total, membership, reference_number, payment_method, remarks) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                )
+                cursor.execute(query, (
+                    refund_processor,         # Processed by refund employee
+                    sale_customer_id,
+                    -total_refund_qty,        # Negative quantity for refund
+                    "0.00",                   # No tax refunded
+                    "0.00",                   # No discount refunded
+                    f"{negative_total:.2f}",  # Negative total refund amount
+                    "",                       # Membership left blank for refund
+                    refund_ref,               # Refund reference as the new reference_number
+                    "refund",                 # Payment method set as refund
+                    "Refund Transaction"      # Remarks for refund transaction
+                ))
+                refund_sale_id = cursor.lastrowid
+                # Refund lines carry negative quantities at the original sold price
+                cursor.executemany(
+                    "INSERT INTO sale_lines (sale_id, product_id, product_name, quantity, unit_price) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(refund_sale_id, line["product_id"], name, -qty, line["unit_price"])
+                     for _, qty, name, line in refund_lines]
+                )
+                # Ledger entries against the original sale lines
+                cursor.executemany(
+                    "INSERT INTO refund_lines (sale_line_id, refund_sale_id, quantity, unit_price) VALUES (?, ?, ?, ?)",
+                    [(line_id, refund_sale_id, qty, line["unit_price"]) for line_id, qty, _, line in refund_lines]
+                )
+
         try:
-            query = (
-                "INSERT INTO sales (employee_id, customer_id, items, quantity, tax, discount, total, membership, reference_number, payment_method, remarks) "
-                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-            )
-            self.db.execute_query(query, (
-                refund_processor,         # Processed by refund employee
-                sale_customer_id,
-                refund_items_detail,
-                -total_refund_qty,        # Negative quantity for refund
-                "0.00",                   # No tax refunded
-                "0.00",                   # No discount refunded
-                f"{negative_total:.2f}",  # Negative total refund amount
-                "",                       # Membership left blank for refund
-                refund_ref,               # Refund reference as the new reference_number
-                "refund",                 # Payment method set as refund
-                "Refund Transaction"      # Remarks for refund transaction
-            ))
+            self._write(write_refund)
+        except AlreadyRefundedError as e:
+            print(f" {e}. Another refund on this receipt was processed first. Refund canceled.")
+            return
         except Exception as e:
-            print(f"Error inserting refund record into database: {e}")
+            print(f"Error recording refund in database: {e}. Refund canceled.")
             return
+        self.db.after_commit(lambda: self._count_refund(total_refund_amount))
 
         print(" Refund processed successfully.")
         # Print refund bill with a refund header
-        # Build a cart-like list from refund_items for printing
-        refund_cart = []
-        for item, qty in refund_items.items():
-            refund_cart.append({"name": item, "quantity": qty, "sold_price": sale_prices.get(item, 0)})
+        # Build a cart-like list from the refunded sale lines for printing
+        refund_cart = [{"name": name, "quantity": qty, "sold_price": line["unit_price"]}
+                       for _, qty, name, line in refund_lines]
         self.print_bill(
             cart=refund_cart,
             subtotal=total_refund_amount,
@@ -1,5 +1,6 @@
 from database import Database
 from utils import generate_id
+from tracing import spanned
 
 
 class Customer:
@@ -36,6 +37,7 @@ class Customer:
             print(f" Error adding customer: {e}")
 
 
+    @spanned("customer_lookup")
     def check_customer_details(self, name):
         """Check if customer details exist in the database and return ID and membership."""
         if not isinstance(name, str) or not name.strip():
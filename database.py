@@ -1,18 +1,426 @@
+import json
+import os
+import re
 import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+from migrations import apply_migrations
+
+DEFAULT_MAX_CONNECTIONS = 8
+
+# PRAGMA synchronous level per durability profile. "full" fsyncs the WAL on
+# every commit; "normal" only fsyncs at checkpoints, so a power loss can drop
+# the last few commits but never corrupts the database.
+DURABILITY_PROFILES = {
+    "full": "FULL",
+    "normal": "NORMAL",
+}
+DEFAULT_DURABILITY = os.environ.get("SUPERMARKET_DURABILITY", "full").lower()
+
+# Statements slower than this (including fetching their rows) go to the slow-query log.
+DEFAULT_SLOW_QUERY_SECONDS = float(os.environ.get("SUPERMARKET_SLOW_QUERY_MS", "100")) / 1000
+# Optional file the slow-query log is also appended to, one JSON object per line.
+SLOW_QUERY_LOG_FILE = os.environ.get("SUPERMARKET_SLOW_QUERY_LOG")
+# Slow queries kept in memory.
+SLOW_QUERY_LOG_SIZE = 100
+QUERY_STATS_ENABLED = os.environ.get("SUPERMARKET_QUERY_STATS", "1") != "0"
+# Only these statements have a query plan worth capturing.
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH")
+_PLACEHOLDER_LIST = re.compile(r"\?(\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_statement(sql):
+    """Collapse whitespace and IN (?, ?, ...) lists so one statement shape is one stats entry."""
+    return _PLACEHOLDER_LIST.sub("?, ...", _WHITESPACE.sub(" ", sql).strip())
+
+
+class QueryStats:
+    """
+    Per-statement timing for one database, shared by all its pooled connections.
+
+    Each statement shape records calls, errors, total and max latency (execute
+    plus fetching its rows) and rows returned or changed. Statements slower
+    than slow_threshold are also kept, with their EXPLAIN QUERY PLAN, in a
+    bounded slow-query log.
+    """
+
+    def __init__(self, slow_threshold=DEFAULT_SLOW_QUERY_SECONDS, log_file=SLOW_QUERY_LOG_FILE):
+        self.enabled = QUERY_STATS_ENABLED
+        self.slow_threshold = slow_threshold
+        self.log_file = log_file
+        self._statements = {}
+        self._slow = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        # Re-entrant so a signal handler dumping stats cannot deadlock the thread it interrupts.
+        self._lock = threading.RLock()
+
+    def record(self, key, elapsed, rows=0, calls=1, error=False):
+        """Add one execution (or a fetch of its rows, with calls=0) to a statement's totals."""
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                entry = self._statements[key] = {"calls": 0, "errors": 0, "total": 0.0, "max": 0.0, "rows": 0}
+            entry["calls"] += calls
+            entry["errors"] += error
+            entry["total"] += elapsed
+            entry["rows"] += rows
+            if elapsed > entry["max"]:
+                entry["max"] = elapsed
+
+    def log_slow(self, conn, sql, params, elapsed, rows):
+        """Capture a slow statement and its query plan."""
+        plan = []
+        if sql.lstrip()[:7].upper().startswith(EXPLAINABLE):
+            try:
+                plan = [row[3] for row in sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+            except sqlite3.Error as e:
+                plan = [f"(no plan: {e})"]
+        entry = {
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "statement": normalize_statement(sql),
+            "params": repr(params)[:200],
+            "elapsed_ms": elapsed * 1000,
+            "rows": rows,
+            "plan": plan,
+        }
+        with self._lock:
+            self._slow.append(entry)
+        if self.log_file:
+            try:
+                with open(self.log_file, "a") as f:
+                    f.write(json.dumps(entry) + "\n")
+            except OSError as e:
+                print(f" Error writing slow query log: {e}")
+
+    def snapshot(self):
+        """
+        Return statements (sorted by total time, with avg_ms, total_ms and
+        max_ms) and the slow-query log, newest last.
+        """
+        with self._lock:
+            statements = [dict(entry, statement=key) for key, entry in self._statements.items()]
+            slow = list(self._slow)
+        statements.sort(key=lambda entry: entry["total"], reverse=True)
+        for entry in statements:
+            entry["total_ms"] = entry.pop("total") * 1000
+            entry["max_ms"] = entry.pop("max") * 1000
+            entry["avg_ms"] = entry["total_ms"] / entry["calls"] if entry["calls"] else 0.0
+        return {"slow_threshold_ms": self.slow_threshold * 1000, "statements": statements, "slow_queries": slow}
+
+    def reset(self):
+        """Forget all statistics and the slow-query log."""
+        with self._lock:
+            self._statements.clear()
+            self._slow.clear()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports every statement, and the rows fetched from it, to its connection's QueryStats."""
+
+    _pending = None
+
+    def _stats(self):
+        stats = self.connection.query_stats
+        return stats if stats is not None and stats.enabled else None
+
+    def _executed(self, stats, sql, params, started, error=False):
+        elapsed = time.perf_counter() - started
+        key = normalize_statement(sql)
+        rows = self.rowcount if not error and self.rowcount > 0 else 0
+        stats.record(key, elapsed, rows, error=error)
+        # [key, sql, params, elapsed so far, rows so far, already logged as slow]
+        self._pending = None if error else [key, sql, params, elapsed, rows, False]
+        if not error and elapsed >= stats.slow_threshold:
+            self._pending[5] = True
+            stats.log_slow(self.connection, sql, params, elapsed, rows)
+
+    def execute(self, sql, parameters=()):
+        stats = self._stats()
+        if stats is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            self._executed(stats, sql, parameters, started, error=True)
+            raise
+        self._executed(stats, sql, parameters, started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        stats = self._stats()
+        if stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except Exception:
+            self._executed(stats, sql, (), started, error=True)
+            raise
+        self._executed(stats, sql, seq_of_parameters[0] if seq_of_parameters else (), started)
+        return self
+
+    def _fetched(self, started, rows):
+        pending = self._pending
+        stats = self._stats()
+        if pending is None or stats is None:
+            return
+        elapsed = time.perf_counter() - started
+        stats.record(pending[0], elapsed, rows, calls=0)
+        pending[3] += elapsed
+        pending[4] += rows
+        if not pending[5] and pending[3] >= stats.slow_threshold:
+            pending[5] = True
+            stats.log_slow(self.connection, pending[1], pending[2], pending[3], pending[4])
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, shortcut execute methods and commits are timed into query_stats."""
+
+    query_stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        stats = self.query_stats
+        if stats is None or not stats.enabled or not self.in_transaction:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            stats.record("COMMIT", time.perf_counter() - started)
+
+
+class ConnectionManager:
+    """
+    Process-wide pool of SQLite connections for one database file.
+
+    Each thread leases its own connection (SQLite connections must not be
+    shared by concurrent threads) and keeps it until it calls release().
+    At most max_connections are open at once; extra threads wait for a
+    released connection. The schema is set up once per process, not once per
+    Database() instance.
+    """
+    _managers = {}
+    _managers_lock = threading.Lock()
+
+    def __init__(self, db_name, max_connections=DEFAULT_MAX_CONNECTIONS, durability=DEFAULT_DURABILITY):
+        if durability not in DURABILITY_PROFILES:
+            raise ValueError(f"Unknown durability profile: {durability}")
+        self.db_name = db_name
+        self.max_connections = max_connections
+        self.durability = durability
+        self._synchronous = {}
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        self._idle = []
+        self._open = 0
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        self.query_stats = QueryStats()
+        # Pool statistics
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    @classmethod
+    def for_database(cls, db_name):
+        """Return the shared manager for db_name, creating it on first use."""
+        with cls._managers_lock:
+            manager = cls._managers.get(db_name)
+            if manager is None:
+                manager = cls(db_name)
+                cls._managers[db_name] = manager
+            return manager
+
+    def _open_connection(self):
+        # Autocommit mode: transactions are opened explicitly by Database.transaction().
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None,
+                               factory=InstrumentedConnection)
+        conn.query_stats = self.query_stats
+        return conn
+
+    def _apply_durability(self, conn):
+        profile = self.durability
+        if self._synchronous.get(conn) != profile and not conn.in_transaction:
+            conn.execute(f"PRAGMA synchronous = {DURABILITY_PROFILES[profile]};")
+            self._synchronous[conn] = profile
+
+    def set_durability(self, profile):
+        """Switch the durability profile; applied to each connection before its next use."""
+        profile = profile.lower()
+        if profile not in DURABILITY_PROFILES:
+            raise ValueError(f"Unknown durability profile: {profile}")
+        self.durability = profile
+
+    def connection(self):
+        """Return the calling thread's connection, leasing one from the pool if needed."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            if self._synchronous.get(conn) != self.durability:
+                self._apply_durability(conn)
+            return conn
+
+        started = time.perf_counter()
+        waited = False
+        with self._condition:
+            while not self._idle and self._open >= self.max_connections:
+                waited = True
+                self._condition.wait()
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                self._open += 1
+                conn = None
+            self._checkouts += 1
+            if waited:
+                wait = time.perf_counter() - started
+                self._waits += 1
+                self._wait_time += wait
+                self._max_wait_time = max(self._max_wait_time, wait)
+
+        if conn is None:
+            try:
+                conn = self._open_connection()
+            except Exception:
+                with self._condition:
+                    self._open -= 1
+                    self._condition.notify()
+                raise
+        self._apply_durability(conn)
+        self._local.conn = conn
+        self._local.cursor = conn.cursor()
+        self._local.depth = 0
+        return conn
+
+    def cursor(self):
+        """Return the cursor bound to the calling thread's connection."""
+        self.connection()
+        return self._local.cursor
+
+    def transaction_depth(self):
+        """How many Database.transaction() blocks the calling thread is inside."""
+        return getattr(self._local, "depth", 0)
+
+    def _set_transaction_depth(self, depth):
+        self._local.depth = depth
+
+    def _commit_callbacks(self):
+        """The calling thread's (depth, callback) pairs waiting for the outermost commit."""
+        callbacks = getattr(self._local, "commit_callbacks", None)
+        if callbacks is None:
+            callbacks = self._local.commit_callbacks = []
+        return callbacks
+
+    def release(self):
+        """Return the calling thread's connection to the pool."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.cursor.close()
+        self._local.conn = None
+        self._local.cursor = None
+        self._local.depth = 0
+        self._local.commit_callbacks = []
+        if conn.in_transaction:
+            conn.rollback()
+        with self._condition:
+            self._idle.append(conn)
+            self._condition.notify()
+
+    def ensure_schema(self, setup):
+        """Run setup() once per process for this database."""
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                setup()
+                self._schema_ready = True
+
+    def close_all(self):
+        """Close every idle connection and the calling thread's own connection."""
+        self.release()
+        with self._condition:
+            while self._idle:
+                conn = self._idle.pop()
+                self._synchronous.pop(conn, None)
+                conn.close()
+                self._open -= 1
+            self._condition.notify_all()
+
+    def stats(self):
+        """Return a snapshot of the pool statistics."""
+        with self._condition:
+            return {
+                "db_name": self.db_name,
+                "durability": self.durability,
+                "open_connections": self._open,
+                "idle_connections": len(self._idle),
+                "leased_connections": self._open - len(self._idle),
+                "max_connections": self.max_connections,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "total_wait_time": self._wait_time,
+                "max_wait_time": self._max_wait_time,
+            }
+
 
 class Database:
-    def __init__(self, db_name="supermarket.db"):
+    def __init__(self, db_name="supermarket.db", durability=None):
         self.db_name = db_name
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)  # Disable auto-commit (default behavior)
-        self.cursor = self.conn.cursor()
-        self.setup_database()
+        self.manager = ConnectionManager.for_database(db_name)
+        if durability is not None:
+            self.manager.set_durability(durability)
+        self.manager.ensure_schema(self.setup_database)
+
+    @property
+    def conn(self):
+        """The calling thread's pooled connection."""
+        return self.manager.connection()
+
+    @property
+    def cursor(self):
+        """The cursor on the calling thread's pooled connection."""
+        return self.manager.cursor()
 
     def setup_database(self):
-        """Ensure live changes are visible in the database."""
+        """Ensure live changes are visible in the database and the schema is current."""
         self.cursor.execute("PRAGMA journal_mode = WAL;")
-        self.cursor.execute("PRAGMA synchronous = FULL;")
         self.create_tables()
-        self.conn.commit()
+        apply_migrations(self)
 
     def create_tables(self):
         queries = [
@@ -29,7 +437,7 @@ class Database:
                 quantity INTEGER NOT NULL,
                 price REAL NOT NULL,
                 aisle_name TEXT NOT NULL,
-                FOREIGN KEY (aisle_name) REFERENCES aisles(name) 
+                FOREIGN KEY (aisle_name) REFERENCES aisles(name)
             )""",
             """CREATE TABLE IF NOT EXISTS customers (
                 id PRIMARY KEY,
@@ -59,34 +467,154 @@ class Database:
                 id TEXT NOT NULL PRIMARY KEY,
                 name TEXT NOT NULL,
                 product_name TEXT DEFAULT ''
-            )"""
+            )""",
+            # One row per product on a sale. Refunds are sales rows whose lines carry
+            # negative quantities. product_name is a snapshot so lines stay readable
+            # after a product is renamed or removed; product_id is NULL for the
+            # membership fee.
+            """CREATE TABLE IF NOT EXISTS sale_lines (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sale_id INTEGER NOT NULL,
+                product_id TEXT,
+                product_name TEXT NOT NULL,
+                quantity INTEGER NOT NULL,
+                unit_price REAL NOT NULL,
+                FOREIGN KEY (sale_id) REFERENCES sales(id),
+                FOREIGN KEY (product_id) REFERENCES inventory(id)
+            )""",
+            "CREATE INDEX IF NOT EXISTS idx_sale_lines_sale_id ON sale_lines (sale_id)"
         ]
+        cursor = self.cursor
         for query in queries:
-            self.cursor.execute(query)
+            cursor.execute(query)
         self.conn.commit()
 
+    @contextmanager
+    def transaction(self):
+        """
+        Run a block of statements as one transaction with a single commit.
+
+        The outermost block takes the write lock up front (BEGIN IMMEDIATE) and
+        commits on success or rolls back on any exception. Nested blocks become
+        savepoints, so an inner failure can be caught without losing the outer
+        work. Yields the calling thread's cursor.
+        """
+        conn = self.conn
+        depth = self.manager.transaction_depth()
+        savepoint = f"sp_{depth}"
+        conn.execute("BEGIN IMMEDIATE" if depth == 0 else f"SAVEPOINT {savepoint}")
+        self.manager._set_transaction_depth(depth + 1)
+        try:
+            yield self.cursor
+        except BaseException:
+            self.manager._set_transaction_depth(depth)
+            # Callbacks registered inside this block are rolled back with it.
+            callbacks = self.manager._commit_callbacks()
+            callbacks[:] = [(level, callback) for level, callback in callbacks if level <= depth]
+            if depth == 0:
+                conn.rollback()
+            else:
+                conn.execute(f"ROLLBACK TO {savepoint}")
+                conn.execute(f"RELEASE {savepoint}")
+            raise
+        self.manager._set_transaction_depth(depth)
+        if depth == 0:
+            callbacks = self.manager._commit_callbacks()
+            pending = list(callbacks)
+            callbacks.clear()
+            conn.commit()
+            for _, callback in pending:
+                callback()
+        else:
+            conn.execute(f"RELEASE {savepoint}")
+
+    def after_commit(self, callback):
+        """
+        Call callback() once the calling thread's outermost transaction commits,
+        or right away outside a transaction. It is dropped if the transaction, or
+        the savepoint it was registered in, rolls back. Used for metrics that must
+        only count work that was actually recorded.
+        """
+        depth = self.manager.transaction_depth()
+        if depth == 0:
+            callback()
+        else:
+            self.manager._commit_callbacks().append((depth, callback))
+
+    def in_transaction(self):
+        """True if the calling thread is inside a Database.transaction() block."""
+        return self.manager.transaction_depth() > 0
+
     def execute_query(self, query, params=()):
-        """Execute a query and commit changes."""
+        """
+        Execute a query and commit changes.
+
+        Inside a transaction() block the statement joins that transaction and
+        errors are raised so the whole block rolls back.
+        """
+        if self.in_transaction():
+            self.cursor.execute(query, params)
+            return
+        conn = self.conn
         try:
             self.cursor.execute(query, params)
-            self.conn.commit()
+            conn.commit()
         except Exception as e:
             print(f"Error executing query: {e}")
-            self.conn.rollback()
+            if conn.in_transaction:
+                conn.rollback()
 
     def fetch_query(self, query, params=()):
         """Fetch query results."""
+        cursor = self.cursor
         try:
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
+            cursor.execute(query, params)
+            return cursor.fetchall()
         except Exception as e:
             print(f"Error fetching data: {e}")
             return []
 
+    def explain(self, query, params=()):
+        """Return the EXPLAIN QUERY PLAN detail lines for a query."""
+        cursor = self.cursor
+        cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        return [row[3] for row in cursor.fetchall()]
+
+    def pool_stats(self):
+        """Return the connection pool statistics for this database."""
+        return self.manager.stats()
+
+    def query_stats(self):
+        """Return per-statement timings and the slow-query log (see QueryStats.snapshot)."""
+        return self.manager.query_stats.snapshot()
+
+    def set_slow_query_threshold(self, seconds):
+        """Log statements slower than this many seconds from now on."""
+        self.manager.query_stats.slow_threshold = seconds
+
+    def dump_query_stats(self, path="query_stats.json"):
+        """Write query and pool statistics to a JSON file; returns the path, or None on error."""
+        stats = {"database": self.db_name, "pool": self.pool_stats(), **self.query_stats()}
+        try:
+            with open(path, "w") as f:
+                json.dump(stats, f, indent=2, default=str)
+        except OSError as e:
+            print(f"Error writing query stats: {e}")
+            return None
+        return path
+
     def close(self):
-        """Safely closes the database."""
+        """Safely releases this thread's connection back to the pool."""
+        try:
+            self.manager.release()
+            print("Database closed safely.")
+        except Exception as e:
+            print(f"Error closing database: {e}")
+
+    def shutdown(self):
+        """Close every pooled connection; call once when the program exits."""
         try:
-            self.conn.close()
+            self.manager.close_all()
             print("Database closed safely.")
         except Exception as e:
             print(f"Error closing database: {e}")
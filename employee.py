@@ -2,6 +2,11 @@ import hashlib
 from utils import generate_id
 from database import Database
 from utils import  safe_input
+from metrics import REGISTRY
+
+LOGINS = REGISTRY.counter("supermarket_logins_total", "Successful employee logins.")
+FAILED_LOGINS = REGISTRY.counter("supermarket_failed_logins_total", "Employee logins with a wrong ID or password.")
+LOCKOUTS = REGISTRY.counter("supermarket_login_lockouts_total", "Logins locked after three failed attempts.")
 
 
 class Employee:
@@ -154,12 +159,15 @@ class Employee:
             password = input("Enter Password: ").strip()
             status, role = self.verify_credentials(emp_id, password)
             if status == "success":
+                LOGINS.inc()
                 print(f" Logged in as {role}.")
                 return emp_id, role
             else:
+                FAILED_LOGINS.inc()
                 login_attempts += 1
                 print(f" Invalid credentials. Attempt {login_attempts}/3.")
                 if login_attempts >= 3:
+                    LOCKOUTS.inc()
                     if self.unlock_system():
                         login_attempts = 0
                         print(" System unlocked. Please try logging in again.")
@@ -1,7 +1,5 @@
 from inventory import Inventory
 from aisle import Aisle
-from xlsreader import *
-from generate_report import SalesReportGenerator
 from checkout import Checkout
 from database import  Database
 from employee import  Employee
@@ -63,10 +61,16 @@ def supermarket_employee():
                 chk.refund()
 
             elif choice == "6":
+                source = safe_input("Enter a workbook, directory or glob pattern (e.g. supermarket_data.xlsx): ")
+                if source is None:
+                    print("Returning to Employee Menu.")
+                    continue
                 try:
+                    # openpyxl is only imported when a file is actually loaded
+                    from xlsreader import XLSDatabaseLoader
                     loader = XLSDatabaseLoader()
-                    # Load data from an XLS file containing multiple sheets
-                    loader.load_xls_to_db("supermarket_data.xlsx")
+                    # Load every matching workbook as a delta; sheets are parsed in parallel
+                    loader.load_files(source, sync=True)
                     # Close connection
                     loader.close()
                 except Exception as e:
@@ -77,6 +81,8 @@ def supermarket_employee():
 
             elif choice == "8":
                 try:
+                    # pandas and openpyxl are only imported when a report is generated
+                    from generate_report import SalesReportGenerator
                     report_generator = SalesReportGenerator(db)
                     report_generator.generate_reports("sales_report.xlsx")
                 except Exception as e:
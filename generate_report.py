@@ -1,9 +1,136 @@
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+
 import pandas as pd
+from openpyxl import Workbook
+
+from archive import SalesArchive
+
+
+def sales_select(sales_table='sales', lines_table='sale_lines'):
+    """
+    Sales columns for the report sheets. The items column is rebuilt from the
+    lines table for display only; aggregates read sale lines directly.
+    """
+    return (
+        "SELECT id, employee_id, customer_id, "
+        "(SELECT group_concat(product_name || ':' || quantity || ':' || printf('%.2f', unit_price), ', ') "
+        f"FROM {lines_table} AS lines WHERE lines.sale_id = {sales_table}.id) AS items, "
+        "quantity, tax, discount, total, date, "
+        f"membership, reference_number, payment_method, remarks FROM {sales_table}"
+    )
+
+
+SALES_SELECT = sales_select()
+
+SALES_COLUMNS = ['id', 'employee_id', 'customer_id', 'items', 'quantity', 'tax',
+                 'discount', 'total', 'date', 'membership', 'reference_number',
+                 'payment_method', 'remarks']
+
+SHEETS = ['Today Sales', 'Weekly Sales', 'Top Products', 'Top Employees', 'Overall Insights']
+
+# Rows fetched from SQLite per fetchmany() call when streaming a report.
+STREAM_PAGE_SIZE = 5000
+
+# (sheet name, header, query) for the streaming report; every query is paged.
+STREAM_SHEETS = [
+    ('Today Sales', SALES_COLUMNS,
+     SALES_SELECT + " WHERE date >= date('now') AND date < date('now', '+1 day')"),
+    ('Weekly Sales', SALES_COLUMNS,
+     SALES_SELECT + " WHERE date >= date('now', '-7 days')"),
+    ('Top Products', ['Product', 'Total Quantity Sold'],
+     "SELECT product_name, SUM(quantity) AS sold FROM product_daily_sales "
+     "GROUP BY product_name ORDER BY sold DESC"),
+    ('Top Employees', ['employee_id', 'sales_count', 'total_sales'],
+     "SELECT employee_id, SUM(sales_count), SUM(total) AS total_sales FROM employee_daily_sales "
+     "GROUP BY employee_id ORDER BY total_sales DESC"),
+    ('Overall Insights', ['Overall Total Sales', 'Average Sale Amount', 'Total Transactions'],
+     "SELECT COALESCE(SUM(total), 0), "
+     "CASE WHEN SUM(transactions) > 0 THEN SUM(total) / SUM(transactions) ELSE 0 END, "
+     "COALESCE(SUM(transactions), 0) FROM daily_sales_summary"),
+]
+
+
+def load_sales_frame(rows):
+    """
+    Build a sales DataFrame with numeric dtypes enforced: quantity, tax,
+    discount and total become numbers (unparseable values become NaN) and
+    date becomes a datetime, so aggregates never run on strings.
+    """
+    df = pd.DataFrame(rows, columns=SALES_COLUMNS)
+    df['id'] = pd.to_numeric(df['id'], errors='coerce').astype('Int64')
+    df['quantity'] = pd.to_numeric(df['quantity'], errors='coerce').astype('Int64')
+    for column in ('tax', 'discount', 'total'):
+        df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    return df
+
+
+def report_window_masks(dates, now=None):
+    """
+    Boolean masks selecting today's sales and the last 7 days, matching the
+    SQL filters date('now') and date('now', '-7 days') (UTC day boundaries).
+    """
+    now = pd.Timestamp.now(tz='UTC').tz_localize(None) if now is None else pd.Timestamp(now)
+    today = now.normalize()
+    today_mask = (dates >= today) & (dates < today + pd.Timedelta(days=1))
+    weekly_mask = dates >= today - pd.Timedelta(days=7)
+    return today_mask, weekly_mask
+
+
+# Columns exported per day partition by SalesReportGenerator.export_history.
+# Formatted with the sales and lines table names (see archive.SalesArchive.history).
+EXPORT_SALES_SELECT = (
+    "SELECT id, employee_id, customer_id, quantity, tax, discount, total, date, "
+    "membership, reference_number, payment_method, remarks FROM {sales} "
+    "WHERE date >= ? AND date < date(?, '+1 day') ORDER BY id"
+)
+EXPORT_LINES_SELECT = (
+    "SELECT lines.id, lines.sale_id, lines.product_id, lines.product_name, "
+    "lines.quantity, lines.unit_price, s.date FROM {lines} AS lines "
+    "JOIN {sales} AS s ON s.id = lines.sale_id "
+    "WHERE s.date >= ? AND s.date < date(?, '+1 day') ORDER BY lines.id"
+)
+MANIFEST_FILE = 'manifest.json'
+
+
+def parquet_available():
+    """Return True if pandas can write Parquet (pyarrow or fastparquet installed)."""
+    for module in ('pyarrow', 'fastparquet'):
+        try:
+            __import__(module)
+            return True
+        except ImportError:
+            continue
+    return False
+
+
+def _write_partition(df, path, file_format):
+    """Write one partition file atomically (temp file, then rename)."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + '.tmp'
+    if file_format == 'parquet':
+        df.to_parquet(temp_path, index=False)
+    else:
+        df.to_csv(temp_path, index=False, compression='gzip')
+    os.replace(temp_path, path)
+
+
 class SalesReportGenerator:
-    def __init__(self, db):
+    def __init__(self, db, use_rollups=True):
+        """
+        Args:
+            db (Database): Database to report on.
+            use_rollups (bool): Read insights from the daily rollup tables (migration 6).
+                When False, sales are fetched once and every sheet is computed from
+                that single frame.
+        """
         self.db = db
+        self.use_rollups = use_rollups
 
-    def generate_reports(self, output_file='sales_report.xlsx'):
+    def generate_reports(self, output_file='sales_report.xlsx', streaming=False):
         """
         Generates an Excel file with multiple sheets:
           - Today Sales
@@ -11,129 +138,306 @@ class SalesReportGenerator:
           - Top Products
           - Top Employees
           - Overall Insights
+
+        With streaming=True the file is written by stream_reports instead, in
+        bounded memory.
         """
+        if streaming:
+            self.stream_reports(output_file)
+            return
+        sheets = self.build_report()
+        if sheets is None:
+            return
+
+        # -----------------------------
+        # Write all DataFrames to an Excel file with multiple sheets.
+        # -----------------------------
+        try:
+            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+                for sheet_name in SHEETS:
+                    sheets[sheet_name].to_excel(writer, sheet_name=sheet_name, index=False)
+            print(f"Sales report generated: {output_file}")
+        except Exception as e:
+            print(f"Error writing Excel file: {e}")
+
+    def stream_reports(self, output_file='sales_report.xlsx', page_size=STREAM_PAGE_SIZE):
+        """
+        Write the report sheets straight from SQLite to a write-only workbook.
+
+        Rows are paged out with fetchmany(page_size) and appended to openpyxl
+        write-only sheets, which spill to disk as they go, so peak memory is
+        bounded by the page size rather than the number of sales. Insights come
+        from the rollup tables. Values are written as stored (dates as text).
+
+        Returns:
+            dict: Rows written per sheet, or None if the report could not be written.
+        """
+        workbook = Workbook(write_only=True)
+        rows_written = {}
+        cursor = self.db.conn.cursor()
+        try:
+            for sheet_name, header, query in STREAM_SHEETS:
+                sheet = workbook.create_sheet(sheet_name)
+                sheet.append(header)
+                count = 0
+                cursor.execute(query)
+                while True:
+                    rows = cursor.fetchmany(page_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        sheet.append(row)
+                    count += len(rows)
+                rows_written[sheet_name] = count
+            workbook.save(output_file)
+            print(f"Sales report generated: {output_file}")
+            return rows_written
+        except Exception as e:
+            print(f"Error writing Excel file: {e}")
+            return None
+        finally:
+            cursor.close()
+
+    def export_history(self, output_dir='sales_export', file_format=None):
+        """
+        Export sales and sale lines as day-partitioned Parquet or gzipped CSV
+        for analytics tools:
+
+            <output_dir>/sales/date=YYYY-MM-DD/part.parquet
+            <output_dir>/sale_lines/date=YYYY-MM-DD/part.parquet
+            <output_dir>/manifest.json
+
+        Only days with sales newer than the manifest's high-water mark (the
+        largest sales.id exported so far) are rewritten; each of those day
+        partitions is rewritten whole, so re-running is safe. Later edits to
+        already-exported rows (e.g. refund remarks) are not picked up.
+
+        Args:
+            output_dir (str): Export directory; created if missing.
+            file_format (str, optional): "parquet" or "csv". Defaults to the format
+                of an existing export, else Parquet when pyarrow/fastparquet is
+                installed, else CSV.
+
+        Returns:
+            dict: The manifest written, or None if the export failed.
+        """
+        manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+        manifest = {'format': None, 'high_water_mark': 0, 'partitions': {'sales': {}, 'sale_lines': {}}}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+
+        file_format = file_format or manifest['format'] or ('parquet' if parquet_available() else 'csv')
+        if file_format not in ('parquet', 'csv'):
+            print(f"Error: unknown export format '{file_format}'. Use 'parquet' or 'csv'.")
+            return None
+        if file_format == 'parquet' and not parquet_available():
+            print("Error: Parquet export needs pyarrow (pip install pyarrow). Use file_format='csv' instead.")
+            return None
+        if manifest['format'] not in (None, file_format):
+            print(f"Error: {output_dir} holds a {manifest['format']} export; use a new directory for {file_format}.")
+            return None
+        extension = 'parquet' if file_format == 'parquet' else 'csv.gz'
+
+        try:
+            # Archived sales are included so a first export covers all history.
+            with SalesArchive(self.db).history() as (sales_table, lines_table, _):
+                high_water_mark = manifest['high_water_mark']
+                new_mark, = self.db.fetch_query(f"SELECT COALESCE(MAX(id), 0) FROM {sales_table}")[0]
+                changed_days = [row[0] for row in self.db.fetch_query(
+                    f"SELECT DISTINCT date(date) FROM {sales_table} WHERE id > ? AND date IS NOT NULL ORDER BY 1",
+                    (high_water_mark,)
+                )]
+                for day in changed_days:
+                    for table, query in (('sales', EXPORT_SALES_SELECT), ('sale_lines', EXPORT_LINES_SELECT)):
+                        query = query.format(sales=sales_table, lines=lines_table)
+                        df = pd.read_sql_query(query, self.db.conn, params=(day, day))
+                        relative_path = os.path.join(table, f"date={day}", f"part.{extension}")
+                        _write_partition(df, os.path.join(output_dir, relative_path), file_format)
+                        manifest['partitions'][table][day] = {'file': relative_path, 'rows': len(df)}
+        except Exception as e:
+            print(f"Error exporting sales history: {e}")
+            return None
+
+        manifest['format'] = file_format
+        manifest['high_water_mark'] = new_mark
+        manifest['exported_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        manifest['changed_partitions'] = changed_days
+        temp_path = manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(temp_path, manifest_path)
+        print(f"Exported {len(changed_days)} changed day partitions to {output_dir} ({file_format}).")
+        return manifest
+
+    def build_report(self, now=None):
+        """
+        Compute the report sheets without writing them.
+
+        Returns:
+            dict: Sheet name -> DataFrame, or None if the sales data could not be loaded.
+        """
+        if self.use_rollups:
+            return self._build_from_rollups()
+        return self._build_single_pass(now)
+
+    def _build_from_rollups(self):
         # -----------------------------
         # Fetch sales data from the database
         # -----------------------------
         try:
-            query_today = (
-                "SELECT id, employee_id, customer_id, items, quantity, tax, discount, total, date, "
-                "membership, reference_number, payment_method, remarks FROM sales "
-                "WHERE date(date)=date('now')"
-            )
+            query_today = SALES_SELECT + " WHERE date >= date('now') AND date < date('now', '+1 day')"
             today_sales = self.db.fetch_query(query_today)
         except Exception as e:
             print(f"Error fetching today's sales: {e}")
             today_sales = []
 
         try:
-            query_weekly = (
-                "SELECT id, employee_id, customer_id, items, quantity, tax, discount, total, date, "
-                "membership, reference_number, payment_method, remarks FROM sales "
-                "WHERE date(date) >= date('now', '-7 days')"
-            )
+            query_weekly = SALES_SELECT + " WHERE date >= date('now', '-7 days')"
             weekly_sales = self.db.fetch_query(query_weekly)
         except Exception as e:
             print(f"Error fetching weekly sales: {e}")
             weekly_sales = []
 
-        try:
-            query_all = (
-                "SELECT id, employee_id, customer_id, items, quantity, tax, discount, total, date, "
-                "membership, reference_number, payment_method, remarks FROM sales"
-            )
-            all_sales = self.db.fetch_query(query_all)
-        except Exception as e:
-            print(f"Error fetching overall sales: {e}")
-            all_sales = []
-
         # -----------------------------
         # Create DataFrames from the fetched data
         # -----------------------------
-        columns_sales = ['id', 'employee_id', 'customer_id', 'items', 'quantity', 'tax',
-                         'discount', 'total', 'date', 'membership', 'reference_number',
-                         'payment_method', 'remarks']
         try:
-            df_today = pd.DataFrame(today_sales, columns=columns_sales)
-            df_weekly = pd.DataFrame(weekly_sales, columns=columns_sales)
-            df_all = pd.DataFrame(all_sales, columns=columns_sales)
+            df_today = load_sales_frame(today_sales)
+            df_weekly = load_sales_frame(weekly_sales)
         except Exception as e:
             print(f"Error creating DataFrames: {e}")
-            return
+            return None
 
         # -----------------------------
-        # Generate overall insights
+        # Generate overall insights from the daily rollup tables (migration 6),
+        # which grow by a few rows per day rather than one per sale.
         # -----------------------------
 
-        # 1. Top Products: Aggregate quantity sold per product.
-        product_sales = {}
+        # 1. Top Products: Aggregate quantity sold per product (refund lines are negative).
         try:
-            for items_str in df_all['items']:
-                if not items_str:
-                    continue
-                # Expected format: "apple:2:1.00, banana:3:0.50" (each token: name:quantity:sold_price)
-                for part in items_str.split(','):
-                    part = part.strip()
-                    if not part:
-                        continue
-                    tokens = part.split(':')
-                    if len(tokens) >= 2:
-                        product_name = tokens[0].strip()
-                        try:
-                            quantity = int(tokens[1].strip())
-                        except ValueError:
-                            continue
-                        product_sales[product_name] = product_sales.get(product_name, 0) + quantity
-            df_product_sales = pd.DataFrame(list(product_sales.items()),
-                                            columns=['Product', 'Total Quantity Sold'])
-            df_product_sales.sort_values(by='Total Quantity Sold', ascending=False, inplace=True)
+            product_sales = self.db.fetch_query(
+                "SELECT product_name, SUM(quantity) AS sold FROM product_daily_sales "
+                "GROUP BY product_name ORDER BY sold DESC"
+            )
+            df_product_sales = pd.DataFrame(product_sales, columns=['Product', 'Total Quantity Sold'])
         except Exception as e:
             print(f"Error generating top products data: {e}")
             df_product_sales = pd.DataFrame(columns=['Product', 'Total Quantity Sold'])
 
         # 2. Top Employees: Which employee made the most sales.
         try:
-            df_emp = df_all[df_all['employee_id'].notna()].copy()
-            if not df_emp.empty:
-                # Convert employee_id to integer for grouping
-                df_emp['employee_id'] = df_emp['employee_id']
-                df_emp_grouped = df_emp.groupby('employee_id').agg(
-                    sales_count=('id', 'count'),
-                    total_sales=('total', 'sum')
-                ).reset_index()
-                df_emp_grouped.sort_values(by='total_sales', ascending=False, inplace=True)
-            else:
-                df_emp_grouped = pd.DataFrame(columns=['employee_id', 'sales_count', 'total_sales'])
+            employee_sales = self.db.fetch_query(
+                "SELECT employee_id, SUM(sales_count), SUM(total) AS total_sales FROM employee_daily_sales "
+                "GROUP BY employee_id ORDER BY total_sales DESC"
+            )
+            df_emp_grouped = pd.DataFrame(employee_sales, columns=['employee_id', 'sales_count', 'total_sales'])
         except Exception as e:
             print(f"Error generating top employees data: {e}")
             df_emp_grouped = pd.DataFrame(columns=['employee_id', 'sales_count', 'total_sales'])
 
         # 3. Overall Insights: Total sales, average sale, and number of transactions.
         try:
-            overall_total_sales = df_all['total'].sum() if not df_all.empty else 0
-            average_sale = df_all['total'].mean() if not df_all.empty else 0
-            total_transactions = len(df_all)
-            insights_data = {
+            total_transactions, overall_total_sales = self.db.fetch_query(
+                "SELECT COALESCE(SUM(transactions), 0), COALESCE(SUM(total), 0) FROM daily_sales_summary"
+            )[0]
+            average_sale = overall_total_sales / total_transactions if total_transactions else 0
+            df_overall = pd.DataFrame({
                 'Overall Total Sales': [overall_total_sales],
                 'Average Sale Amount': [average_sale],
                 'Total Transactions': [total_transactions]
-            }
-            df_overall = pd.DataFrame(insights_data)
+            })
         except Exception as e:
             print(f"Error generating overall insights: {e}")
             df_overall = pd.DataFrame()
 
+        return {
+            'Today Sales': df_today,
+            'Weekly Sales': df_weekly,
+            'Top Products': df_product_sales,
+            'Top Employees': df_emp_grouped,
+            'Overall Insights': df_overall,
+        }
+
+    def _build_single_pass(self, now=None):
         # -----------------------------
-        # Write all DataFrames to an Excel file with multiple sheets.
+        # Fetch all sales once, archived history included; every sheet is
+        # derived from this frame.
         # -----------------------------
         try:
-            with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
-                df_today.to_excel(writer, sheet_name='Today Sales', index=False)
-                df_weekly.to_excel(writer, sheet_name='Weekly Sales', index=False)
-                df_product_sales.to_excel(writer, sheet_name='Top Products', index=False)
-                df_emp_grouped.to_excel(writer, sheet_name='Top Employees', index=False)
-                df_overall.to_excel(writer, sheet_name='Overall Insights', index=False)
-            print(f"Sales report generated: {output_file}")
+            with SalesArchive(self.db).history() as (sales_table, lines_table, _):
+                df_all = load_sales_frame(self.db.fetch_query(sales_select(sales_table, lines_table)))
+                # 1. Top Products: Aggregate quantity sold per product (refund lines are negative),
+                # from the lines themselves; the items column is display-only and cannot be split
+                # back reliably (product names may contain ',' or ':').
+                try:
+                    product_sales = self.db.fetch_query(
+                        f"SELECT product_name, SUM(quantity) AS sold FROM {lines_table} "
+                        "GROUP BY product_name ORDER BY sold DESC"
+                    )
+                    df_product_sales = pd.DataFrame(product_sales, columns=['Product', 'Total Quantity Sold'])
+                except Exception as e:
+                    print(f"Error generating top products data: {e}")
+                    df_product_sales = pd.DataFrame(columns=['Product', 'Total Quantity Sold'])
         except Exception as e:
-            print(f"Error writing Excel file: {e}")
+            print(f"Error fetching sales: {e}")
+            return None
+
+        today_mask, weekly_mask = report_window_masks(df_all['date'], now)
+        df_today = df_all[today_mask].reset_index(drop=True)
+        df_weekly = df_all[weekly_mask].reset_index(drop=True)
+
+        # 2. Top Employees: Which employee made the most sales.
+        try:
+            df_emp_grouped = (
+                df_all[df_all['employee_id'].notna()]
+                .groupby('employee_id', sort=False)
+                .agg(sales_count=('id', 'count'), total_sales=('total', 'sum'))
+                .reset_index()
+                .sort_values(by='total_sales', ascending=False, kind='stable')
+                .reset_index(drop=True)
+            )
+        except Exception as e:
+            print(f"Error generating top employees data: {e}")
+            df_emp_grouped = pd.DataFrame(columns=['employee_id', 'sales_count', 'total_sales'])
+
+        # 3. Overall Insights: Total sales, average sale, and number of transactions.
+        total_transactions = len(df_all)
+        overall_total_sales = float(df_all['total'].sum())
+        df_overall = pd.DataFrame({
+            'Overall Total Sales': [overall_total_sales],
+            'Average Sale Amount': [overall_total_sales / total_transactions if total_transactions else 0],
+            'Total Transactions': [total_transactions]
+        })
+
+        return {
+            'Today Sales': df_today,
+            'Weekly Sales': df_weekly,
+            'Top Products': df_product_sales,
+            'Top Employees': df_emp_grouped,
+            'Overall Insights': df_overall,
+        }
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Generate the sales report or export sales history.")
+    parser.add_argument("--db", default="supermarket.db", help="Database file (default: supermarket.db)")
+    parser.add_argument("--output", default="sales_report.xlsx", help="Excel report file")
+    parser.add_argument("--streaming", action="store_true", help="Write the Excel report in bounded memory")
+    parser.add_argument("--export", metavar="DIR", help="Export day-partitioned sales history to DIR instead")
+    parser.add_argument("--format", choices=["parquet", "csv"], help="Export format (default: parquet if available)")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    generator = SalesReportGenerator(db)
+    if args.export:
+        generator.export_history(args.export, args.format)
+    else:
+        generator.generate_reports(args.output, streaming=args.streaming)
+    db.shutdown()
+
 
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
+import sqlite3
+
 from database import Database
 from aisle import Aisle
+from catalog import ProductCatalog
 from utils import generate_id, safe_input
+from metrics import REGISTRY
+
+PRODUCTS_ADDED = REGISTRY.counter("supermarket_products_added_total", "Products added to the inventory.")
+RESTOCKED_UNITS = REGISTRY.counter("supermarket_restocked_units_total", "Units added by stock updates.")
 
 
 class Inventory:
-    def __init__(self):
+    def __init__(self, writer=None):
         self.db = Database()
         self.aisle_manager = Aisle()
+        self.catalog = ProductCatalog.for_database(self.db)
+        self.writer = writer
 
     def add_product(self,role):
         """
@@ -51,6 +60,12 @@ class Inventory:
         category = category.strip()
         aisle_name = aisle_name.strip()
 
+        # Product names are unique (migration 3); refuse before allocating an ID or creating an aisle
+        existing = self.db.fetch_query("SELECT id FROM inventory WHERE name = ?", (name,))
+        if existing:
+            print(f" Error: A product named '{name}' already exists (ID: {existing[0][0]}).")
+            return False
+
         # Check if aisle exists; if not, only a Manager can create it
         try:
             aisle_exists = self.aisle_manager.aisle_exists(aisle_name)
@@ -76,8 +91,6 @@ class Inventory:
                 "INSERT INTO inventory (id, name, category, quantity, price, aisle_name) "
                 "VALUES (?, ?, ?, ?, ?, ?)"
             )
-            self.db.execute_query(query, (product_id, name, category, quantity, price, aisle_name))
-
             # Update the aisle's product list without leaving trailing commas
             update_aisle_query = (
                 "UPDATE aisles "
@@ -85,10 +98,19 @@ class Inventory:
                 "CASE WHEN product_name IS NULL OR TRIM(product_name) = '' THEN '' ELSE ', ' END || ?) "
                 "WHERE name = ?"
             )
-            self.db.execute_query(update_aisle_query, (name, aisle_name))
+            # Insert and aisle update commit together, or not at all
+            with self.db.transaction() as cursor:
+                cursor.execute(query, (product_id, name, category, quantity, price, aisle_name))
+                cursor.execute(update_aisle_query, (name, aisle_name))
+            self.catalog.invalidate()
+            PRODUCTS_ADDED.inc()
 
             print(f" Product '{name}' added to Aisle '{aisle_name}' with ID: {product_id}.")
             return True
+        except sqlite3.IntegrityError as e:
+            # Another till added the same name since the check above
+            print(f" Error: Could not add product '{name}': {e}.")
+            return False
         except Exception as e:
             print(f" An error occurred while adding the product: {e}")
             return False
@@ -126,11 +148,21 @@ class Inventory:
             product_id = product_id.strip()
             try:
                 query = "UPDATE inventory SET quantity = quantity + ? WHERE id=?"
-                self.db.execute_query(query, (quantity, product_id))
-                print(f" Stock updated for Product ID: {product_id}.")
-                break  # Exit loop after successful update
+                if self.writer is not None:
+                    updated = self.writer.execute(query, (quantity, product_id)).result()
+                else:
+                    with self.db.transaction() as cursor:
+                        updated = cursor.execute(query, (quantity, product_id)).rowcount
             except Exception as e:
                 print(f" Error updating stock: {e}")
+                continue
+            if not updated:
+                print(f" Error: No product found with ID: {product_id}.")
+                continue
+            self.catalog.invalidate()
+            RESTOCKED_UNITS.inc(quantity)
+            print(f" Stock updated for Product ID: {product_id}.")
+            break  # Exit loop after successful update
 
 
 def get_input_add_product():
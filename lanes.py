@@ -0,0 +1,109 @@
+"""
+Checkout Lanes Module
+
+This module runs several checkout lanes (tills) at the same time against one
+database. Each lane is a worker thread with its own pooled connection and
+processes orders through Checkout.checkout_order.
+
+Two lanes can price the same cart at the same time, so the stock check at
+pricing time is only advisory. Checkout.reserve_stock decrements stock with
+a conditional UPDATE (WHERE quantity >= requested) inside the checkout
+transaction, which SQLite serialises with BEGIN IMMEDIATE. The losing cart is
+rejected, or with allow_partial sold with whatever stock is left. Stock can
+never go negative.
+
+With group_commit=True the lanes hand their writes to a GroupCommitWriter, so
+sales from many lanes share one commit (and one fsync) instead of queueing on
+the write lock one commit at a time.
+
+Usage:
+    with CheckoutLanes(lanes=4) as lanes:
+        summary = lanes.run(orders)
+
+Dependencies:
+- Checkout: Pricing, payment rules, stock reservation and sale recording.
+- GroupCommitWriter: Optional shared writer thread for group commits.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from checkout import Checkout
+from writer import GroupCommitWriter
+
+DEFAULT_LANES = 4
+
+
+class CheckoutLanes:
+    """
+    A pool of concurrent checkout lanes sharing one database.
+
+    Attributes:
+        checkout (Checkout): Checkout shared by all lanes.
+        lanes (int): Number of lanes (worker threads).
+        allow_partial (bool): Sell what is in stock instead of rejecting short orders.
+        writer (GroupCommitWriter): Writer owned by the lanes when group_commit is set, else None.
+    """
+
+    def __init__(self, lanes=DEFAULT_LANES, db_name="supermarket.db", allow_partial=False, checkout=None,
+                 group_commit=False):
+        if lanes < 1:
+            raise ValueError("lanes must be at least 1")
+        self.writer = None
+        if checkout is None:
+            if group_commit:
+                self.writer = GroupCommitWriter(db_name)
+            checkout = Checkout(db_name, writer=self.writer)
+        self.checkout = checkout
+        self.db = self.checkout.db
+        self.lanes = lanes
+        self.allow_partial = allow_partial
+        self._executor = ThreadPoolExecutor(max_workers=lanes, thread_name_prefix="lane")
+
+    def _checkout_order(self, order):
+        try:
+            return self.checkout.checkout_order(order, allow_partial=self.allow_partial)
+        finally:
+            # Hand the connection back so lanes beyond the pool size can take a turn.
+            self.db.manager.release()
+
+    def submit(self, order):
+        """Queue an order on the next free lane; returns a Future of its result dict."""
+        return self._executor.submit(self._checkout_order, order)
+
+    def run(self, orders):
+        """
+        Check out every order across all lanes and wait for them to finish.
+
+        Returns:
+            dict: Counts of succeeded/rejected/failed orders, elapsed seconds,
+                  orders_per_second and the per-order results in input order.
+        """
+        started = time.perf_counter()
+        futures = [self.submit(order) for order in orders]
+        results = [future.result() for future in futures]
+        elapsed = time.perf_counter() - started
+
+        statuses = [result["status"] for result in results]
+        return {
+            "lanes": self.lanes,
+            "orders": len(results),
+            "succeeded": statuses.count("ok"),
+            "rejected": statuses.count("rejected"),
+            "failed": len(statuses) - statuses.count("ok") - statuses.count("rejected"),
+            "elapsed_seconds": elapsed,
+            "orders_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+            "results": results,
+        }
+
+    def close(self):
+        """Wait for queued orders and stop the lanes (and their writer, if any)."""
+        self._executor.shutdown(wait=True)
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,15 +1,38 @@
+import os
+import signal
+
 from supermarket import supermarket_program
 from database import Database
+from metrics import METRICS_FILE, REGISTRY
+from tracing import TRACER
+
+QUERY_STATS_FILE = "query_stats.json"
+TRACE_FILE = "trace.json"
+# Set to serve Prometheus metrics at http://127.0.0.1:<port>/metrics.
+METRICS_PORT = os.environ.get("SUPERMARKET_METRICS_PORT")
 
 def main():
     db = Database()  # Initialize database
 
+    # `kill -USR1 <pid>` dumps per-query timings, the slow-query log and the store metrics of a running till.
+    def dump_stats(signum, frame):
+        db.dump_query_stats(QUERY_STATS_FILE)
+        REGISTRY.dump(METRICS_FILE)
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, dump_stats)
+    # `kill -USR2 <pid>` writes the sampled checkout/refund spans (SUPERMARKET_TRACE_SAMPLE) for Perfetto.
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda signum, frame: TRACER.export_chrome_trace(TRACE_FILE))
+    if METRICS_PORT:
+        REGISTRY.serve(int(METRICS_PORT))
+
     try:
         supermarket_program()  # Start the supermarket system
     except KeyboardInterrupt:
         print("\n\n Program interrupted! Closing gracefully...")
     finally:
-        db.close() # Ensure database5 connection is closed properly
+        db.shutdown()  # Ensure every pooled connection is closed properly
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,373 @@
+"""
+Metrics Module
+
+This module provides lightweight in-process metrics used to tune and monitor
+the system.
+
+Counter only goes up (sales, revenue, failed logins); Gauge is set to a value
+or computed by a function when read; Histogram counts observations into
+fixed upper-bound buckets (cumulative on export, Prometheus-style) and tracks
+count, sum and max. Percentiles are estimated from the buckets.
+
+Updates are cheap enough for the checkout path: counters and histograms
+write to a per-thread cell that only their own thread touches, so updating
+them never takes a shared lock. Reads add the cells up, folding in the cells
+of finished threads.
+
+MetricsRegistry names the metrics and exports them in the Prometheus text
+format, served over HTTP by serve() or written to a file by dump() (e.g. for
+node_exporter's textfile collector). REGISTRY is the process-wide registry
+the store modules report to.
+
+Usage:
+    from metrics import REGISTRY
+    SALES = REGISTRY.counter("supermarket_sales_total", "Sales recorded.")
+    SALES.inc()
+    REGISTRY.serve(9108)
+"""
+
+import bisect
+import math
+import os
+import threading
+
+# Upper bounds in seconds for latency histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Upper bounds in seconds for long-running jobs such as imports
+JOB_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Upper bounds for batch-size histograms
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+DEFAULT_METRICS_PORT = 9108
+METRICS_FILE = "metrics.prom"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _ThreadCells:
+    """Per-thread mutable cells: each thread writes only its own, readers add them up."""
+
+    def __init__(self, new_cell):
+        self._new_cell = new_cell
+        self._local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock()
+
+    def cell(self):
+        """Return the calling thread's cell, creating it on first use."""
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+            with self._lock:
+                self._cells.append((threading.current_thread(), cell))
+            self._local.cell = cell
+            return cell
+
+    def collect(self, retire):
+        """Pass cells of finished threads to retire(cell) and drop them; return the live cells."""
+        with self._lock:
+            live = []
+            for thread, cell in self._cells:
+                if thread.is_alive():
+                    live.append((thread, cell))
+                else:
+                    retire(cell)
+            self._cells = live
+            return [cell for _, cell in live]
+
+
+class Counter:
+    """
+    Monotonic counter.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): One-line description.
+    """
+    kind = "counter"
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help = help_text
+        self._cells = _ThreadCells(lambda: [0])
+        self._retired = 0
+
+    def inc(self, amount=1):
+        """Add amount (default 1); amount must not be negative."""
+        self._cells.cell()[0] += amount
+
+    def _retire(self, cell):
+        self._retired += cell[0]
+
+    def value(self):
+        """Return the current total."""
+        cells = self._cells.collect(self._retire)
+        return self._retired + sum(cell[0] for cell in cells)
+
+    def samples(self):
+        return [(self.name, "", self.value())]
+
+    def snapshot(self):
+        return self.value()
+
+
+class Gauge:
+    """
+    Value that can go up and down, or be computed by a function at read time.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): One-line description.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help_text="", function=None):
+        self.name = name
+        self.help = help_text
+        self.function = function
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        """Set the gauge."""
+        self._value = value
+
+    def inc(self, amount=1):
+        """Add amount (negative to decrease)."""
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        """Subtract amount."""
+        self.inc(-amount)
+
+    def value(self):
+        """Return the current value, calling function if the gauge has one."""
+        if self.function is not None:
+            try:
+                return self.function()
+            except Exception:
+                return math.nan
+        return self._value
+
+    def samples(self):
+        return [(self.name, "", self.value())]
+
+    def snapshot(self):
+        return self.value()
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram.
+
+    Attributes:
+        buckets (tuple): Sorted bucket upper bounds; larger values go to +Inf.
+        name (str): Metric name, when registered.
+        help (str): One-line description.
+    """
+    kind = "histogram"
+
+    def __init__(self, buckets=LATENCY_BUCKETS, name=None, help_text=""):
+        self.buckets = tuple(sorted(buckets))
+        self.name = name
+        self.help = help_text
+        # Cell layout: [bucket counts, count, sum, max]
+        self._cells = _ThreadCells(lambda: [[0] * (len(self.buckets) + 1), 0, 0.0, 0.0])
+        self._retired = [[0] * (len(self.buckets) + 1), 0, 0.0, 0.0]
+
+    def observe(self, value):
+        """Record one observation."""
+        cell = self._cells.cell()
+        cell[0][bisect.bisect_left(self.buckets, value)] += 1
+        cell[1] += 1
+        cell[2] += value
+        if value > cell[3]:
+            cell[3] = value
+
+    def _retire(self, cell):
+        self._merge(self._retired, cell)
+
+    @staticmethod
+    def _merge(total, cell):
+        counts = total[0]
+        for i, count in enumerate(cell[0]):
+            counts[i] += count
+        total[1] += cell[1]
+        total[2] += cell[2]
+        total[3] = max(total[3], cell[3])
+
+    def _totals(self):
+        """Return (bucket counts, count, sum, max) over every thread."""
+        cells = self._cells.collect(self._retire)
+        total = [list(self._retired[0]), self._retired[1], self._retired[2], self._retired[3]]
+        for cell in cells:
+            self._merge(total, cell)
+        return total
+
+    def _estimate(self, fraction, counts, total, maximum):
+        if total == 0:
+            return 0.0
+        rank = fraction * total
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, maximum)
+        return maximum
+
+    def percentile(self, fraction):
+        """
+        Estimate a percentile (fraction between 0 and 1) as the upper bound of the
+        bucket it falls in; the +Inf bucket reports the observed max.
+        """
+        counts, total, _, maximum = self._totals()
+        return self._estimate(fraction, counts, total, maximum)
+
+    def snapshot(self):
+        """
+        Return the histogram as a dict with cumulative bucket counts keyed by
+        upper bound (plus "+Inf"), count, sum, max and p50/p95/p99 estimates.
+        """
+        counts, total, value_sum, maximum = self._totals()
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets, counts):
+            running += count
+            cumulative[bound] = running
+        cumulative["+Inf"] = total
+        return {
+            "buckets": cumulative,
+            "count": total,
+            "sum": value_sum,
+            "max": maximum,
+            "p50": self._estimate(0.50, counts, total, maximum),
+            "p95": self._estimate(0.95, counts, total, maximum),
+            "p99": self._estimate(0.99, counts, total, maximum),
+        }
+
+    def samples(self):
+        snapshot = self.snapshot()
+        samples = [(f"{self.name}_bucket", f'le="{_format_value(bound)}"', count)
+                   for bound, count in snapshot["buckets"].items()]
+        samples.append((f"{self.name}_sum", "", snapshot["sum"]))
+        samples.append((f"{self.name}_count", "", snapshot["count"]))
+        return samples
+
+
+def _format_value(value):
+    """Format a number the way the Prometheus text format expects."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if math.isnan(value):
+            return "NaN"
+    return repr(value)
+
+
+class MetricsRegistry:
+    """Named metrics with Prometheus text export."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name, kind, create):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = create()
+                self._metrics[name] = metric
+            elif metric.kind != kind:
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}.")
+            return metric
+
+    def counter(self, name, help_text=""):
+        """Return the counter called name, creating it on first use."""
+        return self._get_or_create(name, "counter", lambda: Counter(name, help_text))
+
+    def gauge(self, name, help_text="", function=None):
+        """Return the gauge called name, creating it on first use."""
+        return self._get_or_create(name, "gauge", lambda: Gauge(name, help_text, function))
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        """Return the histogram called name, creating it on first use."""
+        return self._get_or_create(name, "histogram", lambda: Histogram(buckets, name, help_text))
+
+    def snapshot(self):
+        """Return every metric's current value (histograms as Histogram.snapshot() dicts) by name."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            if metric.help:
+                lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, labels, value in metric.samples():
+                labels = f"{{{labels}}}" if labels else ""
+                lines.append(f"{sample_name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=METRICS_FILE):
+        """
+        Write render() to path, replacing it atomically so scrapers never see a
+        partial file. Returns the path, or None on error.
+        """
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w") as f:
+                f.write(self.render())
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f" Error writing metrics: {e}")
+            return None
+        return path
+
+    def serve(self, port=DEFAULT_METRICS_PORT, host="127.0.0.1"):
+        """
+        Serve render() at http://host:port/metrics from a daemon thread.
+
+        Returns:
+            ThreadingHTTPServer: The running server (call shutdown() to stop it),
+                                 or None if the port could not be bound.
+        """
+        # Imported here so the till does not pay for http.server unless metrics are served.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f" Error starting metrics endpoint on {host}:{port}: {e}")
+            return None
+        server.daemon_threads = True
+        thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+        thread.start()
+        return server
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,405 @@
+"""
+Schema Migrations Module
+
+This module keeps the database schema up to date. Every change to an existing
+table is an ordered, numbered upgrade step; the schema_version table records
+which steps have run, so each one is applied exactly once per database file.
+
+Migrations run at startup from Database.setup_database(). To inspect a
+database from the command line:
+
+    python migrations.py status             # applied / pending migrations
+    python migrations.py explain            # EXPLAIN QUERY PLAN for each hot query
+
+Dependencies:
+- Database: Handles database interactions.
+"""
+
+import argparse
+import ast
+import re
+
+
+def _backfill_sale_lines(cursor):
+    """
+    Create sale_lines rows for sales recorded with the legacy "name:qty:price"
+    items string. Sales that already have lines are left untouched.
+    """
+    legacy_sales = cursor.execute(
+        "SELECT id, items, payment_method FROM sales "
+        "WHERE items IS NOT NULL AND items != '' "
+        "AND NOT EXISTS (SELECT 1 FROM sale_lines WHERE sale_lines.sale_id = sales.id)"
+    ).fetchall()
+    if not legacy_sales:
+        return
+
+    products = {name: (product_id, price) for product_id, name, price
+                in cursor.execute("SELECT id, name, price FROM inventory").fetchall()}
+    lines = []
+    for sale_id, items_str, payment_method in legacy_sales:
+        # Legacy refund rows stored positive quantities; lines store them negated.
+        sign = -1 if payment_method == "refund" else 1
+        for name, quantity, unit_price in parse_legacy_items(items_str):
+            product_id, current_price = products.get(name, (None, 0.0))
+            if unit_price is None:
+                # Very old rows have no sold price; fall back to the current price.
+                unit_price = current_price
+            lines.append((sale_id, product_id, name, sign * quantity, unit_price))
+    cursor.executemany(
+        "INSERT INTO sale_lines (sale_id, product_id, product_name, quantity, unit_price) "
+        "VALUES (?, ?, ?, ?, ?)",
+        lines
+    )
+    print(f"Migrated {len(legacy_sales)} legacy sales to sale_lines.")
+
+
+def _add_lookup_indexes(cursor):
+    """Index the columns looked up on every transaction."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sales_date ON sales (date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_customers_name ON customers (name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_inventory_aisle_name ON inventory (aisle_name)")
+
+
+def _add_unique_indexes(cursor):
+    """
+    Enforce the uniqueness the code already assumes: one product per name, one
+    aisle per name and one sale per reference number. If existing data has
+    duplicates, a plain index is created instead and the duplicates reported,
+    so startup never fails on legacy data.
+    """
+    unique_columns = [
+        ("inventory", "name"),
+        ("aisles", "name"),
+        ("sales", "reference_number"),
+    ]
+    for table, column in unique_columns:
+        index_name = f"idx_{table}_{column}"
+        duplicates = cursor.execute(
+            f"SELECT {column}, COUNT(*) FROM {table} WHERE {column} IS NOT NULL "
+            f"GROUP BY {column} HAVING COUNT(*) > 1"
+        ).fetchall()
+        if duplicates:
+            print(f" Warning: duplicate {table}.{column} values {[row[0] for row in duplicates]}; "
+                  f"creating a non-unique index. Remove the duplicates and recreate {index_name} as UNIQUE.")
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({column})")
+        else:
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table} ({column})")
+
+
+def _add_id_sequences(cursor):
+    """Sequence table backing utils.IdAllocator, one row per table and ID prefix."""
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS id_sequences ("
+        "name TEXT PRIMARY KEY, "
+        "next_value INTEGER NOT NULL)"
+    )
+
+
+def _add_catalog_version(cursor):
+    """
+    Single-row change counter for the product catalog (see catalog.ProductCatalog),
+    bumped by triggers whenever a product is added, removed or edited. Stock
+    movements alone do not bump it.
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS catalog_version ("
+        "id INTEGER PRIMARY KEY CHECK (id = 1), "
+        "version INTEGER NOT NULL)"
+    )
+    cursor.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)")
+    bump = "BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END"
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_inventory_insert_catalog AFTER INSERT ON inventory {bump}")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_inventory_delete_catalog AFTER DELETE ON inventory {bump}")
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_inventory_update_catalog "
+        f"AFTER UPDATE OF id, name, category, price, aisle_name ON inventory {bump}"
+    )
+
+
+def _add_sales_rollups(cursor):
+    """
+    Per-day summary tables for SalesReportGenerator, kept current by triggers
+    in the same transaction as each sale or refund and backfilled from
+    existing history. Sales and sale_lines are insert-only (refunds are
+    negative rows), so only INSERT triggers are needed, and rows moved out by
+    archiving stay counted.
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS daily_sales_summary ("
+        "day TEXT PRIMARY KEY, "
+        "transactions INTEGER NOT NULL, "
+        "quantity INTEGER NOT NULL, "
+        "total REAL NOT NULL)"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS product_daily_sales ("
+        "day TEXT NOT NULL, "
+        "product_name TEXT NOT NULL, "
+        "quantity INTEGER NOT NULL, "
+        "revenue REAL NOT NULL, "
+        "PRIMARY KEY (day, product_name))"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS employee_daily_sales ("
+        "day TEXT NOT NULL, "
+        "employee_id INTEGER NOT NULL, "
+        "sales_count INTEGER NOT NULL, "
+        "total REAL NOT NULL, "
+        "PRIMARY KEY (day, employee_id))"
+    )
+
+    cursor.execute(
+        "INSERT INTO daily_sales_summary (day, transactions, quantity, total) "
+        "SELECT date(date), COUNT(*), COALESCE(SUM(quantity), 0), COALESCE(SUM(total), 0) "
+        "FROM sales GROUP BY date(date)"
+    )
+    cursor.execute(
+        "INSERT INTO product_daily_sales (day, product_name, quantity, revenue) "
+        "SELECT date(sales.date), sale_lines.product_name, SUM(sale_lines.quantity), "
+        "SUM(sale_lines.quantity * sale_lines.unit_price) "
+        "FROM sale_lines JOIN sales ON sales.id = sale_lines.sale_id "
+        "GROUP BY date(sales.date), sale_lines.product_name"
+    )
+    cursor.execute(
+        "INSERT INTO employee_daily_sales (day, employee_id, sales_count, total) "
+        "SELECT date(date), employee_id, COUNT(*), COALESCE(SUM(total), 0) "
+        "FROM sales WHERE employee_id IS NOT NULL GROUP BY date(date), employee_id"
+    )
+
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_sales_insert_rollup AFTER INSERT ON sales BEGIN "
+        "INSERT INTO daily_sales_summary (day, transactions, quantity, total) "
+        "VALUES (date(NEW.date), 1, COALESCE(NEW.quantity, 0), NEW.total) "
+        "ON CONFLICT (day) DO UPDATE SET transactions = transactions + 1, "
+        "quantity = quantity + excluded.quantity, total = total + excluded.total; "
+        "END"
+    )
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_sales_insert_employee_rollup AFTER INSERT ON sales "
+        "WHEN NEW.employee_id IS NOT NULL BEGIN "
+        "INSERT INTO employee_daily_sales (day, employee_id, sales_count, total) "
+        "VALUES (date(NEW.date), NEW.employee_id, 1, NEW.total) "
+        "ON CONFLICT (day, employee_id) DO UPDATE SET sales_count = sales_count + 1, "
+        "total = total + excluded.total; "
+        "END"
+    )
+    cursor.execute(
+        "CREATE TRIGGER IF NOT EXISTS trg_sale_lines_insert_rollup AFTER INSERT ON sale_lines BEGIN "
+        "INSERT INTO product_daily_sales (day, product_name, quantity, revenue) "
+        "SELECT date(date), NEW.product_name, NEW.quantity, NEW.quantity * NEW.unit_price "
+        "FROM sales WHERE id = NEW.sale_id "
+        "ON CONFLICT (day, product_name) DO UPDATE SET quantity = quantity + excluded.quantity, "
+        "revenue = revenue + excluded.revenue; "
+        "END"
+    )
+
+
+def _add_import_tracking(cursor):
+    """
+    Content hashes for delta catalog imports (see xlsreader.XLSDatabaseLoader):
+    the last imported hash of each source file (by file name), and of each
+    imported row, keyed by table and the row's natural key, with the file
+    that last supplied it.
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS import_files ("
+        "source TEXT PRIMARY KEY, "
+        "file_hash TEXT NOT NULL, "
+        "rows INTEGER NOT NULL, "
+        "imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS import_row_hashes ("
+        "table_name TEXT NOT NULL, "
+        "row_key TEXT NOT NULL, "
+        "hash TEXT NOT NULL, "
+        "source TEXT NOT NULL, "
+        "PRIMARY KEY (table_name, row_key))"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_import_row_hashes_source ON import_row_hashes (source, table_name)")
+
+
+# Refund note appended to sales.remarks: "Refunded: {'apple': 2} (Refund Ref: AB12CD34)"
+REFUND_REMARK = re.compile(r"Refunded: (\{.*?\}) \(Refund Ref: (\w+)\)")
+
+
+def _add_refund_ledger(cursor):
+    """
+    Ledger of refunded quantities per original sale line, so the refundable
+    quantity of a sale is one aggregate query instead of parsing remarks.
+    Refunds recorded before the ledger are backfilled from the sales.remarks
+    notes, allocated to the sale's lines for each product in line order.
+    """
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS refund_lines ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "sale_line_id INTEGER NOT NULL, "
+        "refund_sale_id INTEGER, "
+        "quantity INTEGER NOT NULL CHECK (quantity > 0), "
+        "unit_price REAL NOT NULL, "
+        "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, "
+        "FOREIGN KEY (sale_line_id) REFERENCES sale_lines(id), "
+        "FOREIGN KEY (refund_sale_id) REFERENCES sales(id))"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_refund_lines_sale_line_id ON refund_lines (sale_line_id)")
+
+    refunded_sales = cursor.execute(
+        "SELECT id, remarks FROM sales WHERE remarks LIKE '%Refunded: {%' "
+        "AND NOT EXISTS (SELECT 1 FROM refund_lines JOIN sale_lines ON sale_lines.id = refund_lines.sale_line_id "
+        "WHERE sale_lines.sale_id = sales.id)"
+    ).fetchall()
+    entries = []
+    for sale_id, remarks in refunded_sales:
+        lines = [list(line) for line in cursor.execute(
+            "SELECT id, product_name, quantity, unit_price FROM sale_lines "
+            "WHERE sale_id = ? AND quantity > 0 ORDER BY id", (sale_id,)
+        ).fetchall()]
+        for items_repr, refund_ref in REFUND_REMARK.findall(remarks):
+            try:
+                items = ast.literal_eval(items_repr)
+            except (ValueError, SyntaxError):
+                continue
+            refund_sale = cursor.execute("SELECT id FROM sales WHERE reference_number = ?", (refund_ref,)).fetchone()
+            for name, quantity in items.items():
+                for line in lines:
+                    if line[1] != name or line[2] <= 0 or quantity <= 0:
+                        continue
+                    take = min(quantity, line[2])
+                    line[2] -= take
+                    quantity -= take
+                    entries.append((line[0], refund_sale[0] if refund_sale else None, take, line[3]))
+    cursor.executemany(
+        "INSERT INTO refund_lines (sale_line_id, refund_sale_id, quantity, unit_price) VALUES (?, ?, ?, ?)",
+        entries
+    )
+    if refunded_sales:
+        print(f"Migrated refunds of {len(refunded_sales)} sales to refund_lines.")
+
+
+# Ordered upgrade steps: (version, description, function taking a cursor).
+# Never edit or reorder an applied step; append a new one instead.
+MIGRATIONS = [
+    (1, "Backfill sale_lines from legacy items strings", _backfill_sale_lines),
+    (2, "Indexes for sales.date, customers.name and inventory.aisle_name", _add_lookup_indexes),
+    (3, "Unique indexes for inventory.name, aisles.name and sales.reference_number", _add_unique_indexes),
+    (4, "id_sequences table for block-allocated IDs", _add_id_sequences),
+    (5, "catalog_version counter and inventory triggers", _add_catalog_version),
+    (6, "Daily sales, product and employee rollup tables with triggers", _add_sales_rollups),
+    (7, "import_files and import_row_hashes for delta catalog imports", _add_import_tracking),
+    (8, "refund_lines ledger backfilled from refund remarks", _add_refund_ledger),
+]
+
+# Queries run on every transaction, with sample parameters, for `python migrations.py explain`.
+HOT_QUERIES = [
+    ("Checkout.price_carts (stock check)", "SELECT id, quantity FROM inventory WHERE id IN (?, ?)", ("P100", "P101")),
+    ("ProductCatalog.get_by_name (reload)", "SELECT id, name, category, price, quantity, aisle_name FROM inventory", ()),
+    ("Checkout.process_payment (stock update)", "UPDATE inventory SET quantity = quantity - ? WHERE id = ?", (1, "P100")),
+    ("Checkout.refund (sale lookup)",
+     "SELECT id, employee_id, customer_id, quantity, total, date, remarks, payment_method "
+     "FROM sales WHERE reference_number = ?", ("ABCD1234",)),
+    ("Checkout.refund (refundable lines)",
+     "SELECT sale_lines.id, sale_lines.product_name, sale_lines.product_id, "
+     "sale_lines.quantity - COALESCE(SUM(refund_lines.quantity), 0), sale_lines.unit_price "
+     "FROM sale_lines LEFT JOIN refund_lines ON refund_lines.sale_line_id = sale_lines.id "
+     "WHERE sale_lines.sale_id = ? AND sale_lines.quantity > 0 "
+     "GROUP BY sale_lines.id ORDER BY sale_lines.id", (1,)),
+    ("SalesReportGenerator (today's sales)",
+     "SELECT id FROM sales WHERE date >= date('now') AND date < date('now', '+1 day')", ()),
+    ("Customer.check_customer_details", "SELECT id, membership FROM customers WHERE name = ?", ("Harry",)),
+    ("Aisle.aisle_exists", "SELECT id FROM aisles WHERE name = ?", ("Produce",)),
+]
+
+
+def parse_legacy_items(items_str):
+    """
+    Parse a legacy sales.items string ("apple:2:1.00, banana:3:0.50") into
+    (name, quantity, unit_price) tuples, skipping malformed parts. unit_price
+    is None when the part has no price.
+    """
+    parsed = []
+    for part in items_str.split(","):
+        tokens = part.strip().split(":")
+        if len(tokens) < 2 or not tokens[0].strip():
+            continue
+        try:
+            quantity = int(tokens[1].strip())
+            unit_price = float(tokens[2].strip()) if len(tokens) >= 3 else None
+        except ValueError:
+            continue
+        parsed.append((tokens[0].strip(), quantity, unit_price))
+    return parsed
+
+
+def current_version(cursor):
+    """Return the highest applied migration version (0 for a fresh database)."""
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, "
+        "description TEXT NOT NULL, "
+        "applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    return cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def apply_migrations(db):
+    """
+    Apply every pending migration in order, each in its own transaction
+    together with its schema_version row.
+
+    Args:
+        db (Database): The database to upgrade.
+
+    Returns:
+        list: The versions that were applied.
+    """
+    applied = []
+    version = current_version(db.cursor)
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        with db.transaction() as cursor:
+            # Another process may have applied this step since we last checked.
+            if current_version(cursor) >= step_version:
+                continue
+            step(cursor)
+            cursor.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                           (step_version, description))
+        applied.append(step_version)
+    return applied
+
+
+def print_status(db):
+    """Print applied and pending migrations."""
+    applied = dict(db.fetch_query("SELECT version, applied_at FROM schema_version"))
+    for step_version, description, _ in MIGRATIONS:
+        status = f"applied {applied[step_version]}" if step_version in applied else "pending"
+        print(f"{step_version:>3}  {description}  [{status}]")
+
+
+def explain_hot_queries(db):
+    """Print the EXPLAIN QUERY PLAN output for every hot query."""
+    for label, query, params in HOT_QUERIES:
+        print(f"--- {label}")
+        print(f"    {query}")
+        for detail in db.explain(query, params):
+            print(f"    -> {detail}")
+
+
+def main():
+    from database import Database
+
+    parser = argparse.ArgumentParser(description="Inspect the supermarket database schema.")
+    parser.add_argument("command", choices=["status", "explain"])
+    parser.add_argument("--db", default="supermarket.db", help="Database file (default: supermarket.db)")
+    args = parser.parse_args()
+
+    db = Database(args.db)
+    if args.command == "status":
+        print_status(db)
+    else:
+        explain_hot_queries(db)
+    db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
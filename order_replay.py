@@ -0,0 +1,242 @@
+"""
+Order Replay Module
+
+This module pushes pre-built orders through checkout without any input()
+prompts. Phone and online orders can be ingested this way, and a day's
+traffic can be replayed after an outage. Orders go through the same pricing,
+discount, tax, card-fee and stock-reservation code as Checkout.process_payment
+(Checkout.checkout_cart). They are
+committed in batches: one transaction per batch, with a savepoint per order,
+so a bad order is rejected without losing the rest of its batch.
+
+Input formats:
+- JSON Lines (.jsonl / .json): one order per line, e.g.
+  {"order_id": "W-1001", "customer_id": "H553", "employee_id": null,
+   "payment_method": "card", "items": [{"name": "Apple", "quantity": 2}]}
+- CSV (.csv): one cart line per row with the columns order_id, customer_id,
+  employee_id, membership, payment_method, product, quantity. Consecutive rows
+  with the same order_id form one order.
+
+customer_id, employee_id and membership are optional (see
+Checkout.checkout_order). Records that cannot be read (invalid JSON, a
+non-numeric CSV quantity) are reported with their line number and skipped.
+
+Usage:
+    python order_replay.py orders.jsonl --batch-size 200 --results results.jsonl
+
+Dependencies:
+- Checkout: Pricing, payment rules and sale recording.
+"""
+
+import argparse
+import csv
+import json
+import time
+
+from checkout import Checkout
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def _skip(skipped, file_path, line_number, reason):
+    """Report a record that cannot be read and add (line_number, reason) to skipped."""
+    print(f" Skipping {file_path} line {line_number}: {reason}")
+    if skipped is not None:
+        skipped.append((line_number, reason))
+
+
+def read_jsonl_orders(file_path, skipped=None):
+    """
+    Yield orders from a JSON Lines file, skipping blank lines.
+
+    Lines that are not a JSON object are reported and skipped; see read_orders.
+    """
+    with open(file_path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                order = json.loads(line)
+            except ValueError as e:
+                _skip(skipped, file_path, line_number, f"invalid JSON ({e})")
+                continue
+            if not isinstance(order, dict):
+                _skip(skipped, file_path, line_number, "not a JSON object")
+                continue
+            yield order
+
+
+def read_csv_orders(file_path, skipped=None):
+    """
+    Yield orders from a CSV file with one cart line per row.
+
+    An order with a non-numeric quantity on any of its rows is reported and
+    skipped whole, so it is never sold without that line; see read_orders.
+    """
+    with open(file_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        order = None
+        bad_order = False
+        for row in reader:
+            if order is None or row["order_id"] != order["order_id"]:
+                if order is not None and not bad_order:
+                    yield order
+                order = {
+                    "order_id": row["order_id"],
+                    "customer_id": row.get("customer_id") or None,
+                    "employee_id": row.get("employee_id") or None,
+                    "membership": row.get("membership") or None,
+                    "payment_method": row.get("payment_method") or "cash",
+                    "items": [],
+                }
+                bad_order = False
+            try:
+                quantity = int(row.get("quantity") or "")
+            except ValueError:
+                _skip(skipped, file_path, reader.line_num,
+                      f"order {row['order_id']} has quantity {row.get('quantity')!r}, not a whole number")
+                bad_order = True
+                continue
+            order["items"].append({"name": (row.get("product") or "").strip(), "quantity": quantity})
+        if order is not None and not bad_order:
+            yield order
+
+
+def read_orders(file_path, skipped=None):
+    """
+    Yield orders from a .jsonl/.json or .csv file.
+
+    Records that cannot be read are printed and skipped instead of stopping the
+    replay partway through the file.
+
+    Args:
+        skipped (list, optional): Receives (line_number, reason) for each skipped record.
+    """
+    if file_path.lower().endswith(".csv"):
+        return read_csv_orders(file_path, skipped)
+    return read_jsonl_orders(file_path, skipped)
+
+
+class OrderReplayer:
+    """
+    Non-interactive checkout for batches of orders.
+
+    Attributes:
+        checkout (Checkout): Checkout used for pricing, payment rules and recording.
+        batch_size (int): Orders committed per transaction.
+        allow_partial (bool): Sell what is in stock instead of rejecting short orders.
+    """
+
+    def __init__(self, checkout=None, batch_size=DEFAULT_BATCH_SIZE, allow_partial=False):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        self.checkout = checkout or Checkout()
+        self.db = self.checkout.db
+        self.batch_size = batch_size
+        self.allow_partial = allow_partial
+
+    def replay(self, orders, on_result=None, keep_results=True):
+        """
+        Check out every order from an iterable.
+
+        Args:
+            orders (iterable): Order dicts (see the module docstring).
+            on_result (callable, optional): Called with each per-order result dict.
+            keep_results (bool): Include every per-order result in the summary.
+
+        Returns:
+            dict: Counts of succeeded/rejected/failed orders, elapsed seconds,
+                  orders_per_second and, if keep_results, the per-order results.
+        """
+        summary = {"orders": 0, "succeeded": 0, "rejected": 0, "failed": 0, "batches": 0}
+        results = []
+        started = time.perf_counter()
+
+        batch = []
+        for order in orders:
+            batch.append(order)
+            if len(batch) >= self.batch_size:
+                self._finish_batch(batch, summary, results, on_result, keep_results)
+                batch = []
+        if batch:
+            self._finish_batch(batch, summary, results, on_result, keep_results)
+
+        elapsed = time.perf_counter() - started
+        summary["elapsed_seconds"] = elapsed
+        summary["orders_per_second"] = summary["orders"] / elapsed if elapsed > 0 else 0.0
+        if keep_results:
+            summary["results"] = results
+        return summary
+
+    def _finish_batch(self, batch, summary, results, on_result, keep_results):
+        batch_results = self.replay_batch(batch)
+        summary["batches"] += 1
+        for result in batch_results:
+            summary["orders"] += 1
+            summary[{"ok": "succeeded", "rejected": "rejected"}.get(result["status"], "failed")] += 1
+            if on_result is not None:
+                on_result(result)
+            if keep_results:
+                results.append(result)
+
+    def replay_batch(self, orders):
+        """
+        Price and record a batch of orders in one transaction.
+
+        Returns:
+            list: One result dict per order with order_id, status ("ok",
+                  "rejected" or "error"), reference_number, total and problems.
+        """
+        carts = [order.get("items") or [] for order in orders]
+        # Only valid carts are priced together; checkout_order rejects the rest.
+        valid = [i for i, cart in enumerate(carts) if not self.checkout.validate_cart(cart)]
+        quotes = [None] * len(orders)
+        for i, quote in zip(valid, self.checkout.price_carts([carts[i] for i in valid])):
+            quotes[i] = quote
+        results = []
+        try:
+            with self.db.transaction():
+                for order, quote in zip(orders, quotes):
+                    # Runs as a savepoint of the batch transaction; stock taken by
+                    # earlier orders in the batch is already decremented.
+                    results.append(self.checkout.checkout_order(order, self.allow_partial, quote))
+        except Exception as e:
+            # The batch transaction failed, so nothing in it was recorded.
+            for result in results:
+                if result["status"] == "ok":
+                    result.update(status="error", error=f"Batch failed: {e}")
+            for order in orders[len(results):]:
+                results.append({"order_id": order.get("order_id"), "status": "error", "reference_number": None,
+                                "total": None, "problems": [], "error": f"Batch failed: {e}"})
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay orders through checkout without prompts.")
+    parser.add_argument("orders", help="Orders file (.jsonl/.json or .csv)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f"Orders committed per transaction (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument("--partial", action="store_true", help="Sell what is in stock instead of rejecting short orders")
+    parser.add_argument("--results", help="Write per-order results to this JSON Lines file")
+    args = parser.parse_args()
+
+    replayer = OrderReplayer(batch_size=args.batch_size, allow_partial=args.partial)
+    skipped = []
+    if args.results:
+        with open(args.results, "w", encoding="utf-8") as out:
+            summary = replayer.replay(read_orders(args.orders, skipped),
+                                      on_result=lambda result: out.write(json.dumps(result) + "\n"),
+                                      keep_results=False)
+    else:
+        summary = replayer.replay(read_orders(args.orders, skipped), keep_results=False)
+
+    print(f" Replayed {summary['orders']} orders in {summary['batches']} batches: "
+          f"{summary['succeeded']} succeeded, {summary['rejected']} rejected, {summary['failed']} failed.")
+    if skipped:
+        print(f" Skipped {len(skipped)} unreadable records in {args.orders}.")
+    print(f" {summary['elapsed_seconds']:.2f}s elapsed, {summary['orders_per_second']:.1f} orders/sec.")
+    replayer.db.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Tracing Module
+
+This module breaks checkouts and refunds into timed spans (customer lookup,
+cart pricing, discount, tax and fees, inventory update, sale insert, receipt
+print, and time spent waiting on input()) so slow transactions can be taken
+apart in a trace viewer.
+
+A trace starts at the outermost traced() call of a transaction and is
+sampled there, once, with probability sample_rate; spans inside an unsampled
+trace, or outside any trace, cost one thread-local lookup and record nothing.
+Sampled spans go to a fixed-size ring buffer and can be exported in Chrome
+trace-event format, which Perfetto (ui.perfetto.dev) and chrome://tracing
+open directly.
+
+The sample rate and buffer size come from SUPERMARKET_TRACE_SAMPLE (default
+0, tracing off) and SUPERMARKET_TRACE_BUFFER, or Tracer.configure().
+
+Usage:
+    from tracing import span, traced
+
+    @traced("refund")
+    def refund(self): ...
+
+    with span("cart_pricing"):
+        ...
+
+    TRACER.export_chrome_trace("trace.json")
+"""
+
+import functools
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+
+DEFAULT_SAMPLE_RATE = float(os.environ.get("SUPERMARKET_TRACE_SAMPLE", "0"))
+DEFAULT_BUFFER_SIZE = int(os.environ.get("SUPERMARKET_TRACE_BUFFER", "10000"))
+TRACE_CATEGORY = "supermarket"
+
+
+class _NoSpan:
+    """Stand-in for a span that is not recorded."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _ThreadState(threading.local):
+    """Per-thread trace state; class defaults keep the unsampled lookups cheap."""
+
+    trace_id = None
+    depth = 0
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer._record(self.name, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+
+class _Trace:
+    """A span that starts (and samples) a new trace when no trace is active on the thread."""
+
+    __slots__ = ("tracer", "name", "args", "span")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.span = None
+
+    def __enter__(self):
+        local = self.tracer._local
+        depth = local.depth
+        if depth == 0:
+            rate = self.tracer.sample_rate
+            local.trace_id = next(self.tracer._trace_ids) if rate > 0 and random.random() < rate else None
+        local.depth = depth + 1
+        if local.trace_id is not None:
+            self.span = _Span(self.tracer, self.name, self.args).__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        local = self.tracer._local
+        try:
+            if self.span is not None:
+                self.span.__exit__(exc_type, exc_value, traceback)
+        finally:
+            local.depth -= 1
+            if local.depth == 0:
+                local.trace_id = None
+        return False
+
+
+class Tracer:
+    """
+    Sampled span recorder with a ring buffer.
+
+    Attributes:
+        sample_rate (float): Share of traces recorded, from 0 (off) to 1 (all).
+        capacity (int): Most recent spans kept.
+    """
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, capacity=DEFAULT_BUFFER_SIZE):
+        self.sample_rate = sample_rate
+        self.capacity = capacity
+        self._spans = deque(maxlen=capacity)
+        self._local = _ThreadState()
+        self._trace_ids = itertools.count(1)
+        self._thread_names = {}
+        self._epoch = time.perf_counter_ns()
+
+    def configure(self, sample_rate=None, capacity=None):
+        """Change the sample rate and/or buffer size; resizing keeps the newest spans."""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if capacity is not None and capacity != self.capacity:
+            self.capacity = capacity
+            self._spans = deque(self._spans, maxlen=capacity)
+
+    def trace(self, name, **args):
+        """Span that starts a new, sampled-or-not trace if none is active on this thread."""
+        return _Trace(self, name, args)
+
+    def span(self, name, **args):
+        """Span inside the current trace; records nothing unless that trace is sampled."""
+        if self._local.trace_id is None:
+            return _NO_SPAN
+        return _Span(self, name, args)
+
+    def wrap(self, fn):
+        """
+        Carry the calling thread's trace into fn, for work handed to another
+        thread (e.g. a GroupCommitWriter job). Returns fn unchanged if no
+        sampled trace is active.
+        """
+        trace_id = self._local.trace_id
+        if trace_id is None:
+            return fn
+
+        @functools.wraps(fn)
+        def run_in_trace(*args, **kwargs):
+            local = self._local
+            saved = local.trace_id, local.depth
+            local.trace_id, local.depth = trace_id, saved[1] + 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                local.trace_id, local.depth = saved
+        return run_in_trace
+
+    def _record(self, name, start, duration, args):
+        thread = threading.current_thread()
+        if thread.ident not in self._thread_names:
+            self._thread_names[thread.ident] = thread.name
+        self._spans.append((name, start, duration, thread.ident, self._local.trace_id, args))
+
+    def spans(self):
+        """Return the buffered spans as dicts, oldest first (durations in ms)."""
+        return [
+            {"name": name, "start_ms": (start - self._epoch) / 1e6, "duration_ms": duration / 1e6,
+             "thread": self._thread_names.get(tid, str(tid)), "trace_id": trace_id, "args": args}
+            for name, start, duration, tid, trace_id, args in list(self._spans)
+        ]
+
+    def summary(self):
+        """Return count, total_ms, avg_ms and max_ms per span name over the buffer, slowest total first."""
+        totals = {}
+        for name, _, duration, _, _, _ in list(self._spans):
+            entry = totals.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += duration / 1e6
+            entry["max_ms"] = max(entry["max_ms"], duration / 1e6)
+        for entry in totals.values():
+            entry["avg_ms"] = entry["total_ms"] / entry["count"]
+        return dict(sorted(totals.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+
+    def chrome_trace(self):
+        """Return the buffer as a Chrome trace-event document (complete "X" events plus thread names)."""
+        pid = os.getpid()
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+            for tid, thread_name in list(self._thread_names.items())
+        ]
+        for name, start, duration, tid, trace_id, args in list(self._spans):
+            events.append({
+                "name": name, "cat": TRACE_CATEGORY, "ph": "X", "pid": pid, "tid": tid,
+                "ts": (start - self._epoch) / 1000, "dur": duration / 1000,
+                "args": dict(args, trace_id=trace_id),
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path="trace.json"):
+        """Write the buffer as Chrome trace JSON; returns the path, or None on error."""
+        try:
+            with open(path, "w") as f:
+                json.dump(self.chrome_trace(), f, default=str)
+        except OSError as e:
+            print(f" Error writing trace: {e}")
+            return None
+        return path
+
+    def clear(self):
+        """Drop every buffered span."""
+        self._spans.clear()
+
+
+TRACER = Tracer()
+
+
+def trace(name, **args):
+    """TRACER.trace(): start a trace, or a span within the current one."""
+    return TRACER.trace(name, **args)
+
+
+def span(name, **args):
+    """TRACER.span(): a span within the current trace."""
+    if TRACER._local.trace_id is None:
+        return _NO_SPAN
+    return _Span(TRACER, name, args)
+
+
+def traced(name):
+    """Decorator running the function inside TRACER.trace(name)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if TRACER.sample_rate <= 0 and TRACER._local.depth == 0:
+                return fn(*args, **kwargs)
+            with TRACER.trace(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def spanned(name):
+    """Decorator running the function inside TRACER.span(name)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if TRACER._local.trace_id is None:
+                return fn(*args, **kwargs)
+            with _Span(TRACER, name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
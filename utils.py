@@ -1,38 +1,94 @@
-import random
+import sqlite3
+import threading
+from tracing import span
+
+ID_DIGITS = 6
+ID_BLOCK_SIZE = 50
+
+
+class IdAllocator:
+    """
+    Allocates readable, collision-free IDs such as "S000123".
+
+    IDs are the first letter of the name followed by a zero-padded sequence
+    number. Each (table, letter) pair has a counter in the id_sequences table;
+    a process reserves a block of block_size numbers with one short write and
+    then hands them out from memory, so no uniqueness probe is ever needed.
+    Numbers left in a block when the process exits are simply skipped.
+
+    Blocks are reserved on a dedicated connection so a rolled back caller
+    transaction can never release numbers that were already handed out.
+    """
+    _allocators = {}
+    _allocators_lock = threading.Lock()
+
+    def __init__(self, db_name, block_size=ID_BLOCK_SIZE):
+        self.db_name = db_name
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    @classmethod
+    def for_database(cls, db_name):
+        """Return the shared allocator for db_name, creating it on first use."""
+        with cls._allocators_lock:
+            allocator = cls._allocators.get(db_name)
+            if allocator is None:
+                allocator = cls(db_name)
+                cls._allocators[db_name] = allocator
+            return allocator
+
+    def _reserve_block(self, sequence):
+        """Reserve the next block for a sequence and return [next, end)."""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT OR IGNORE INTO id_sequences (name, next_value) VALUES (?, 1)", (sequence,))
+            start = conn.execute("SELECT next_value FROM id_sequences WHERE name = ?", (sequence,)).fetchone()[0]
+            conn.execute("UPDATE id_sequences SET next_value = ? WHERE name = ?", (start + self.block_size, sequence))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return [start, start + self.block_size]
+
+    def next_id(self, name, table_name):
+        """Return the next unused ID for a name in the given table."""
+        if not name:
+            raise ValueError("Name cannot be empty")
+        prefix = name[0].upper()
+        sequence = f"{table_name}:{prefix}"
+        with self._lock:
+            block = self._blocks.get(sequence)
+            if block is None or block[0] >= block[1]:
+                block = self._reserve_block(sequence)
+                self._blocks[sequence] = block
+            number = block[0]
+            block[0] += 1
+        return f"{prefix}{number:0{ID_DIGITS}d}"
+
 
 def generate_id(name, table_name, db):
     """
-    Generate a unique 4-character ID using:
+    Generate a unique ID using:
     - First letter of the name (uppercase).
-    - 3 random digits.
+    - A zero-padded sequence number (at least 6 digits).
 
-    Ensures uniqueness by checking the database.
+    Uniqueness comes from the id_sequences table (see IdAllocator), so no
+    lookup against the target table is needed.
 
     Args:
     - name (str): The name from which to generate the ID.
-    - table_name (str): The database table to check uniqueness.
-    - db (Database): The database instance to execute queries.
+    - table_name (str): The database table the ID is for.
+    - db (Database): The database instance the ID will be stored in.
 
     Returns:
-    - str: A unique 4-character ID.
+    - str: A unique ID such as "S000123".
     """
-    # Ensure the name is not empty
-    if not name:
-        raise ValueError("Name cannot be empty")
-
-    first_letter = name[0].upper()
-
-    while True:
-        # Generate a 3-digit number
-        unique_number = random.randint(100, 999)
-        generated_id = f"{first_letter}{unique_number}"
-
-        # Check if ID already exists in the given table
-        query = f"SELECT COUNT(*) FROM {table_name} WHERE id = ?"
-        result = db.fetch_query(query, (generated_id,))
-
-        if result[0][0] == 0:  # If the ID is unique, return it
-            return generated_id
+    return IdAllocator.for_database(db.db_name).next_id(name, table_name)
 
 
 def display_welcome():
@@ -69,7 +125,8 @@ def safe_input(prompt):
         The input string if it's not blank or 'exit'.
     """
     while True:
-        user_input = input(prompt).strip()
+        with span("input"):
+            user_input = input(prompt).strip()
         if not user_input:
             continue  # If input is blank, keep asking
         if user_input.lower() == "exit":
@@ -0,0 +1,178 @@
+"""
+Group Commit Writer Module
+
+With PRAGMA synchronous = FULL every commit is an fsync, so a till that
+commits each sale on its own is capped by disk latency however many lanes
+run. GroupCommitWriter is a dedicated writer thread that collects write jobs
+(checkouts, refunds, stock updates) from many producer threads. It runs them
+together in one transaction and commits once per group.
+
+Whenever the writer is free it takes every job already queued, up to
+max_batch_size, so jobs that arrive while a group is committing form the next
+group. A positive max_wait additionally holds a group open that long for more
+jobs, which only pays off when a commit costs far more than the wait. Each job runs in its own savepoint,
+so a failing job is rolled back and reported to its producer without
+affecting the rest of the group. A producer's Future resolves only after the
+group has committed, i.e. once its write is durable under the current
+durability profile.
+
+Usage:
+    writer = GroupCommitWriter()
+    future = writer.submit(lambda cursor: cursor.execute("UPDATE ..."))
+    future.result()       # blocks until the write has been committed
+    writer.close()
+
+Dependencies:
+- Database: Handles database interactions.
+- Metrics: Latency and batch-size histograms.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database import Database
+from metrics import Histogram, LATENCY_BUCKETS, SIZE_BUCKETS
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT = 0.0
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    """
+    Single writer thread committing jobs from many producers in groups.
+
+    Attributes:
+        db (Database): The database written to.
+        max_batch_size (int): Most jobs committed in one transaction.
+        max_wait (float): Longest time in seconds a group stays open for more jobs.
+    """
+
+    def __init__(self, db_name="supermarket.db", max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait=DEFAULT_MAX_WAIT):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.db = Database(db_name)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.commit_latency = Histogram(LATENCY_BUCKETS)
+        self.batch_sizes = Histogram(SIZE_BUCKETS)
+        self.commit_time = Histogram(LATENCY_BUCKETS)
+        self._groups = 0
+        self._failed_groups = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+        self._thread.start()
+        # The writer holds its pooled connection for life; take it before producers can fill the pool.
+        self._ready.wait()
+
+    def submit(self, job):
+        """
+        Queue a write job.
+
+        Args:
+            job (callable): Called in the writer thread as job(cursor) inside the
+                group transaction. It may use Database.transaction() and
+                Database.execute_query(), which join the group.
+
+        Returns:
+            Future: Resolves to the job's return value after the group commits, or
+                    raises the job's exception (or the commit error).
+        """
+        if self._closed:
+            raise RuntimeError("GroupCommitWriter is closed")
+        future = Future()
+        self._queue.put((job, future, time.perf_counter()))
+        return future
+
+    def execute(self, query, params=()):
+        """Queue a single statement; returns a Future resolving to its rowcount."""
+        return self.submit(lambda cursor: cursor.execute(query, params).rowcount)
+
+    def _collect(self, first):
+        """Gather a group starting with the first job, bounded by size and wait time."""
+        group = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(group) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            group.append(item)
+        return group
+
+    def _run(self):
+        try:
+            self.db.conn
+        finally:
+            self._ready.set()
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            self._commit_group(self._collect(first))
+        # Anything submitted while closing is refused rather than left hanging.
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                item[1].set_exception(RuntimeError("GroupCommitWriter is closed"))
+        self.db.manager.release()
+
+    def _commit_group(self, group):
+        outcomes = []
+        commit_started = time.perf_counter()
+        try:
+            with self.db.transaction() as cursor:
+                for job, future, _ in group:
+                    try:
+                        with self.db.transaction():
+                            outcomes.append((True, job(cursor)))
+                    except Exception as e:
+                        outcomes.append((False, e))
+        except Exception as e:
+            self._failed_groups += 1
+            for _, future, _ in group:
+                future.set_exception(e)
+            return
+        finished = time.perf_counter()
+        self.commit_time.observe(finished - commit_started)
+        self.batch_sizes.observe(len(group))
+        self._groups += 1
+        for (_, future, submitted), (ok, value) in zip(group, outcomes):
+            self.commit_latency.observe(finished - submitted)
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stats(self):
+        """Return group counts plus latency (submit to durable) and batch-size histograms."""
+        return {
+            "groups": self._groups,
+            "failed_groups": self._failed_groups,
+            "queued": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait": self.max_wait,
+            "commit_latency": self.commit_latency.snapshot(),
+            "group_commit_time": self.commit_time.snapshot(),
+            "batch_size": self.batch_sizes.snapshot(),
+        }
+
+    def close(self):
+        """Commit everything already queued, then stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
@@ -1,37 +1,642 @@
-import sqlite3
-import pandas as pd
+"""
+XLSX Data Loader Module
+
+This module imports supplier and store data from Excel workbooks. Each sheet
+is loaded into the table with the same name (lower-cased); the first row of a
+sheet holds the column names.
+
+Rows are streamed with openpyxl in read-only mode and written with
+executemany in batches, so workbooks with hundreds of thousands of rows are
+never held in memory at once. Each file is loaded in a single transaction: if
+any sheet fails, nothing from that file is committed.
+
+Rows are upserted on the table's natural key (its primary key, e.g. the
+product id, or failing that a unique column such as the aisle name or sale
+reference number), so loading the same file twice updates rows instead of
+duplicating them. Tables without a usable key are appended to.
+
+load_files takes directories and glob patterns as well as files and parses
+their sheets in a process pool, with this process as the single writer.
+
+With sync=True imports are deltas: a file whose content hash matches its last
+import is skipped outright, and otherwise only rows whose content hash (per
+natural key) changed are written. Rows missing from the file can optionally
+be deleted. Each file reports added/changed/unchanged/removed counts.
+
+Dependencies:
+- Database: Handles database interactions.
+- ProductCatalog: Invalidated after products are loaded.
+"""
+
+import glob
+import hashlib
+import multiprocessing
+import os
+import queue
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from xml.etree import ElementTree
+
+from openpyxl import load_workbook
+
+from catalog import ProductCatalog
+from database import Database
+from metrics import JOB_BUCKETS, REGISTRY
+
+# Rows per executemany() call.
+LOAD_BATCH_SIZE = 1000
+# Parser processes used by load_files by default.
+DEFAULT_INGEST_WORKERS = os.cpu_count() or 1
+# Parsed batches allowed in flight between the parser processes and the writer.
+INGEST_QUEUE_SIZE = 64
+
+SPREADSHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+# Bytes read at a time when hashing a workbook.
+HASH_CHUNK_SIZE = 1 << 20
+
+IMPORTED_FILES = REGISTRY.counter("supermarket_import_files_total", "Workbooks imported.")
+SKIPPED_FILES = REGISTRY.counter("supermarket_import_files_skipped_total", "Workbooks skipped as unchanged.")
+FAILED_FILES = REGISTRY.counter("supermarket_import_files_failed_total", "Workbooks rolled back on an error.")
+IMPORTED_ROWS = REGISTRY.counter("supermarket_import_rows_total", "Rows written by workbook imports.")
+IMPORT_SECONDS = REGISTRY.histogram("supermarket_import_seconds", "Time to import one workbook.", JOB_BUCKETS)
+IMPORT_RATE = REGISTRY.gauge("supermarket_import_rows_per_second", "Rows per second of the last imported workbook.")
+
+
+def _cell_value(value):
+    """Convert an openpyxl cell value to something SQLite stores as the old loader did."""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def file_hash(file_path):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def row_hash(values):
+    """Return a short content hash of a row's loaded values."""
+    return hashlib.blake2b(repr(values).encode(), digest_size=16).hexdigest()
+
+
+def read_sheet_batches(file_path, batch_size=LOAD_BATCH_SIZE, sheet_names=None):
+    """
+    Stream the sheets of a workbook without loading it into memory.
+
+    Args:
+        file_path (str): Path of the .xlsx file.
+        batch_size (int): Rows per yielded batch.
+        sheet_names (iterable, optional): Only read these sheets.
+
+    Yields:
+        tuple: (sheet_name, header, rows) where header is a list of column names
+               and rows a list of up to batch_size tuples. A sheet with no data
+               rows yields once with an empty rows list. Blank rows are skipped.
+    """
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            if sheet_names is not None and sheet.title not in sheet_names:
+                continue
+            rows_iter = sheet.iter_rows(values_only=True)
+            header_row = next(rows_iter, None)
+            if header_row is None:
+                yield sheet.title, [], []
+                continue
+            # Columns without a name are carried as "" and ignored by the loader.
+            header = [str(name).strip() if name is not None else "" for name in header_row]
+            while header and not header[-1]:
+                header.pop()
+            width = len(header)
+            batch = []
+            yielded = False
+            for row in rows_iter:
+                values = tuple(_cell_value(value) for value in row[:width])
+                if all(value is None for value in values):
+                    continue
+                batch.append(values + (None,) * (width - len(values)))
+                if len(batch) >= batch_size:
+                    yield sheet.title, header, batch
+                    yielded = True
+                    batch = []
+            if batch or not yielded:
+                yield sheet.title, header, batch
+    finally:
+        workbook.close()
+
+
+def expand_sources(sources):
+    """
+    Turn files, directories and glob patterns into a sorted, de-duplicated list
+    of .xlsx paths. Directories contribute their *.xlsx files; Excel lock files
+    (~$name.xlsx) are ignored.
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = sorted(glob.glob(os.path.join(source, "*.xlsx")))
+        elif glob.has_magic(source):
+            matches = sorted(glob.glob(source))
+        else:
+            matches = [source]
+        for path in matches:
+            if not os.path.basename(path).startswith("~$") and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def list_sheet_names(file_path):
+    """Return a workbook's sheet names, read from xl/workbook.xml without parsing any sheet."""
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            root = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        return [sheet.get("name") for sheet in root.iter(f"{SPREADSHEET_NS}sheet")]
+    except (KeyError, ElementTree.ParseError):
+        workbook = load_workbook(file_path, read_only=True)
+        names = workbook.sheetnames
+        workbook.close()
+        return names
+
+
+_ingest_queue = None
+
+
+def _init_ingest_worker(batches):
+    global _ingest_queue
+    _ingest_queue = batches
+
+
+def _parse_task(index, file_path, sheet_names, batch_size):
+    """Parser process task: stream some sheets' batches to the writer, then report done or error."""
+    label = ", ".join(sheet_names)
+    try:
+        for sheet_name, header, rows in read_sheet_batches(file_path, batch_size, sheet_names):
+            _ingest_queue.put(("rows", index, sheet_name, header, rows))
+        _ingest_queue.put(("done", index, label, None, None))
+    except Exception as e:
+        _ingest_queue.put(("error", index, label, None, str(e)))
+
 
 class XLSDatabaseLoader:
-    def __init__(self, db_name="supermarket.db"):
-        self.conn = sqlite3.connect(db_name)
-        self.cursor = self.conn.cursor()
+    """
+    Streaming, transactional workbook loader.
+
+    Attributes:
+        db (Database): Instance of the Database class to interact with the database.
+        batch_size (int): Rows per executemany() call.
+    """
 
-    @staticmethod
-    def read_xls(file_path):
-        """Read an XLS file with multiple sheets and return a dictionary of DataFrames."""
-        return pd.read_excel(file_path, sheet_name=None)  # Read all sheets
+    def __init__(self, db_name="supermarket.db", batch_size=LOAD_BATCH_SIZE):
+        self.db = Database(db_name)
+        self.batch_size = batch_size
+        self._plans = {}
 
-    def insert_data(self, table_name, df):
-        """Insert data from DataFrame into the specified database table."""
-        if df.empty:
-            print(f" Skipping empty sheet: {table_name}")
-            return
+    def _table_columns(self, cursor, table_name):
+        """Return (columns, primary key columns) of a table, or ([], []) if it does not exist."""
+        info = cursor.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+        columns = [row[1] for row in info]
+        primary_key = [row[1] for row in sorted(info, key=lambda row: row[5]) if row[5] > 0]
+        return columns, primary_key
 
+    def _unique_keys(self, cursor, table_name):
+        """Return the column lists of the table's unique indexes."""
+        keys = []
+        for _, index_name, unique, _, _ in cursor.execute(f'PRAGMA index_list("{table_name}")').fetchall():
+            if unique:
+                keys.append([row[2] for row in cursor.execute(f'PRAGMA index_info("{index_name}")').fetchall()])
+        return keys
+
+    def _sheet_plan(self, cursor, table_name, header):
+        """
+        Work out how a sheet maps onto its table.
+
+        Returns:
+            dict: columns (table columns present in the sheet), positions (their
+                  indexes in the header), key (conflict target, empty to append)
+                  and conflict (the ON CONFLICT clause); None if the table does
+                  not exist or no column matches.
+        """
+        cache_key = (table_name, tuple(header))
+        if cache_key in self._plans:
+            return self._plans[cache_key]
+
+        columns, primary_key = self._table_columns(cursor, table_name)
+        positions = [i for i, name in enumerate(header) if name in columns]
+        unknown = [name for name in header if name and name not in columns]
+        if columns and unknown:
+            print(f" Warning: ignoring columns {unknown} not in table {table_name}.")
+        if not columns or not positions:
+            self._plans[cache_key] = None
+            return None
+
+        sheet_columns = [header[i] for i in positions]
+        key = []
+        for candidate in [primary_key] + self._unique_keys(cursor, table_name):
+            if candidate and all(name in sheet_columns for name in candidate):
+                key = candidate
+                break
+
+        conflict = ""
+        if key:
+            updates = [name for name in sheet_columns if name not in key]
+            target = ", ".join(f'"{name}"' for name in key)
+            if updates:
+                assignments = ", ".join(f'"{name}" = excluded."{name}"' for name in updates)
+                conflict = f" ON CONFLICT ({target}) DO UPDATE SET {assignments}"
+            else:
+                conflict = f" ON CONFLICT ({target}) DO NOTHING"
+        plan = {"columns": sheet_columns, "positions": positions, "key": key, "conflict": conflict}
+        self._plans[cache_key] = plan
+        return plan
+
+    def upsert_statement(self, cursor, table_name, header):
+        """
+        Build the INSERT statement for a sheet.
+
+        Returns:
+            tuple: (sql, column positions to take from each row, key columns).
+                   key columns is empty when rows are appended. sql is None if
+                   the table does not exist or no column matches.
+        """
+        plan = self._sheet_plan(cursor, table_name, header)
+        if plan is None:
+            return None, [], []
+        column_list = ", ".join(f'"{name}"' for name in plan["columns"])
+        sql = (f'INSERT INTO "{table_name}" ({column_list}) '
+               f'VALUES ({", ".join("?" * len(plan["columns"]))}){plan["conflict"]}')
+        return sql, plan["positions"], plan["key"]
+
+    def insert_rows(self, cursor, table_name, header, rows):
+        """
+        Upsert one batch of sheet rows into a table.
+
+        Returns:
+            int: Rows written (0 if the table does not exist).
+        """
+        sql, positions, _ = self.upsert_statement(cursor, table_name, header)
+        if sql is None or not rows:
+            return 0
+        if len(positions) != len(header):
+            rows = [tuple(row[i] for i in positions) for row in rows]
+        cursor.executemany(sql, rows)
+        return len(rows)
+
+    def load_xls_to_db(self, file_path, sync=False, delete_missing=False, force=False):
+        """
+        Load every sheet of a workbook into its table in one transaction.
+
+        Args:
+            file_path (str): Path of the .xlsx file.
+            sync (bool): Delta import: skip the file if it is unchanged since its
+                last import, else write only new and changed keyed rows.
+            delete_missing (bool): With sync, delete rows this file supplied
+                last time that are no longer in it.
+            force (bool): With sync, import the file even if it is unchanged.
+
+        Returns:
+            dict: rows loaded per table, total rows, elapsed seconds and
+                  rows_per_second, plus skipped and diff (per table added,
+                  changed, unchanged and removed counts) with sync; None if the
+                  file failed and was rolled back.
+        """
+        if sync:
+            return self._sync_file(file_path, delete_missing, force)
+        started = time.perf_counter()
+        loaded = {}
+        skipped = set()
         try:
-            df.to_sql(table_name.lower(), self.conn, if_exists="append", index=False)
-            print(f" Data inserted into table: {table_name}")
+            with self.db.transaction() as cursor:
+                for sheet_name, header, rows in read_sheet_batches(file_path, self.batch_size):
+                    table_name = sheet_name.lower()
+                    if table_name not in loaded and table_name not in skipped:
+                        print(f" Processing sheet: {sheet_name}")
+                        if self.upsert_statement(cursor, table_name, header)[0] is None:
+                            print(f" Skipping sheet {sheet_name}: no table {table_name} with matching columns.")
+                            skipped.add(table_name)
+                        elif not rows:
+                            print(f" Skipping empty sheet: {sheet_name}")
+                            skipped.add(table_name)
+                        else:
+                            loaded[table_name] = 0
+                    if table_name in loaded:
+                        loaded[table_name] += self.insert_rows(cursor, table_name, header, rows)
         except Exception as e:
-            print(f" Error inserting data into {table_name}: {e}")
+            return self._file_failed(file_path, e)
+
+        return self._file_loaded(file_path, loaded, time.perf_counter() - started)
+
+    def _sync_file(self, file_path, delete_missing, force):
+        """Delta-import one file: stage it locally, then apply it like a parallel load."""
+        try:
+            digest = file_hash(file_path)
+        except OSError as e:
+            return self._file_failed(file_path, e)
+        if not force and self._imported_hash(file_path) == digest:
+            return self._file_skipped(file_path)
+        conn = self.db.conn
+        stages = {}
+        sheet_names = []
+        try:
+            try:
+                for sheet_name, header, rows in read_sheet_batches(file_path, self.batch_size):
+                    if sheet_name not in stages:
+                        sheet_names.append(sheet_name)
+                    self._stage_rows(conn, 0, stages, sheet_name, header, rows, sync=True)
+                error = None
+            except Exception as e:
+                error = str(e)
+            return self._apply_staged(file_path, sheet_names, stages, error, digest, delete_missing)
+        finally:
+            for stage in stages.values():
+                conn.execute(f"DROP TABLE IF EXISTS temp.{stage['table']}")
+
+    def _imported_hash(self, file_path):
+        """Content hash recorded at the file's last delta import, or None."""
+        rows = self.db.fetch_query(
+            "SELECT file_hash FROM import_files WHERE source = ?", (os.path.basename(file_path),))
+        return rows[0][0] if rows else None
+
+    def _file_failed(self, file_path, error):
+        FAILED_FILES.inc()
+        print(f" Error loading {file_path}: {error}. No data from this file was saved.")
+        return None
+
+    def _file_skipped(self, file_path):
+        SKIPPED_FILES.inc()
+        print(f" Skipping {file_path}: unchanged since its last import.")
+        return {"tables": {}, "rows": 0, "elapsed_seconds": 0.0, "rows_per_second": 0.0,
+                "skipped": True, "diff": {}}
+
+    def _file_loaded(self, file_path, loaded, elapsed, diff=None):
+        """Invalidate caches, print and return the summary for a committed file."""
+        if "inventory" in loaded:
+            ProductCatalog.for_database(self.db).invalidate()
+        total = sum(loaded.values())
+        for table_name, count in loaded.items():
+            print(f" Data upserted into table {table_name}: {count} rows.")
+        for table_name, counts in (diff or {}).items():
+            print(f" {table_name}: {counts['added']} added, {counts['changed']} changed, "
+                  f"{counts['unchanged']} unchanged, {counts['removed']} removed.")
+        rows_per_second = total / elapsed if elapsed > 0 else 0.0
+        IMPORTED_FILES.inc()
+        IMPORTED_ROWS.inc(total)
+        IMPORT_SECONDS.observe(elapsed)
+        IMPORT_RATE.set(rows_per_second)
+        print(f" Loaded {total} rows from {file_path} in {elapsed:.2f}s ({rows_per_second:.0f} rows/sec).")
+        result = {"tables": loaded, "rows": total, "elapsed_seconds": elapsed, "rows_per_second": rows_per_second}
+        if diff is not None:
+            result.update(skipped=False, diff=diff)
+        return result
+
+    def load_files(self, sources, workers=None, sync=False, delete_missing=False, force=False):
+        """
+        Load several workbooks, given as files, directories or glob patterns.
+
+        With more than one worker, sheets are parsed in a process pool and their
+        row batches funnelled to this process, the single writer. Batches are
+        staged in TEMP tables as they arrive, then each file is applied in one
+        transaction, in input order, once all of its sheets are parsed. Files
+        are still all-or-nothing and later files win conflicting upserts.
+
+        Args:
+            sources (str or list): .xlsx files, directories or glob patterns.
+            workers (int, optional): Parser processes (default: CPU count);
+                1 loads the files one by one with load_xls_to_db.
+            sync, delete_missing, force: Delta import, as for load_xls_to_db.
+                Unchanged files are skipped before any parsing.
+
+        Returns:
+            dict: files (file path -> load_xls_to_db-style result, None if it
+                  failed), rows, elapsed_seconds and rows_per_second; None if no
+                  file matched.
+        """
+        paths = expand_sources(sources)
+        if not paths:
+            print(f" No .xlsx files found for {sources}.")
+            return None
+        workers = workers or DEFAULT_INGEST_WORKERS
+
+        started = time.perf_counter()
+        if workers <= 1:
+            results = {path: self.load_xls_to_db(path, sync, delete_missing, force) for path in paths}
+        else:
+            results = self._load_parallel(paths, workers, sync, delete_missing, force)
+        elapsed = time.perf_counter() - started
+        total = sum(result["rows"] for result in results.values() if result)
+        rows_per_second = total / elapsed if elapsed > 0 else 0.0
+        failed = sum(1 for result in results.values() if result is None)
+        unchanged = sum(1 for result in results.values() if result and result.get("skipped"))
+        print(f" Loaded {len(paths) - failed} of {len(paths)} files"
+              + (f" ({unchanged} unchanged)" if unchanged else "")
+              + f", {total} rows in {elapsed:.2f}s ({rows_per_second:.0f} rows/sec, {workers} workers).")
+        return {"files": results, "rows": total, "elapsed_seconds": elapsed, "rows_per_second": rows_per_second}
+
+    def _load_parallel(self, paths, workers, sync=False, delete_missing=False, force=False):
+        sheets, errors, digests, unchanged = {}, {}, {}, set()
+        for index, path in enumerate(paths):
+            try:
+                if sync:
+                    digests[index] = file_hash(path)
+                    if not force and self._imported_hash(path) == digests[index]:
+                        unchanged.add(index)
+                        sheets[index] = []
+                        continue
+                sheets[index] = list_sheet_names(path)
+            except Exception as e:
+                sheets[index] = []
+                errors[index] = str(e)
+        # One task per file when there are enough files to keep every worker busy,
+        # else one per sheet (each task re-opens its workbook).
+        if len(paths) >= workers:
+            groups = {index: [names] if names else [] for index, names in sheets.items()}
+        else:
+            groups = {index: [[name] for name in names] for index, names in sheets.items()}
+        remaining = {index: len(group) for index, group in groups.items()}
+        staged = {index: {} for index in sheets}
+        results = {}
+        context = multiprocessing.get_context()
+        batches = context.Queue(maxsize=INGEST_QUEUE_SIZE)
+        conn = self.db.conn
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_ingest_worker, initargs=(batches,)) as pool:
+                tasks = {
+                    pool.submit(_parse_task, index, paths[index], names, self.batch_size): (index, ", ".join(names))
+                    for index, group in groups.items() for names in group
+                }
+                accounted = set()
+                next_file = 0
+                while next_file < len(paths):
+                    if next_file in unchanged:
+                        results[paths[next_file]] = self._file_skipped(paths[next_file])
+                        next_file += 1
+                        continue
+                    if remaining[next_file] == 0:
+                        results[paths[next_file]] = self._apply_staged(
+                            paths[next_file], sheets[next_file], staged[next_file], errors.get(next_file),
+                            digests.get(next_file), delete_missing)
+                        next_file += 1
+                        continue
+                    try:
+                        kind, index, sheet_name, header, payload = batches.get(timeout=1.0)
+                    except queue.Empty:
+                        # A task that died without reporting (e.g. a killed worker) never sends "done".
+                        for task, (index, sheet_name) in tasks.items():
+                            if task.done() and task.exception() is not None and task not in accounted:
+                                accounted.add(task)
+                                errors.setdefault(index, f"{sheet_name}: {task.exception()}")
+                                remaining[index] -= 1
+                        continue
+                    if kind == "rows":
+                        if index not in errors:
+                            self._stage_rows(conn, index, staged[index], sheet_name, header, payload, sync)
+                    else:
+                        if kind == "error":
+                            errors.setdefault(index, f"{sheet_name}: {payload}")
+                        remaining[index] -= 1
+        finally:
+            for stages in staged.values():
+                for stage in stages.values():
+                    conn.execute(f"DROP TABLE IF EXISTS temp.{stage['table']}")
+        return results
+
+    def _stage_rows(self, conn, index, stages, sheet_name, header, rows, sync=False):
+        """
+        Append a parsed batch to the sheet's TEMP staging table. With sync, rows
+        of keyed tables also carry their natural key and content hash.
+        """
+        stage = stages.get(sheet_name)
+        if stage is None:
+            stage = {"table": f"xls_stage_{index}_{len(stages)}", "header": header, "rows": 0, "sync": False}
+            columns = ", ".join(f"c{i}" for i in range(len(header))) or "c0"
+            plan = self._sheet_plan(conn, sheet_name.lower(), header) if sync and header else None
+            if plan and plan["key"]:
+                stage.update(sync=True, key=[header.index(name) for name in plan["key"]], positions=plan["positions"])
+                columns += ", row_key, row_hash"
+            conn.execute(f"DROP TABLE IF EXISTS temp.{stage['table']}")
+            conn.execute(f"CREATE TEMP TABLE {stage['table']} ({columns})")
+            stages[sheet_name] = stage
+        if rows and header:
+            width = len(header)
+            if stage["sync"]:
+                key, positions = stage["key"], stage["positions"]
+                rows = [row + ("|".join(str(row[i]) for i in key), row_hash(tuple(row[i] for i in positions)))
+                        for row in rows]
+                width += 2
+            placeholders = ", ".join("?" * width)
+            conn.executemany(f"INSERT INTO temp.{stage['table']} VALUES ({placeholders})", rows)
+            stage["rows"] += len(rows)
+
+    def _apply_staged(self, file_path, sheet_names, stages, error, digest=None, delete_missing=False):
+        """
+        Upsert one file's staged sheets into their tables in a single transaction.
+        With a digest (sync), keyed sheets are applied as deltas and the file's
+        hash is recorded in the same transaction.
+        """
+        if error is not None:
+            return self._file_failed(file_path, error)
+        started = time.perf_counter()
+        loaded = {}
+        diff = {} if digest is not None else None
+        source = os.path.basename(file_path)
+        try:
+            with self.db.transaction() as cursor:
+                for sheet_name in sheet_names:
+                    stage = stages.get(sheet_name)
+                    if stage is None:
+                        continue
+                    table_name = sheet_name.lower()
+                    print(f" Processing sheet: {sheet_name}")
+                    plan = self._sheet_plan(cursor, table_name, stage["header"])
+                    if plan is None:
+                        print(f" Skipping sheet {sheet_name}: no table {table_name} with matching columns.")
+                        continue
+                    if not stage["rows"]:
+                        print(f" Skipping empty sheet: {sheet_name}")
+                        continue
+                    if digest is not None and stage["sync"]:
+                        counts = self._apply_delta(cursor, source, table_name, plan, stage, delete_missing)
+                        diff[table_name] = counts
+                        loaded[table_name] = loaded.get(table_name, 0) + counts["added"] + counts["changed"]
+                        continue
+                    column_list = ", ".join(f'"{name}"' for name in plan["columns"])
+                    select_list = ", ".join(f"c{i}" for i in plan["positions"])
+                    # "WHERE true" keeps ON CONFLICT from being parsed as part of the SELECT.
+                    cursor.execute(
+                        f'INSERT INTO "{table_name}" ({column_list}) '
+                        f'SELECT {select_list} FROM temp.{stage["table"]} WHERE true ORDER BY rowid{plan["conflict"]}'
+                    )
+                    loaded[table_name] = loaded.get(table_name, 0) + stage["rows"]
+                if digest is not None:
+                    cursor.execute(
+                        "INSERT INTO import_files (source, file_hash, rows) VALUES (?, ?, ?) "
+                        "ON CONFLICT (source) DO UPDATE SET file_hash = excluded.file_hash, rows = excluded.rows, "
+                        "imported_at = CURRENT_TIMESTAMP",
+                        (source, digest, sum(stage["rows"] for stage in stages.values()))
+                    )
+        except Exception as e:
+            return self._file_failed(file_path, e)
+        return self._file_loaded(file_path, loaded, time.perf_counter() - started, diff)
+
+    def _apply_delta(self, cursor, source, table_name, plan, stage, delete_missing):
+        """
+        Write only the staged rows whose content hash differs from the last
+        import, record their hashes, and optionally delete rows this source
+        supplied before that are no longer staged.
+
+        Returns:
+            dict: added, changed, unchanged and removed row counts.
+        """
+        stage_table = f"temp.{stage['table']}"
+        joined = (f"FROM {stage_table} AS s LEFT JOIN import_row_hashes AS h "
+                  f"ON h.table_name = ? AND h.row_key = s.row_key")
+        added, changed, unchanged = cursor.execute(
+            "SELECT COALESCE(SUM(h.hash IS NULL), 0), COALESCE(SUM(h.hash != s.row_hash), 0), "
+            f"COALESCE(SUM(h.hash = s.row_hash), 0) {joined}", (table_name,)
+        ).fetchone()
 
-    def load_xls_to_db(self, file_path):
-        """Reads an XLS file with multiple sheets and inserts them into respective tables."""
-        sheets = self.read_xls(file_path)
+        column_list = ", ".join(f'"{name}"' for name in plan["columns"])
+        select_list = ", ".join(f"s.c{i}" for i in plan["positions"])
+        cursor.execute(
+            f'INSERT INTO "{table_name}" ({column_list}) SELECT {select_list} {joined} '
+            f'WHERE h.hash IS NULL OR h.hash != s.row_hash ORDER BY s.rowid{plan["conflict"]}',
+            (table_name,)
+        )
+        cursor.execute(
+            f"INSERT INTO import_row_hashes (table_name, row_key, hash, source) "
+            f"SELECT ?, row_key, row_hash, ? FROM {stage_table} WHERE true ORDER BY rowid "
+            "ON CONFLICT (table_name, row_key) DO UPDATE SET hash = excluded.hash, source = excluded.source",
+            (table_name, source)
+        )
 
-        for table_name, df in sheets.items():
-            print(f" Processing sheet: {table_name}")
-            self.insert_data(table_name, df)
+        removed = 0
+        if delete_missing and len(plan["key"]) == 1:
+            missing = (f"SELECT row_key FROM import_row_hashes WHERE source = ? AND table_name = ? "
+                       f"AND row_key NOT IN (SELECT row_key FROM {stage_table})")
+            removed = cursor.execute(
+                f'DELETE FROM "{table_name}" WHERE CAST("{plan["key"][0]}" AS TEXT) IN ({missing})',
+                (source, table_name)
+            ).rowcount
+            cursor.execute(
+                f"DELETE FROM import_row_hashes WHERE source = ? AND table_name = ? "
+                f"AND row_key NOT IN (SELECT row_key FROM {stage_table})",
+                (source, table_name)
+            )
+        elif delete_missing:
+            print(f" Warning: not deleting missing rows from {table_name}: its key {plan['key']} is composite.")
+        return {"added": added, "changed": changed, "unchanged": unchanged, "removed": removed}
 
     def close(self):
-        """Close the database connection."""
-        self.conn.close()
-        print(" Database connection closed.")
\ No newline at end of file
+        """Release this thread's database connection."""
+        self.db.manager.release()
+        print(" Database connection closed.")